@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+    cluster
+    ~~~~~~~
+
+    Density based stay point detection.
+
+    `motif.get_stay_point` segments fixes greedily in time order, so its
+    result depends on where a segment happens to start. `st_dbscan` is
+    an alternative: a DBSCAN style clustering where two fixes are
+    neighbors if they are close both in space and in time [1]. Fixes are
+    bucketed in a uniform (latitude, longitude, time) grid with cells of
+    the neighborhood size, so the neighbors of a fix are found by
+    looking at 27 cells instead of all fixes.
+
+    The result has the same format as `motif.get_stay_point`, so it can
+    be used in `motif.compute_nodes` (see its `engine` argument).
+
+    [1]: https://doi.org/10.1016/j.datak.2006.01.013
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from location import counters, epoch, geodesic, spatial
+
+
+def _grid_cell_size(dist_th, latitudes):
+    """
+    Computes grid cell sizes in degrees.
+
+    Cells are large enough that every pair of fixes within `dist_th`
+    meters is in the same or neighboring cells, with any distance
+    backend (see `geodesic`).
+
+    Returns
+    -------
+    (lat, lon) : (float, float)
+    """
+
+    # smallest radius of curvature of the sphere and the ellipsoid,
+    # and the largest kernel error
+    radius = geodesic.MIN_RADIUS
+    dist_th = dist_th + geodesic.MAX_KERNEL_ERROR
+
+    lat_cell = math.degrees(dist_th / radius)
+
+    # meridians are closest at the largest absolute latitude
+    max_lat = min(float(np.abs(latitudes).max()) + lat_cell, 90)
+    scale = math.cos(math.radians(max_lat))
+    s = dist_th / (2 * radius * scale)
+    lon_cell = math.degrees(2 * math.asin(min(s, 1)))
+
+    return lat_cell, lon_cell
+
+
+def st_dbscan(df, lat_c='latitude', lon_c='longitude',
+              dist_th=300, time_th='30m', time_eps='10m',
+              min_samples=3, backend=None):
+    """
+    Calculates stay points with spatio-temporal density clustering.
+
+    Two fixes are neighbors if they are within `dist_th` meters and
+    `time_eps` of each other. A fix with at least `min_samples`
+    neighbors (including itself) is a core fix and clusters are the
+    connected core fixes along with their neighbors, as in DBSCAN.
+    Clusters lasting less than `time_th` are discarded.
+
+    Parameters
+    ----------
+    df: DataFrame
+        DataFrame with DateTimeIndex.
+
+    lat_c: str
+        Column name with latitude values
+
+    lon_c: str
+        Column name with longitude values
+
+    dist_th: float
+        Spatial neighborhood radius in meters. Default is 300m.
+
+    time_th: str or pd.timedelta
+        Minimum duration of a stay point (time between its first
+        and last fix). Default is 30 minutes.
+
+    time_eps: str or pd.timedelta
+        Temporal neighborhood radius. Default is 10 minutes.
+
+    min_samples: int
+        Minimum neighborhood size of a core fix. Default is 3.
+
+    backend: str
+        Distance backend (see `geodesic`). Default is None, in that
+        case the global backend is used if set, haversine otherwise.
+
+    Returns
+    -------
+    stay_points : list
+        See `motif.get_stay_point`. Stay point ids are assigned in
+        the order of the first fix of each stay point.
+
+    Notes
+    -----
+        The grid does not wrap around the antimeridian, so fixes on
+        different sides of it are never neighbors.
+    """
+
+    n = len(df)
+    if n == 0:
+        return []
+
+    times, _ = epoch.to_epoch(df.index)
+    lats = df[lat_c].values.astype(float)
+    lons = df[lon_c].values.astype(float)
+
+    time_eps = pd.to_timedelta(time_eps).value
+    time_th = pd.to_timedelta(time_th).value
+
+    lat_cell, lon_cell = _grid_cell_size(dist_th, lats)
+    cells = np.column_stack([np.floor(lats / lat_cell),
+                             np.floor(lons / lon_cell),
+                             times // max(time_eps, 1)]).astype(np.int64)
+
+    grid = {}
+    for i, c in enumerate(map(tuple, cells)):
+        grid.setdefault(c, []).append(i)
+
+    offsets = [(a, b, c) for a in (-1, 0, 1)
+               for b in (-1, 0, 1) for c in (-1, 0, 1)]
+    n_dist = 0  # number of exact distance evaluations
+    backend = geodesic.get_backend(backend, default='haversine')
+
+    def neighbors(i):
+        nonlocal n_dist
+
+        y, x, t = cells[i]
+        candidates = []
+        for a, b, c in offsets:
+            candidates.extend(grid.get((y + a, x + b, t + c), ()))
+
+        candidates = np.array(candidates, dtype=int)
+        candidates = candidates[np.abs(times[candidates] - times[i]) <=
+                                time_eps]
+
+        inside, n = geodesic.within(lats[i], lons[i], lats[candidates],
+                                    lons[candidates], dist_th,
+                                    backend=backend,
+                                    return_evaluations=True)
+        n_dist += n
+        return candidates[inside]
+
+    # -2: not visited, -1: noise
+    labels = np.full(n, -2, dtype=int)
+    n_clusters = 0
+
+    for i in range(n):
+        if labels[i] != -2:
+            continue
+
+        seeds = neighbors(i)
+        if len(seeds) < min_samples:
+            labels[i] = -1
+            continue
+
+        cluster = n_clusters
+        n_clusters += 1
+        labels[i] = cluster
+
+        queue = list(seeds)
+        while len(queue) > 0:
+            j = queue.pop()
+            if labels[j] == -1:
+                # border fix
+                labels[j] = cluster
+            if labels[j] != -2:
+                continue
+
+            labels[j] = cluster
+            expansion = neighbors(j)
+            if len(expansion) >= min_samples:
+                queue.extend(expansion)
+
+    counters.add('stay_point_distance', n_dist)
+
+    # discard short clusters and number the rest in time order
+    clusters = pd.Series(times).groupby(labels)
+    duration = clusters.max() - clusters.min()
+    first = pd.Series(np.arange(n)).groupby(labels).min()
+
+    valid = duration.index[(duration.index >= 0) &
+                           (duration.values >= time_th)]
+    ids = {c: k for k, c in enumerate(first[valid].sort_values().index)}
+
+    return [ids[c] if c in ids else np.nan for c in labels]
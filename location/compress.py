@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+    compress
+    ~~~~~~~~
+
+    Trajectory compression before stay point detection.
+
+    Phones often log at a high rate while stationary, so most fixes
+    passed to `motif.get_stay_point` are near duplicates. The functions
+    in this module reduce them (see the `compression` argument of
+    `motif.compute_nodes`):
+
+        - `collapse_runs`: runs of consecutive fixes within a radius of
+          their first fix become one weighted fix. Stay point detection
+          is aware of the runs, so the result is exactly the same as
+          without compression.
+        - `decimate`: keeps the first fix of every time interval.
+        - `douglas_peucker`: simplifies moving segments of the
+          trajectory with the Douglas-Peucker algorithm.
+
+    The last two are lossy, so stay points can differ.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from location import epoch, spatial
+
+
+# number of fixes compared against a run representative at once
+_CHUNK_SIZE = 64
+
+
+def collapse_runs(df, lat_c='latitude', lon_c='longitude', eps=10):
+    """
+    Collapses runs of nearby fixes.
+
+    A run starts with a fix (its representative) and contains the
+    following consecutive fixes within `eps` meters of it.
+
+    Parameters
+    ----------
+    df : DataFrame
+        DataFrame with sorted DateTimeIndex.
+
+    lat_c, lon_c : str
+        Column names with latitude and longitude values.
+
+    eps : float
+        Run radius in meters. Default is 10m.
+
+    Returns
+    -------
+    DataFrame
+        One row per run, indexed by the time of its first fix. It has
+        lat_c and lon_c columns (the representative), 'weight' (number
+        of fixes), 'first' (position of the first fix in `df`),
+        'start_time' and 'end_time' (times of the first and last fix)
+        and 'radius' (distance of the furthest fix to the
+        representative in meters).
+    """
+
+    lats = df[lat_c].values.astype(float)
+    lons = df[lon_c].values.astype(float)
+    n = len(df)
+
+    first = []
+    radius = []
+
+    index = 0
+    while index < n:
+        j = index + 1
+        r = 0.0
+        while j < n:
+            end = min(j + _CHUNK_SIZE, n)
+            d = spatial._haversine(lats[index], lons[index],
+                                   lats[j:end], lons[j:end])
+            outside = np.flatnonzero(d > eps)
+
+            k = outside[0] if len(outside) > 0 else end - j
+            if k > 0:
+                r = max(r, float(d[:k].max()))
+
+            j += k
+            if len(outside) > 0:
+                break
+
+        first.append(index)
+        radius.append(r)
+        index = j
+
+    first = np.array(first, dtype=int)
+    weight = np.diff(np.append(first, n))
+    times = df.index
+
+    runs = pd.DataFrame({lat_c: lats[first],
+                         lon_c: lons[first],
+                         'weight': weight,
+                         'first': first,
+                         'start_time': times[first],
+                         'end_time': times[first + weight - 1],
+                         'radius': radius},
+                        columns=[lat_c, lon_c, 'weight', 'first',
+                                 'start_time', 'end_time', 'radius'],
+                        index=times[first])
+
+    return runs
+
+
+def decimate(df, interval='1min'):
+    """
+    Keeps the first fix of every time interval.
+
+    Parameters
+    ----------
+    df : DataFrame
+        DataFrame with sorted DateTimeIndex.
+
+    interval : str or pd.timedelta
+        Interval duration. Default is 1 minute.
+
+    Returns
+    -------
+    DataFrame
+        Rows of `df` that are the first in their interval.
+    """
+
+    ns, _ = epoch.to_epoch(df.index)
+    buckets = ns // pd.to_timedelta(interval).value
+
+    keep = np.ones(len(df), dtype=bool)
+    keep[1:] = buckets[1:] != buckets[:-1]
+
+    return df.loc[keep]
+
+
+def _segment_distances(y, x, start, end):
+    """
+    Computes distances (in projected units) of points start < i < end
+    to the segment between the start and end points.
+    """
+
+    py = y[start + 1:end] - y[start]
+    px = x[start + 1:end] - x[start]
+    dy = y[end] - y[start]
+    dx = x[end] - x[start]
+
+    length = dy * dy + dx * dx
+    if length == 0:
+        return np.hypot(py, px)
+
+    t = np.clip((py * dy + px * dx) / length, 0, 1)
+    return np.hypot(py - t * dy, px - t * dx)
+
+
+def _douglas_peucker(y, x, start, end, eps, keep):
+    """
+    Marks points to keep in y[start:end + 1], x[start:end + 1].
+    """
+
+    stack = [(start, end)]
+    while len(stack) > 0:
+        s, e = stack.pop()
+        keep[s] = keep[e] = True
+        if e - s < 2:
+            continue
+
+        d = _segment_distances(y, x, s, e)
+        i = int(d.argmax())
+        if d[i] > eps:
+            m = s + 1 + i
+            stack.append((s, m))
+            stack.append((m, e))
+
+
+def douglas_peucker(df, lat_c='latitude', lon_c='longitude', eps=20,
+                    stationary_eps=None):
+    """
+    Simplifies moving segments with the Douglas-Peucker algorithm.
+
+    Fixes in runs of `collapse_runs` (with `stationary_eps` radius)
+    having more than one fix are stationary and kept as they are,
+    the rest of the trajectory is simplified.
+
+    Parameters
+    ----------
+    df : DataFrame
+        DataFrame with sorted DateTimeIndex.
+
+    lat_c, lon_c : str
+        Column names with latitude and longitude values.
+
+    eps : float
+        Maximum distance in meters between a removed fix and the
+        simplified trajectory. Default is 20m.
+
+    stationary_eps : float
+        Run radius for stationary fixes. Default is None, in that
+        case `eps` is used.
+
+    Returns
+    -------
+    DataFrame
+        Kept rows of `df`.
+
+    Notes
+    -----
+        Distances are computed in an equirectangular projection
+        centered on the mean latitude, which is accurate for the
+        short segments between consecutive fixes.
+    """
+
+    n = len(df)
+    if n < 3:
+        return df
+
+    if stationary_eps is None:
+        stationary_eps = eps
+
+    lats = df[lat_c].values.astype(float)
+    lons = df[lon_c].values.astype(float)
+
+    scale = math.cos(math.radians(float(np.mean(lats))))
+    y = np.radians(lats) * spatial.EARTH_RADIUS
+    x = np.radians(lons) * spatial.EARTH_RADIUS * scale
+
+    runs = collapse_runs(df, lat_c=lat_c, lon_c=lon_c, eps=stationary_eps)
+    stationary = np.repeat(runs['weight'].values > 1, runs['weight'].values)
+
+    keep = stationary.copy()
+    keep[0] = keep[-1] = True
+
+    # moving segments are between kept fixes
+    kept = np.flatnonzero(keep)
+    for s, e in zip(kept[:-1], kept[1:]):
+        if e - s > 1:
+            _douglas_peucker(y, x, s, e, eps, keep)
+
+    return df.loc[keep]
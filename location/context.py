@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+    context
+    ~~~~~~~
+
+    Per-participant cache of derived quantities.
+
+    Motif and utility functions repeatedly derive the same values from
+    a participant's location data (e.g., the home location is detected
+    by `motif.insert_home_location` and again by
+    `motif.filter_out_travelling_day`). A `ParticipantContext` computes
+    each of them lazily, at most once, and the functions accepting a
+    `context` argument use it instead of recomputing.
+
+    The same stay regions reappear day after day, so the context also
+    keeps a bounded cache of distances between regions, shared by the
+    daily computations of the participant.
+"""
+
+from collections import OrderedDict
+
+import geohash
+import numpy as np
+
+from location import counters, epoch, geodesic
+
+
+class ParticipantContext(object):
+    """
+    Lazily computed values for the location data of one participant.
+
+    Parameters
+    ----------
+    data : DataFrame
+        Location data with DateTimeIndex (e.g., the first element
+        returned by `motif.compute_nodes`).
+
+    sr_col : str
+        Column name for stay region. Default is 'stay_region'.
+
+    home : str
+        Home location in geohash form. Default is None, in that case
+        it is detected from the data when needed (see
+        `motif.get_home_location`).
+
+    max_distances : int
+        Maximum number of cached region distances. The least recently
+        used ones are evicted first. Default is 65536.
+
+    Attributes
+    ----------
+    home : str
+        Home location (None if it can't be detected).
+
+    local_ns : ndarray
+        Local (wall clock) time of each row as int64 epoch
+        nanoseconds, see `location.epoch`.
+
+    hours, dayofweek : ndarray
+        Hour of the day and day of the week of each row.
+    """
+
+    def __init__(self, data, sr_col='stay_region', home=None,
+                 max_distances=65536):
+        self.data = data
+        self.sr_col = sr_col
+        self.max_distances = max_distances
+
+        self._home = home
+        self._home_computed = home is not None
+        self._local_ns = None
+        self._hours = None
+        self._dayofweek = None
+        self._coordinates = {}
+        self._distances = OrderedDict()
+
+    @property
+    def home(self):
+        if not self._home_computed:
+            # motif imports this module
+            from location import motif
+
+            self._home = motif._home_location(self.data, self.hours,
+                                              sr_col=self.sr_col)
+            self._home_computed = True
+
+        return self._home
+
+    @property
+    def local_ns(self):
+        if self._local_ns is None:
+            self._local_ns = epoch.local_epoch(self.data.index)
+
+        return self._local_ns
+
+    @property
+    def hours(self):
+        if self._hours is None:
+            self._hours = epoch.hour_of_day(self.local_ns)
+
+        return self._hours
+
+    @property
+    def dayofweek(self):
+        if self._dayofweek is None:
+            self._dayofweek = epoch.day_of_week(self.local_ns)
+
+        return self._dayofweek
+
+    def coordinates(self, region):
+        """
+        Gets the coordinates of a stay region.
+
+        Decoded values are cached, so every region is decoded
+        at most once.
+
+        Parameters
+        ----------
+        region : str
+            Geohash value.
+
+        Returns
+        -------
+        (lat, lon) : (float, float)
+        """
+
+        try:
+            c = self._coordinates[region]
+        except KeyError:
+            counters.add('context_coordinates_misses')
+            counters.add('geohash_decode')
+            c = geohash.decode(region)
+            self._coordinates[region] = c
+        else:
+            counters.add('context_coordinates_hits')
+
+        return c
+
+    def distances(self, origins, destinations, backend=None,
+                  default='vincenty'):
+        """
+        Gets distances between stay regions.
+
+        Distances are computed between region centers (see
+        `coordinates`) and cached by unordered region pair and
+        backend, so every pair is computed at most once while it
+        stays in the cache. Fixes are not at region centers, so
+        distances between fixes (e.g., `features.displacement`) must
+        not be taken from here.
+
+        Parameters
+        ----------
+        origins, destinations : iterables
+            Geohash values of the same length.
+
+        backend, default : str
+            Distance backend, see `geodesic.get_backend`. Default
+            kernel is Vincenty.
+
+        Returns
+        -------
+        ndarray
+            Distances in meters.
+        """
+
+        backend = geodesic.get_backend(backend, default)
+
+        keys = [(o, d, backend) if o <= d else (d, o, backend)
+                for o, d in zip(origins, destinations)]
+        result = np.empty(len(keys))
+
+        missing = OrderedDict()
+        for i, k in enumerate(keys):
+            try:
+                result[i] = self._distances[k]
+            except KeyError:
+                missing.setdefault(k, []).append(i)
+            else:
+                self._distances.move_to_end(k)
+
+        # every lookup is either a miss (a computed pair) or a hit,
+        # including repeats of a missing pair within this call
+        counters.add('context_distance_hits', len(keys) - len(missing))
+
+        if len(missing) > 0:
+            counters.add('context_distance_misses', len(missing))
+
+            first = np.array([self.coordinates(k[0]) for k in missing],
+                             dtype=float)
+            second = np.array([self.coordinates(k[1]) for k in missing],
+                              dtype=float)
+            d = geodesic.distance(first[:, 0], first[:, 1],
+                                  second[:, 0], second[:, 1],
+                                  backend=backend)
+
+            for (k, positions), x in zip(missing.items(), d):
+                result[positions] = x
+                self._distances[k] = x
+
+            while len(self._distances) > self.max_distances:
+                self._distances.popitem(last=False)
+
+        return result
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+    counters
+    ~~~~~~~~
+
+    Operation counters for the hot paths of the location pipeline.
+
+    Counting is disabled by default. While disabled, `add` returns
+    immediately and library code only pays for a function call per
+    counted batch (hot loops count locally and report once). Enable
+    counting with `enable` (or within a block with `counting`), read
+    it with `snapshot` and export it with `write_prometheus`.
+
+    Counter names used by the library:
+
+        - 'stay_point_distance': exact distance evaluations in
+          `motif.get_stay_point` and `cluster.st_dbscan`.
+        - 'motif_isomorphism': `nx.is_isomorphic` calls in
+          `motif.generate_motifs`.
+        - 'geohash_encode', 'geohash_decode', 'geohash_neighbors':
+          calls into the geohash library.
+        - 'context_distance_hits', 'context_distance_misses': lookups
+          in the distance cache of `context.ParticipantContext`. Every
+          lookup is counted once and misses are computed distances.
+"""
+
+import os
+import re
+import tempfile
+import threading
+
+from collections import Counter
+from contextlib import contextmanager
+
+
+_enabled = False
+_counts = Counter()
+_lock = threading.Lock()
+
+
+def enable():
+    """
+    Enables counting.
+    """
+
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """
+    Disables counting. The current counts are retained.
+    """
+
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    """
+    Checks if counting is enabled.
+
+    Returns
+    -------
+    bool
+    """
+
+    return _enabled
+
+
+def reset():
+    """
+    Resets all counters to zero.
+    """
+
+    with _lock:
+        _counts.clear()
+
+
+@contextmanager
+def counting():
+    """
+    Counts operations within a block.
+
+    Counters are reset and counting is enabled when entering the
+    block. When leaving it, counting is restored to its previous state
+    and counters are reset again, so take a `snapshot` inside the
+    block.
+    """
+
+    was_enabled = _enabled
+    reset()
+    enable()
+    try:
+        yield
+    finally:
+        if not was_enabled:
+            disable()
+        reset()
+
+
+def add(name, n=1):
+    """
+    Increments a counter.
+
+    Parameters
+    ----------
+    name : str
+        Counter name.
+
+    n : int
+        Increment. Default is 1.
+    """
+
+    if not _enabled:
+        return
+
+    with _lock:
+        _counts[name] += n
+
+
+def snapshot():
+    """
+    Gets the current counts.
+
+    Returns
+    -------
+    dict
+        A copy of the counters as {name: count}.
+    """
+
+    with _lock:
+        return dict(_counts)
+
+
+def merge(counts):
+    """
+    Adds given counts to the registry.
+
+    This can be used to combine snapshots from worker
+    processes. Counts are merged even if counting is disabled.
+
+    Parameters
+    ----------
+    counts : dict
+        Counts as returned by `snapshot`.
+    """
+
+    with _lock:
+        _counts.update(counts)
+
+
+def _metric_name(name, prefix):
+    """
+    Converts a counter name into a valid Prometheus metric name.
+    """
+
+    name = re.sub('[^a-zA-Z0-9_]', '_', prefix + name)
+    if not name.endswith('_total'):
+        name += '_total'
+
+    return name
+
+
+def to_prometheus(counts=None, prefix='location_'):
+    """
+    Formats counts in Prometheus text exposition format.
+
+    Parameters
+    ----------
+    counts : dict
+        Counts to format. Default is None, in that case
+        the current `snapshot` is used.
+
+    prefix : str
+        Prefix for metric names. Default is 'location_'.
+
+    Returns
+    -------
+    str
+        Text with a TYPE line and a sample for each counter.
+    """
+
+    if counts is None:
+        counts = snapshot()
+
+    lines = []
+    for name in sorted(counts):
+        metric = _metric_name(name, prefix)
+        lines.append('# TYPE {0} counter'.format(metric))
+        lines.append('{0} {1}'.format(metric, counts[name]))
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path, counts=None, prefix='location_'):
+    """
+    Writes counts as a Prometheus text file.
+
+    The file is written to a temporary file first and then
+    renamed, so a node-exporter textfile collector never
+    reads a partially written file.
+
+    Parameters
+    ----------
+    path : str
+        Output path. It should have a .prom extension to
+        be picked up by the textfile collector.
+
+    counts : dict
+        See `to_prometheus`.
+
+    prefix : str
+        See `to_prometheus`.
+    """
+
+    text = to_prometheus(counts, prefix=prefix)
+    directory = os.path.dirname(os.path.abspath(path))
+
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
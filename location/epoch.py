@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+    epoch
+    ~~~~~
+
+    Integer time representation for the internals of the pipeline.
+
+    Timestamps are handled as int64 nanoseconds since epoch. UTC
+    values (`to_epoch`) are used for comparisons and differences, and
+    local wall clock values (`local_epoch`) for hour of day and day of
+    week extraction, which reduces to integer arithmetic. Timestamps
+    are only materialized at the API boundary (`to_timestamps`).
+"""
+
+import numpy as np
+import pandas as pd
+
+
+NS_PER_HOUR = 3600 * 10 ** 9
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+# 1970-01-01 was a Thursday
+_EPOCH_DAYOFWEEK = 3
+
+
+def to_epoch(values):
+    """
+    Converts timestamps into epoch nanoseconds.
+
+    Parameters
+    ----------
+    values : DatetimeIndex, Series or iterables
+        Timestamps. Values with timezone are converted to UTC and
+        naive values are taken as they are.
+
+    Returns
+    -------
+    (ns, tz) : (ndarray, tzinfo)
+        int64 nanoseconds since epoch and the timezone of the values
+        (None for naive values).
+    """
+
+    index = pd.DatetimeIndex(values)
+    return index.asi8, index.tz
+
+
+def local_epoch(values):
+    """
+    Converts timestamps into local (wall clock) epoch nanoseconds.
+
+    Parameters
+    ----------
+    values : DatetimeIndex, Series or iterables
+        Timestamps.
+
+    Returns
+    -------
+    ndarray
+        int64 nanoseconds since epoch of the local times.
+    """
+
+    index = pd.DatetimeIndex(values)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+
+    return index.asi8
+
+
+def to_timestamps(ns, tz=None):
+    """
+    Converts epoch nanoseconds into timestamps.
+
+    Parameters
+    ----------
+    ns : ndarray
+        UTC epoch nanoseconds (or local ones if `tz` is None).
+
+    tz : str or tzinfo
+        Timezone of the resulting timestamps. Default is None.
+
+    Returns
+    -------
+    DatetimeIndex
+    """
+
+    index = pd.DatetimeIndex(np.asarray(ns, dtype=np.int64))
+    if tz is not None:
+        index = index.tz_localize('UTC').tz_convert(tz)
+
+    return index
+
+
+def hour_of_day(local_ns):
+    """
+    Gets hour of the day (0-23) from local epoch nanoseconds.
+    """
+
+    return (np.asarray(local_ns) // NS_PER_HOUR) % 24
+
+
+def day_of_week(local_ns):
+    """
+    Gets day of the week (0 is Monday) from local epoch nanoseconds.
+    """
+
+    return (np.asarray(local_ns) // NS_PER_DAY + _EPOCH_DAYOFWEEK) % 7
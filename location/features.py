@@ -5,8 +5,7 @@
 
 import numpy as np
 import pandas as pd
-from location import motif
-from geopy.distance import vincenty
+from location import counters, epoch, geodesic, motif
 import math
 from collections import Counter
 import pytz
@@ -18,7 +17,8 @@ def gyration_radius(data,
                     k=None,
                     lat_c='latitude',
                     lon_c='longitude',
-                    cluster_c='cluster'):
+                    cluster_c='cluster',
+                    backend=None):
     """
     Compute the total or k-th radius of gyration.
     The radius of gyration is used to characterize the typical
@@ -44,6 +44,11 @@ def gyration_radius(data,
         'latitude', 'longitude', and 'cluster'
         respectively.
 
+    backend: str
+        Distance backend (see `geodesic`).
+        Default is None, in this case the global
+        backend is used if set, Vincenty otherwise.
+
     Returns:
     --------
     float
@@ -75,11 +80,14 @@ def gyration_radius(data,
 
     # compute gyration of radius
     cluster_cnt = Counter(loc_data[cluster_c])
-    tmp = 0
-    for c in cluster_cnt:
-        cluster_gps = convert_geohash_to_gps(c)
-        d = vincenty(r_cm, cluster_gps).m
-        tmp += cluster_cnt[c] * (d ** 2)
+    clusters = list(cluster_cnt)
+    cluster_gps = np.array([convert_geohash_to_gps(c) for c in clusters],
+                           dtype=float)
+    d = geodesic.distance(r_cm[0], r_cm[1],
+                          cluster_gps[:, 0], cluster_gps[:, 1],
+                          backend=backend, default='vincenty')
+    cnt = np.array([cluster_cnt[c] for c in clusters], dtype=float)
+    tmp = float(np.sum(cnt * d ** 2))
 
     return math.sqrt(tmp / len(loc_data))
 
@@ -131,7 +139,8 @@ def num_trips(data,
 def max_dist_between_clusters(data,
                               cluster_c='cluster',
                               lat_c='latitude',
-                              lon_c='longitude'):
+                              lon_c='longitude',
+                              backend=None):
     """
     Compute the maximum distance between two
     location clusters.
@@ -148,6 +157,11 @@ def max_dist_between_clusters(data,
         Latidue and longitude of the cluster
         locations.
 
+    backend: str
+        Distance backend (see `geodesic`).
+        Default is None, in this case the global
+        backend is used if set, Vincenty otherwise.
+
     Returns:
     --------
     max_dist: float
@@ -170,14 +184,13 @@ def max_dist_between_clusters(data,
         locations_coord.append(gps)
 
     # find maximum distance
-    max_dist = 0
-    for i in range(len(locations) - 1):
-        for j in range(i + 1, len(locations)):
-            d = vincenty(locations_coord[i], locations_coord[j]).m
-            if d > max_dist:
-                max_dist = d
+    locations_coord = np.array(locations_coord, dtype=float)
+    i, j = np.triu_indices(len(locations), k=1)
+    d = geodesic.distance(locations_coord[i, 0], locations_coord[i, 1],
+                          locations_coord[j, 0], locations_coord[j, 1],
+                          backend=backend, default='vincenty')
 
-    return max_dist
+    return max(0, float(np.max(d)))
 
 
 def num_clusters(data, cluster_c='cluster'):
@@ -209,7 +222,8 @@ def num_clusters(data, cluster_c='cluster'):
 def displacement(data,
                  lat_c='latitude',
                  lon_c='longitude',
-                 cluster_c='cluster'):
+                 cluster_c='cluster',
+                 backend=None):
     """
     Calculate the displacement of the location data,
     which is list of distances traveled from one location
@@ -229,6 +243,11 @@ def displacement(data,
         Default values are 'latitude', and
         'longitude' respectively.
 
+    backend: str
+        Distance backend (see `geodesic`).
+        Default is None, in this case the global
+        backend is used if set, Vincenty otherwise.
+
     Returns:
     --------
     displace: list
@@ -237,24 +256,19 @@ def displacement(data,
     data = data.loc[~pd.isnull(data[cluster_c])]
     displace = []
 
-    if len(data) == 1:
+    if len(data) < 2:
         return displace
 
     # location history
     data = data.loc[data[cluster_c] != data[cluster_c].shift()]
 
-    # compute displacements
-    prev = None
-    for _, row in data.iterrows():
-        if prev is None:
-            prev = (row[lat_c], row[lon_c])
-            continue
-        curr = (row[lat_c], row[lon_c])
-        d = vincenty(prev, curr).m
-        displace.append(d)
-        prev = curr
+    # compute displacements between consecutive locations
+    lats = data[lat_c].values.astype(float)
+    lons = data[lon_c].values.astype(float)
+    d = geodesic.distance(lats[:-1], lons[:-1], lats[1:], lons[1:],
+                          backend=backend, default='vincenty')
 
-    return displace
+    return d.tolist()
 
 
 def wait_time(data,
@@ -592,7 +606,8 @@ def total_dist(data,
                cluster_c='cluster',
                lat_c='latitude',
                lon_c='longitude',
-               dispmnt=None):
+               dispmnt=None,
+               backend=None):
     """
     The sum of travel distance in meters.
     This value computed by taking the sum
@@ -615,6 +630,10 @@ def total_dist(data,
     dispmnt: list
         List of displacements returned by displacement().
 
+    backend: str
+        Distance backend used if dispmnt is not given,
+        see displacement().
+
     Returns:
     --------
     td: float
@@ -624,7 +643,8 @@ def total_dist(data,
         dispmnt = displacement(data=data,
                                lat_c=lat_c,
                                lon_c=lon_c,
-                               cluster_c=cluster_c)
+                               cluster_c=cluster_c,
+                               backend=backend)
 
     td = sum(dispmnt)
     return td
@@ -646,6 +666,7 @@ def convert_geohash_to_gps(geohash_str):
         (latitude, longitude)
     """
     lat, lon = geohash.decode(geohash_str)
+    counters.add('geohash_decode')
     return lat, lon
 
 
@@ -677,3 +698,135 @@ def convert_and_append_geohash(data,
         data.loc[idx, lat_c] = lat
         data.loc[idx, lon_c] = lon
     return data
+
+
+def _day_slices(data, days):
+    """
+    Gets the rows of each day.
+
+    Same as `motif.get_df_slices(data, [d, d + 1 day])` for every
+    day, but the index is converted into epoch values once and the
+    rows of a day are found by binary search (after a stable sort if
+    the index is not sorted), so the cost doesn't grow with
+    days x rows.
+
+    Parameters:
+    -----------
+    data: DataFrame
+        Location data with DateTimeIndex.
+
+    days: iterables
+        Start timestamps of the days.
+
+    Returns:
+    --------
+    generator
+        Rows of each day, in the order of `data`.
+    """
+    values, _ = epoch.to_epoch(data.index)
+    starts, _ = epoch.to_epoch(days)
+    ends = starts + epoch.NS_PER_DAY
+
+    if data.index.is_monotonic_increasing:
+        order = None
+    else:
+        order = np.argsort(values, kind='mergesort')
+        values = values[order]
+
+    lo = np.searchsorted(values, starts, side='left')
+    hi = np.searchsorted(values, ends, side='left')
+    for s, e in zip(lo, hi):
+        if order is None:
+            yield data.iloc[s:e]
+        else:
+            yield data.iloc[np.sort(order[s:e])]
+
+
+def daily_features(data,
+                   days,
+                   cluster_c='stay_region',
+                   lat_c='latitude',
+                   lon_c='longitude',
+                   home_loc=None,
+                   backend=None,
+                   context=None):
+    """
+    Compute location features for each day.
+
+    Parameters:
+    -----------
+    data: DataFrame
+        Location data with DateTimeIndex (e.g., the first element
+        returned by `motif.compute_nodes`).
+
+    days: iterables
+        Start timestamps of the days (e.g., the timestamps of daily
+        nodes). Every day is 24 hours long.
+
+    cluster_c, lat_c, lon_c: str
+        Cluster, latitude and longitude columns. Default values are
+        'stay_region', 'latitude' and 'longitude' respectively.
+
+    home_loc: str
+        Home location cluster. Default is None, in that case it is
+        detected from the data (see `motif.get_home_location`).
+
+    backend: str
+        Distance backend of gyration_radius, max_dist_between_clusters
+        and total_dist (see `geodesic`). Default is None, in that case
+        the global backend is used if set, otherwise Vincenty (accurate
+        mode, vectorized over the locations of each day).
+
+    context: location.context.ParticipantContext
+        If given and home_loc is None, the home location is taken
+        from it. Default is None. Daily features get no cross-day
+        caching: distances are computed from the fixes of each day,
+        which are not stay region centers, so the distance cache of
+        the context is not used.
+
+    Returns:
+    --------
+    DataFrame
+        Features of each day, indexed by 'timestamp'.
+    """
+    if home_loc is None:
+        if context is not None:
+            home_loc = context.home
+        else:
+            home_loc = motif.get_home_location(data, sr_col=cluster_c)
+
+    rows = []
+    for d, day in zip(days, _day_slices(data, days)):
+        wait_time_v = wait_time(day, cluster_c=cluster_c)
+        dispmnt = displacement(day, lat_c=lat_c, lon_c=lon_c,
+                               cluster_c=cluster_c, backend=backend)
+        ent, nent = entropy(day, cluster_c=cluster_c,
+                            wait_time_v=wait_time_v)
+
+        rows.append({
+            'timestamp': d,
+            'gyration_radius': gyration_radius(day, lat_c=lat_c,
+                                               lon_c=lon_c,
+                                               cluster_c=cluster_c,
+                                               backend=backend),
+            'num_trips': num_trips(day, cluster_c=cluster_c),
+            'max_dist_between_clusters': max_dist_between_clusters(
+                day, cluster_c=cluster_c, lat_c=lat_c, lon_c=lon_c,
+                backend=backend),
+            'num_clusters': num_clusters(day, cluster_c=cluster_c),
+            'total_dist': total_dist(day, dispmnt=dispmnt),
+            'entropy': ent,
+            'normalized_entropy': nent,
+            'loc_var': loc_var(day, lat_c=lat_c, lon_c=lon_c,
+                               cluster_c=cluster_c),
+            'home_stay': home_stay(day, home_loc, cluster_c=cluster_c,
+                                   wait_time_v=wait_time_v),
+            'trans_time': trans_time(day, cluster_c=cluster_c,
+                                     wait_time_v=wait_time_v)})
+
+    columns = ['timestamp', 'gyration_radius', 'num_trips',
+               'max_dist_between_clusters', 'num_clusters', 'total_dist',
+               'entropy', 'normalized_entropy', 'loc_var', 'home_stay',
+               'trans_time']
+
+    return pd.DataFrame(rows, columns=columns).set_index('timestamp')
@@ -0,0 +1,507 @@
+# -*- coding: utf-8 -*-
+"""
+    geodesic
+    ~~~~~~~~
+
+    Distance backends with vectorized kernels.
+
+    All kernels take latitudes and longitudes in degrees (scalars or
+    NumPy arrays broadcasting against each other) and return distances
+    in meters:
+
+        - 'haversine': great circle distance on a sphere with geopy's
+          radius (same as `geopy.distance.great_circle`).
+        - 'cosine': spherical law of cosines on the same sphere. It is
+          the cheapest, but loses precision for distances below a few
+          meters.
+        - 'vincenty': iterative Vincenty formula on the WGS-84
+          ellipsoid (same as `geopy.distance.vincenty` within
+          nanometers). It is the accurate mode of feature functions.
+
+    Every call site in the library has a default kernel (the one it has
+    historically used). `set_backend` overrides it globally and the
+    `backend` argument of a function overrides it for a single call.
+
+    Threshold tests (is a distance within a threshold?) should use
+    `within`, which only runs the kernel for pairs it cannot decide
+    with cheap bounds.
+"""
+
+import math
+
+import numpy as np
+
+
+BACKENDS = ('haversine', 'cosine', 'vincenty')
+
+# earth radius (in meters) used by geopy's great circle distance
+EARTH_RADIUS = 6372795.0
+
+# WGS-84 (in kilometers, as geopy, to get the same rounding)
+_WGS84_MAJOR = 6378.137
+_WGS84_MINOR = 6356.7523142
+_WGS84_F = 1 / 298.257223563
+_WGS84_E2 = _WGS84_F * (2 - _WGS84_F)
+
+# mean radius (in meters) of the ellipsoid, used for pairs Vincenty
+# does not converge for
+_WGS84_MEAN_RADIUS = (2 * _WGS84_MAJOR + _WGS84_MINOR) / 3 * 1000
+
+# lower bound (in meters) of the radius of curvature of both the sphere
+# and the ellipsoid (meridional radius at the equator), with a margin.
+# Bounds derived from it (e.g., degrees spanned by a distance) hold for
+# every backend.
+MIN_RADIUS = 6335439.0 * 0.999
+
+# absolute error (in meters) of kernels: rounding, the convergence
+# tolerance of Vincenty and the precision of arccos near 1 (about 0.1m)
+# for the law of cosines
+KERNEL_ERROR = {'haversine': 1e-3, 'cosine': 0.25, 'vincenty': 1e-3}
+
+# largest absolute error of all kernels
+MAX_KERNEL_ERROR = max(KERNEL_ERROR.values())
+
+_backend = None
+
+
+def set_backend(backend):
+    """
+    Sets the distance backend globally.
+
+    Parameters
+    ----------
+    backend : str
+        One of `BACKENDS` or None. If None, every call site uses
+        its default kernel.
+
+    Returns
+    -------
+    str
+        The previous backend.
+    """
+
+    global _backend
+
+    if backend is not None and backend not in BACKENDS:
+        raise ValueError('Backend {0} is not supported'.format(backend))
+
+    previous = _backend
+    _backend = backend
+    return previous
+
+
+def get_backend(backend=None, default='haversine'):
+    """
+    Resolves the backend of a call.
+
+    Parameters
+    ----------
+    backend : str
+        Backend given for the call. Default is None.
+
+    default : str
+        Default kernel of the call site. Default is 'haversine'.
+
+    Returns
+    -------
+    str
+        `backend` if given, otherwise the global backend if set,
+        otherwise `default`.
+    """
+
+    if backend is None:
+        backend = _backend if _backend is not None else default
+
+    if backend not in BACKENDS:
+        raise ValueError('Backend {0} is not supported'.format(backend))
+
+    return backend
+
+
+def get_kernel(backend=None, default='haversine'):
+    """
+    Gets the kernel function of the resolved backend.
+
+    Parameters
+    ----------
+    backend, default : str
+        See `get_backend`.
+
+    Returns
+    -------
+    function
+        Kernel taking (lat1, lon1, lat2, lon2) and returning meters.
+    """
+
+    return _KERNELS[get_backend(backend, default)]
+
+
+def distance(lat1, lon1, lat2, lon2, backend=None, default='haversine'):
+    """
+    Computes distances with the resolved backend.
+
+    Parameters
+    ----------
+    lat1, lon1, lat2, lon2 : float or ndarray
+        Coordinates in degrees.
+
+    backend, default : str
+        See `get_backend`.
+
+    Returns
+    -------
+    float or ndarray
+        Distances in meters.
+    """
+
+    return get_kernel(backend, default)(lat1, lon1, lat2, lon2)
+
+
+def _equirectangular_band(dist_th, max_lat, backend):
+    """
+    Bounds the difference between `_equirectangular` and the kernel
+    for distances up to `dist_th` between latitudes within
+    +-`max_lat` degrees.
+
+    The relative error of the approximation is below
+    (d / R)^2 * (1 + tan(lat)^2) / 8 for a distance d (measured
+    against all kernels, the bound uses twice that).
+    """
+
+    if max_lat >= 89.9:
+        return np.inf
+
+    t = math.tan(math.radians(max_lat))
+    rel = (dist_th / MIN_RADIUS) ** 2 * (1 + t * t) / 4
+
+    return dist_th * rel + KERNEL_ERROR[backend]
+
+
+def _equirectangular(lat1, lon1, lat2, lon2, backend):
+    """
+    Approximates short distances in meters in a local equirectangular
+    projection (with local ellipsoid radii for Vincenty).
+    """
+
+    mid_lat = np.radians((lat1 + lat2) / 2)
+    y = np.radians(lat2 - lat1)
+    x = np.radians(_wrap(lon2 - lon1)) * np.cos(mid_lat)
+
+    if backend != 'vincenty':
+        return EARTH_RADIUS * np.hypot(x, y)
+
+    # meridional and prime vertical radii of curvature
+    w = 1 - _WGS84_E2 * np.sin(mid_lat) ** 2
+    a = _WGS84_MAJOR * 1000
+    m = a * (1 - _WGS84_E2) / w ** 1.5
+    n = a / np.sqrt(w)
+
+    return np.hypot(m * y, n * x)
+
+
+def _wrap(d_lon):
+    """
+    Wraps longitude differences into [-180, 180).
+    """
+
+    return (d_lon + 180) % 360 - 180
+
+
+def _within(lat1, lon1, lat2, lon2, dist_th, backend):
+    """
+    Implements `within`.
+
+    Returns
+    -------
+    (ndarray, int)
+        The result and the number of kernel evaluations.
+    """
+
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(
+        *[np.asarray(v, dtype=float) for v in (lat1, lon1, lat2, lon2)])
+    result = np.zeros(lat1.shape, dtype=bool)
+    if result.size == 0 or dist_th < 0:
+        return result, 0
+
+    # bounding box: a distance is at least the meridian arc between the
+    # latitudes and the parallel arc at the largest latitude (up to the
+    # error of the kernel)
+    box_th = dist_th + KERNEL_ERROR[backend]
+    lat_half = math.degrees(box_th / MIN_RADIUS)
+    max_lat = min(float(max(np.abs(lat1).max(), np.abs(lat2).max())) +
+                  lat_half, 90)
+    s = math.sin(box_th / (2 * MIN_RADIUS))
+    scale = math.cos(math.radians(max_lat))
+    if s < scale:
+        lon_half = math.degrees(2 * math.asin(s / scale))
+    else:
+        lon_half = 360
+
+    candidates = np.flatnonzero(
+        (np.abs(lat2 - lat1) <= lat_half).ravel() &
+        (np.abs(_wrap(lon2 - lon1)) <= lon_half).ravel())
+
+    lat1, lon1, lat2, lon2 = [v.ravel()[candidates]
+                              for v in (lat1, lon1, lat2, lon2)]
+    out = result.ravel()
+
+    band = _equirectangular_band(dist_th, max_lat, backend)
+    if band < dist_th:
+        d = _equirectangular(lat1, lon1, lat2, lon2, backend)
+        out[candidates[d <= dist_th - band]] = True
+        ambiguous = np.abs(d - dist_th) <= band
+    else:
+        ambiguous = np.ones(len(candidates), dtype=bool)
+
+    n_exact = int(ambiguous.sum())
+    if n_exact > 0:
+        d = _KERNELS[backend](lat1[ambiguous], lon1[ambiguous],
+                              lat2[ambiguous], lon2[ambiguous])
+        out[candidates[ambiguous]] = d <= dist_th
+
+    return out.reshape(result.shape), n_exact
+
+
+def within(lat1, lon1, lat2, lon2, dist_th, backend=None,
+           default='haversine', return_evaluations=False):
+    """
+    Tests if distances are within a threshold.
+
+    The result is the same as `distance(...) <= dist_th`, but the
+    kernel only runs for pairs in an ambiguous band around the
+    threshold:
+
+        - Pairs outside a latitude/longitude bounding box of the
+          threshold are rejected.
+        - The rest are approximated in an equirectangular projection.
+          Pairs are accepted (or rejected) if the approximation is
+          below (or above) the threshold by more than its error bound,
+          see `_equirectangular_band`. The bound grows with the
+          threshold and the latitude, so for large thresholds or polar
+          latitudes most pairs fall into the band.
+
+    Parameters
+    ----------
+    lat1, lon1, lat2, lon2 : float or ndarray
+        Coordinates in degrees.
+
+    dist_th : float
+        Distance threshold in meters.
+
+    backend, default : str
+        See `get_backend`.
+
+    return_evaluations : bool
+        If the number of kernel evaluations should be returned as
+        well (e.g., for `counters`). Default is False.
+
+    Returns
+    -------
+    bool or ndarray
+        If `return_evaluations` is true, a (result, evaluations) tuple.
+    """
+
+    result, n_exact = _within(lat1, lon1, lat2, lon2, dist_th,
+                              get_backend(backend, default))
+    if result.ndim == 0:
+        result = bool(result)
+
+    if return_evaluations:
+        return result, n_exact
+
+    return result
+
+
+def _result(d):
+    if np.ndim(d) == 0:
+        return float(d)
+
+    return d
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Computes great circle distances in meters (haversine formula).
+    """
+
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    d_lat = lat2 - lat1
+    d_lon = np.radians(np.asarray(lon2) - np.asarray(lon1))
+
+    a = (np.sin(d_lat / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin(d_lon / 2) ** 2)
+
+    return _result(2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1))))
+
+
+def cosine(lat1, lon1, lat2, lon2):
+    """
+    Computes great circle distances in meters (law of cosines).
+    """
+
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    d_lon = np.radians(np.asarray(lon2) - np.asarray(lon1))
+
+    c = (np.sin(lat1) * np.sin(lat2) +
+         np.cos(lat1) * np.cos(lat2) * np.cos(d_lon))
+
+    return _result(EARTH_RADIUS * np.arccos(np.clip(c, -1, 1)))
+
+
+def vincenty(lat1, lon1, lat2, lon2, iterations=20, fallback=True):
+    """
+    Computes distances in meters on the WGS-84 ellipsoid.
+
+    All pairs iterate together as in geopy, and every pair stops as
+    soon as it converges.
+
+    Parameters
+    ----------
+    lat1, lon1, lat2, lon2 : float or ndarray
+        Coordinates in degrees.
+
+    iterations : int
+        Maximum number of iterations. Default is 20.
+
+    fallback : bool
+        Vincenty's formula does not converge for some nearly antipodal
+        pairs (geopy raises an error). If true, they get the great
+        circle distance on a sphere with the mean radius of the
+        ellipsoid (less than 0.5% off), otherwise np.nan. Default is
+        True.
+
+    Returns
+    -------
+    float or ndarray
+    """
+
+    coords = np.broadcast_arrays(
+        *[np.asarray(v, dtype=float) for v in (lat1, lon1, lat2, lon2)])
+    shape = coords[0].shape
+    coords = [c.ravel() for c in coords]
+
+    lat1 = np.radians(coords[0])
+    lat2 = np.radians(coords[2])
+    delta_lng = np.radians(coords[3]) - np.radians(coords[1])
+
+    major, minor, f = _WGS84_MAJOR, _WGS84_MINOR, _WGS84_F
+
+    reduced_lat1 = np.arctan((1 - f) * np.tan(lat1))
+    reduced_lat2 = np.arctan((1 - f) * np.tan(lat2))
+
+    sin_reduced1, cos_reduced1 = np.sin(reduced_lat1), np.cos(reduced_lat1)
+    sin_reduced2, cos_reduced2 = np.sin(reduced_lat2), np.cos(reduced_lat2)
+
+    n = len(lat1)
+    lambda_lng = delta_lng.copy()
+    lambda_prime = np.full(n, 2 * np.pi)
+
+    sin_sigma = np.zeros(n)
+    cos_sigma = np.ones(n)
+    sigma = np.zeros(n)
+    cos_sq_alpha = np.ones(n)
+    cos2_sigma_m = np.zeros(n)
+    n_iter = np.zeros(n, dtype=int)
+
+    active = np.ones(n, dtype=bool)
+    coincident = np.zeros(n, dtype=bool)
+
+    for i in range(iterations + 1):
+        active &= np.abs(lambda_lng - lambda_prime) > 10e-12
+        a = np.flatnonzero(active)
+        if len(a) == 0:
+            break
+
+        n_iter[a] += 1
+        sin_lambda_lng = np.sin(lambda_lng[a])
+        cos_lambda_lng = np.cos(lambda_lng[a])
+
+        s1, c1 = sin_reduced1[a], cos_reduced1[a]
+        s2, c2 = sin_reduced2[a], cos_reduced2[a]
+
+        sin_s = np.sqrt((c2 * sin_lambda_lng) ** 2 +
+                        (c1 * s2 - s1 * c2 * cos_lambda_lng) ** 2)
+
+        # coincident points
+        zero = sin_s == 0
+        if zero.any():
+            coincident[a[zero]] = True
+            active[a[zero]] = False
+            a = a[~zero]
+            sin_s = sin_s[~zero]
+            sin_lambda_lng = sin_lambda_lng[~zero]
+            cos_lambda_lng = cos_lambda_lng[~zero]
+            s1, c1, s2, c2 = s1[~zero], c1[~zero], s2[~zero], c2[~zero]
+
+        cos_s = s1 * s2 + c1 * c2 * cos_lambda_lng
+        sig = np.arctan2(sin_s, cos_s)
+
+        sin_alpha = c1 * c2 * sin_lambda_lng / sin_s
+        cos_sq_a = 1 - sin_alpha ** 2
+
+        # equatorial line
+        equatorial = cos_sq_a == 0
+        cos2_s_m = np.zeros(len(a))
+        cos2_s_m[~equatorial] = cos_s[~equatorial] - 2 * (
+            s1[~equatorial] * s2[~equatorial] / cos_sq_a[~equatorial])
+
+        C = f / 16. * cos_sq_a * (4 + f * (4 - 3 * cos_sq_a))
+
+        lambda_prime[a] = lambda_lng[a]
+        lambda_lng[a] = (
+            delta_lng[a] + (1 - C) * f * sin_alpha * (
+                sig + C * sin_s * (
+                    cos2_s_m + C * cos_s * (
+                        -1 + 2 * cos2_s_m ** 2
+                    )
+                )
+            )
+        )
+
+        sin_sigma[a] = sin_s
+        cos_sigma[a] = cos_s
+        sigma[a] = sig
+        cos_sq_alpha[a] = cos_sq_a
+        cos2_sigma_m[a] = cos2_s_m
+
+    u_sq = cos_sq_alpha * (major ** 2 - minor ** 2) / minor ** 2
+
+    A = 1 + u_sq / 16384. * (
+        4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq))
+    )
+
+    B = u_sq / 1024. * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+
+    delta_sigma = (
+        B * sin_sigma * (
+            cos2_sigma_m + B / 4. * (
+                cos_sigma * (
+                    -1 + 2 * cos2_sigma_m ** 2
+                ) - B / 6. * cos2_sigma_m * (
+                    -3 + 4 * sin_sigma ** 2
+                ) * (
+                    -3 + 4 * cos2_sigma_m ** 2
+                )
+            )
+        )
+    )
+
+    s = minor * A * (sigma - delta_sigma) * 1000
+    s[coincident] = 0
+
+    failed = np.flatnonzero(n_iter > iterations)
+    if len(failed) > 0:
+        if fallback:
+            s[failed] = haversine(*[c[failed] for c in coords]) / \
+                EARTH_RADIUS * _WGS84_MEAN_RADIUS
+        else:
+            s[failed] = np.nan
+
+    return _result(s.reshape(shape))
+
+
+_KERNELS = {'haversine': haversine,
+            'cosine': cosine,
+            'vincenty': vincenty}
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+    instrument
+    ~~~~~~~~~~
+
+    Stage level instrumentation for the location pipeline.
+
+    Pipeline functions (e.g., `motif.compute_nodes`) accept an optional
+    `instrument` argument. When given, every stage emits a start and
+    a stop event. Stop events carry the elapsed wall and CPU time along
+    with input and output row counts. In memory mode, they also carry
+    the peak traced allocation and the RSS delta of the stage.
+"""
+
+import json
+import os
+import time
+import tracemalloc
+
+import pandas as pd
+
+
+class Instrument(object):
+    """
+    Collects per-stage start/stop events.
+
+    Each event is a dict with following keys:
+
+        - 'stage': name of the stage.
+        - 'event': either 'start' or 'stop'.
+        - 'time': wall clock time (seconds since epoch).
+        - 'rows_in': number of input rows (or None).
+
+    Stop events additionally contain:
+
+        - 'rows_out': number of output rows (or None).
+        - 'wall': elapsed wall time in seconds.
+        - 'cpu': elapsed CPU time (of the current process) in seconds.
+        - 'error': name of the exception type if the stage failed,
+          otherwise None.
+
+    If `memory` is True, stop events also contain:
+
+        - 'peak_traced': peak memory (in bytes) allocated by Python
+          during the stage, relative to the traced memory at the start
+          of the stage (see `tracemalloc`). None if it can't be
+          measured, see the notes.
+        - 'rss_delta': change in resident set size (in bytes) between
+          the start and end of the stage. None if the RSS is not
+          available on the platform.
+
+    Parameters
+    ----------
+    callback : callable
+        Called with every event as it is emitted. Default is None,
+        in that case events are only kept in `events`.
+
+    keep_events : bool
+        If emitted events should be kept in `events`. Default is True.
+
+    memory : bool
+        If memory usage should be recorded. Tracing allocations slows
+        down the pipeline considerably, so it is disabled by default.
+        If `tracemalloc` is not already tracing, it is started on the
+        first stage and stopped by `close`.
+
+    Notes
+    -----
+        Peaks of nested stages are tracked separately. On Python
+        versions without `tracemalloc.reset_peak` (< 3.9), the peak is
+        reset by restarting tracing at the start of every stage. Memory
+        allocated before a restart is not traced anymore, so freeing it
+        does not lower the traced memory of the stage. If tracing was
+        started by someone else, it is not restarted and 'peak_traced'
+        is None, since the high-water mark since tracing started would
+        overstate the peak of a stage following a larger one.
+    """
+
+    def __init__(self, callback=None, keep_events=True, memory=False):
+        self.callback = callback
+        self.keep_events = keep_events
+        self.memory = memory
+        self.events = []
+
+        # [traced memory at start, max peak of nested stages]
+        # for each active stage, None if the peak can't be measured
+        self._memory_stack = []
+        self._started_tracing = False
+
+        # traced memory dropped by restarting tracing, so traced
+        # values of different restarts can be compared
+        self._offset = 0
+
+    def emit(self, event):
+        """
+        Emits an event.
+
+        Parameters
+        ----------
+        event : dict
+        """
+
+        if self.keep_events:
+            self.events.append(event)
+
+        if self.callback is not None:
+            self.callback(event)
+
+    def stage(self, name, rows_in=None):
+        """
+        Creates a stage context manager.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+
+        rows_in : int
+            Number of input rows. Default is None.
+
+        Returns
+        -------
+        Stage
+            The output row count can be set through `Stage.rows_out`
+            before the context exits.
+        """
+
+        return Stage(self, name, rows_in=rows_in)
+
+    def stop_events(self, name=None):
+        """
+        Gets the recorded stop events.
+
+        Parameters
+        ----------
+        name : str
+            If not None, only events of the given stage are returned.
+            Default is None.
+
+        Returns
+        -------
+        list
+            List of stop events in the order of completion.
+        """
+
+        return [e for e in self.events
+                if e['event'] == 'stop' and
+                (name is None or e['stage'] == name)]
+
+    def report(self):
+        """
+        Summarizes the recorded stop events.
+
+        Returns
+        -------
+        DataFrame
+            One row per stop event (in the order of completion) with
+            'stage', 'rows_in', 'rows_out', 'wall' and 'cpu' columns.
+            In memory mode, 'peak_traced' and 'rss_delta' columns
+            are also included.
+        """
+
+        columns = ['stage', 'rows_in', 'rows_out', 'wall', 'cpu']
+        if self.memory:
+            columns.extend(['peak_traced', 'rss_delta'])
+
+        return pd.DataFrame(self.stop_events(), columns=columns)
+
+    def close(self):
+        """
+        Stops tracing allocations if it was started by this instrument.
+        """
+
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _traced_memory(self):
+        current, peak = tracemalloc.get_traced_memory()
+        return self._offset + current, self._offset + peak
+
+    def _start_memory(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+            self._offset = 0
+
+        current, peak = self._traced_memory()
+
+        # the enclosing stage would lose its peak on reset
+        if len(self._memory_stack) > 0:
+            parent = self._memory_stack[-1]
+            if parent is not None:
+                parent[1] = max(parent[1], peak)
+
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+            self._memory_stack.append([current, 0])
+        elif self._started_tracing:
+            tracemalloc.stop()
+            tracemalloc.start()
+            self._offset = current
+            self._memory_stack.append([current, 0])
+        else:
+            self._memory_stack.append(None)
+
+        return _current_rss()
+
+    def _stop_memory(self, rss):
+        _, peak = self._traced_memory()
+        entry = self._memory_stack.pop()
+
+        if entry is None:
+            peak_traced = None
+        else:
+            start, nested_peak = entry
+            peak = max(peak, nested_peak)
+            peak_traced = max(peak - start, 0)
+
+            if len(self._memory_stack) > 0:
+                parent = self._memory_stack[-1]
+                if parent is not None:
+                    parent[1] = max(parent[1], peak)
+
+        rss_end = _current_rss()
+        if rss is None or rss_end is None:
+            rss_delta = None
+        else:
+            rss_delta = rss_end - rss
+
+        return {'peak_traced': peak_traced,
+                'rss_delta': rss_delta}
+
+
+class Stage(object):
+    """
+    Context manager timing a single stage.
+
+    See `Instrument.stage`.
+    """
+
+    def __init__(self, instrument, name, rows_in=None):
+        self.instrument = instrument
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+
+    def __enter__(self):
+        self.instrument.emit({'stage': self.name,
+                              'event': 'start',
+                              'time': time.time(),
+                              'rows_in': self.rows_in})
+
+        if self.instrument.memory:
+            self._rss = self.instrument._start_memory()
+
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+
+        event = {'stage': self.name,
+                 'event': 'stop',
+                 'time': time.time(),
+                 'rows_in': self.rows_in,
+                 'rows_out': self.rows_out,
+                 'wall': wall,
+                 'cpu': cpu,
+                 'error': None if exc_type is None else exc_type.__name__}
+
+        if self.instrument.memory:
+            event.update(self.instrument._stop_memory(self._rss))
+
+        self.instrument.emit(event)
+
+        # do not suppress exceptions
+        return False
+
+
+class _NullStage(object):
+    """
+    No-op replacement for `Stage` when instrumentation is disabled.
+    """
+
+    def __init__(self):
+        self.rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+def _current_rss():
+    """
+    Gets the resident set size of the current process.
+
+    Returns
+    -------
+    int
+        RSS in bytes, or None if it cannot be read (it is
+        read from /proc, so only available on Linux).
+    """
+
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def stage(instrument, name, rows_in=None):
+    """
+    Creates a stage context manager for an optional instrument.
+
+    Parameters
+    ----------
+    instrument : Instrument or None
+        If None, a no-op context manager is returned.
+
+    name : str
+        Name of the stage.
+
+    rows_in : int
+        Number of input rows. Default is None.
+
+    Returns
+    -------
+    Stage or _NullStage
+    """
+
+    if instrument is None:
+        return _NullStage()
+
+    return instrument.stage(name, rows_in=rows_in)
+
+
+class JsonLinesWriter(object):
+    """
+    Instrument callback writing events as JSON lines.
+
+    Parameters
+    ----------
+    f : file object
+        A text file opened for writing. Every event is written
+        as a single JSON object followed by a newline.
+    """
+
+    def __init__(self, f):
+        self.f = f
+
+    def __call__(self, event):
+        self.f.write(json.dumps(event, sort_keys=True))
+        self.f.write('\n')
+        self.f.flush()
@@ -8,25 +8,36 @@
     :copyright: (c) 2016 by Saeed Abdullah.
 """
 
-import argparse
+import itertools
 import json
 import math
+import os
 
 from copy import deepcopy
 from collections import Counter
-from geopy.distance import vincenty
-import networkx as nx
 
-from geopy import distance, point
+# networkx and argparse are imported by the functions
+# using them, so importing this module stays cheap
 import geohash
 import pandas as pd
 import numpy as np
 
+from location import cluster
+from location import compress
+from location import counters
+from location import epoch
+from location import geodesic
+from location import instrument as instrumentation
+from location import spatial
+from location.context import ParticipantContext
+
 
 def convert_time_zone(df, column_name=None,
                       should_localize='UTC',
                       sort_index=True,
-                      to_timezone='America/New_York'):
+                      to_timezone='America/New_York',
+                      time_format=None,
+                      timezone_column=None):
     """
     Performs timezone conversion.
 
@@ -35,6 +46,14 @@ def convert_time_zone(df, column_name=None,
         1. Convert timezone of the given column (or index).
         2. And, create a DataFrame with the converted timestamps as index.
 
+    If `timezone_column` is given, every row is converted to its own
+    timezone. Since a DatetimeIndex can only have a single timezone,
+    the resulting index contains naive local (wall clock) times in
+    that case, so traces crossing timezones are binned by local time.
+    Stay durations are measured on the index, so local times must not
+    go back: travelling westwards (e.g., 19:00 in New York followed by
+    17:00 in Los Angeles) raises a ValueError.
+
     Parameters
     ----------
 
@@ -48,6 +67,9 @@ def convert_time_zone(df, column_name=None,
     sort_index: bool
         If the index of the resulting DataFrame
         should be sorted ascending order. Default is `True`.
+        The sort is skipped if the index is already sorted.
+        With `timezone_column`, rows are sorted by their UTC time
+        before the conversion.
 
     should_localize: str
         If the index should be localized to a specific time zone.
@@ -57,6 +79,18 @@ def convert_time_zone(df, column_name=None,
 
     to_timezone : str
         The destination timezone. Default is America/New_York.
+        If `timezone_column` is given, it is only used for rows
+        without a timezone.
+
+    time_format : str
+        The strftime format of the values in `column_name`
+        (e.g., '%Y-%m-%d %H:%M:%S'). Parsing with a known format
+        is much faster than inferring it. Default is None.
+
+    timezone_column : str
+        Column with the destination timezone of each row. Default is
+        None, in that case all rows are converted to `to_timezone`.
+        Raises ValueError if the local times are not monotonic.
 
 
     Returns
@@ -66,15 +100,37 @@ def convert_time_zone(df, column_name=None,
     """
 
     if column_name is not None:
-        df = df.set_index(pd.to_datetime(df[column_name]))
+        df = df.set_index(pd.to_datetime(df[column_name],
+                                         format=time_format))
 
-    if sort_index:
+    if sort_index and not df.index.is_monotonic_increasing:
         df = df.sort_index()
 
     if should_localize is not None:
         df = df.tz_localize(should_localize)
 
-    return df.tz_convert(to_timezone)
+    if timezone_column is None:
+        return df.tz_convert(to_timezone)
+
+    # UTC epoch nanoseconds
+    utc = df.index.tz_convert('UTC').asi8
+    local = np.empty(len(utc), dtype=np.int64)
+
+    timezones = df[timezone_column].fillna(to_timezone).values
+    groups = pd.Series(timezones).groupby(timezones).indices
+    for tz, positions in groups.items():
+        converted = pd.DatetimeIndex(utc[positions]).tz_localize('UTC')
+        local[positions] = converted.tz_convert(tz).tz_localize(None).asi8
+
+    if (np.diff(local) < 0).any():
+        raise ValueError('local times in {0} go back, convert the trace '
+                         'to a single timezone instead'.format(
+                             timezone_column))
+
+    df = df.copy()
+    df.index = pd.DatetimeIndex(local, name=df.index.name)
+
+    return df
 
 
 def get_df_slices(df, sorted_slices):
@@ -117,8 +173,23 @@ def get_df_slices(df, sorted_slices):
         Slice elements must be sorted (ascending) and comparable
         against index of DataFrame.
 
+        For a DateTimeIndex, the comparison is done on int64
+        epoch nanoseconds.
+
     """
 
+    if isinstance(df.index, pd.DatetimeIndex):
+        values, _ = epoch.to_epoch(df.index)
+        bounds, _ = epoch.to_epoch(sorted_slices)
+
+        for index in range(0, len(bounds) - 1):
+            s = bounds[index]
+            e = bounds[index + 1]
+
+            yield df.loc[(values >= s) & (values < e)]
+
+        return
+
     for index in range(0, len(sorted_slices) - 1):
         s = sorted_slices[index]
         e = sorted_slices[index + 1]
@@ -168,6 +239,7 @@ def compute_geo_hash(df, lat_c='lat',
                            precision=precision)
         l.append(g)
 
+    counters.add('geohash_encode', len(l))
     return l
 
 
@@ -526,7 +598,8 @@ def get_geo_center(df, lat_c='latitude', lon_c='longitude'):
 
 def get_stay_point(df, lat_c='latitude',
                    lon_c='longitude', dist_th=300,
-                   time_th='30m'):
+                   time_th='30m', collapsed=None, backend=None,
+                   fast=False):
     """
     Calculates stay points.
 
@@ -571,6 +644,24 @@ def get_stay_point(df, lat_c='latitude',
         Time threshold that will be parsed by pd.to_timedelta.
         Default is 30 minutes.
 
+    collapsed: DataFrame
+        Runs of nearby fixes in df (see `compress.collapse_runs`).
+        If given, a whole run is accepted (or rejected) with a single
+        distance evaluation to its representative when the run radius
+        makes the outcome certain (triangle inequality), otherwise its
+        fixes are evaluated one by one. So, the result is the same as
+        without runs. Default is None.
+
+    backend: str
+        Distance backend (see `geodesic`). Default is None, in that
+        case the global backend is used if set, haversine otherwise.
+
+    fast: bool
+        If true, following fixes are tested against the first member
+        in chunks with `geodesic.within`, which only computes distances
+        close to dist_th. The result is the same. It cannot be used
+        with `collapsed`. Default is False.
+
 
     Returns
     -------
@@ -585,38 +676,197 @@ def get_stay_point(df, lat_c='latitude',
     [1]: https://dl.acm.org/citation.cfm?id=1463477
     """
 
+    if fast:
+        if collapsed is not None:
+            raise ValueError('Fast mode cannot be used with collapsed runs')
+
+        runs = _fast_stay_point_runs(df, lat_c=lat_c, lon_c=lon_c,
+                                     dist_th=dist_th, backend=backend)
+    else:
+        runs = _stay_point_runs(df, lat_c=lat_c, lon_c=lon_c,
+                                dist_th=dist_th, collapsed=collapsed,
+                                backend=backend)
+
+    return _label_stay_points(runs, time_th)
+
+
+# margin (in meters) for run bounds, it covers rounding errors of the
+# triangle inequality (the law of cosines is imprecise for short
+# distances)
+_RUN_TOLERANCE = {'haversine': 1e-3, 'cosine': 1.0, 'vincenty': 1e-3}
+
+
+def _stay_point_runs(df, lat_c, lon_c, dist_th, collapsed=None,
+                     backend=None):
+    """
+    Segments points into greedy in-radius runs, see `get_stay_point`.
+
+    The segmentation only depends on the distance threshold, the
+    time threshold only decides which runs are stay points.
+
+    Returns
+    -------
+    list
+        A list of (start, end, duration) tuples covering all rows in
+        order, where rows start <= i < end are in the same run and
+        duration is the time between the first and last member of
+        the run in nanoseconds.
+    """
+
+    backend = geodesic.get_backend(backend, default='haversine')
+    kernel = geodesic.get_kernel(backend)
+
     index = 0
-    stay_points_c = 0  # total stay points count
-    stay_points = []
+    runs = []
+    n_dist = 0  # number of distance evaluations
 
     max_len = len(df)
-    time_th = pd.to_timedelta(time_th)
+
+    # epoch nanoseconds
+    times, _ = epoch.to_epoch(df.index)
+    lats = df[lat_c].values.astype(float)
+    lons = df[lon_c].values.astype(float)
+
+    if collapsed is not None:
+        weight = collapsed['weight'].values
+        first = collapsed['first'].values
+        run_of = np.repeat(np.arange(len(collapsed)), weight)
+        run_end = first + weight
+        run_lats = collapsed[lat_c].values.astype(float)
+        run_lons = collapsed[lon_c].values.astype(float)
+
+        # run radius measured with the kernel in use
+        d = kernel(run_lats[run_of], run_lons[run_of], lats, lons)
+        run_radius = (np.maximum.reduceat(d, first) +
+                      _RUN_TOLERANCE[backend])
 
     while index < max_len:
         mem_c = 1  # current stay point members: just index
 
         # time diff between current and first members
-        time_diff = pd.to_timedelta('0s')
+        time_diff = 0
 
-        p_f = point.Point(latitude=df.iloc[index][lat_c],
-                          longitude=df.iloc[index][lon_c])
+        lat_f = lats[index]
+        lon_f = lons[index]
 
-        time_f = df.index[index]
+        time_f = times[index]
 
         j = index + 1
+        ambiguous = -1  # run whose fixes are evaluated one by one
         while j < max_len:
-            p_s = point.Point(latitude=df.iloc[j][lat_c],
-                              longitude=df.iloc[j][lon_c])
-
-            d = distance.GreatCircleDistance(p_f, p_s).m
+            if (collapsed is not None and run_of[j] != ambiguous and
+                    run_end[run_of[j]] - j > 1):
+                r = run_of[j]
+                d = kernel(lat_f, lon_f, run_lats[r], run_lons[r])
+                n_dist += 1
+
+                if d + run_radius[r] <= dist_th:
+                    # all remaining members of the run are within
+                    mem_c += run_end[r] - j
+                    time_diff = times[run_end[r] - 1] - time_f
+                    j = run_end[r]
+                    continue
+
+                if d - run_radius[r] > dist_th:
+                    # none of them are
+                    break
+
+                ambiguous = r
+
+            d = kernel(lat_f, lon_f, lats[j], lons[j])
+            n_dist += 1
             if d <= dist_th:
                 mem_c += 1  # new member
-                time_diff = df.index[j] - time_f  # update total time spent
+                time_diff = times[j] - time_f  # update total time spent
                 j += 1
             else:
                 # spatial constrain is not met
                 break
 
+        runs.append((index, index + mem_c, time_diff))
+
+        # points up to j has been considered
+        index = j
+
+    counters.add('stay_point_distance', n_dist)
+    return runs
+
+
+# number of fixes first tested against a run start in fast mode,
+# doubled for each following chunk
+_FAST_CHUNK_SIZE = 8
+
+
+def _fast_stay_point_runs(df, lat_c, lon_c, dist_th, backend=None):
+    """
+    Same as `_stay_point_runs`, testing fixes in chunks with
+    `geodesic.within`.
+    """
+
+    backend = geodesic.get_backend(backend, default='haversine')
+
+    times, _ = epoch.to_epoch(df.index)
+    lats = df[lat_c].values.astype(float)
+    lons = df[lon_c].values.astype(float)
+    max_len = len(df)
+
+    index = 0
+    runs = []
+    n_dist = 0  # number of exact distance evaluations
+
+    while index < max_len:
+        j = index + 1
+        size = _FAST_CHUNK_SIZE
+        while j < max_len:
+            end = min(j + size, max_len)
+            inside, n = geodesic.within(lats[index], lons[index],
+                                        lats[j:end], lons[j:end],
+                                        dist_th, backend=backend,
+                                        return_evaluations=True)
+            n_dist += n
+
+            outside = np.flatnonzero(~inside)
+            if len(outside) > 0:
+                j += outside[0]
+                break
+
+            j = end
+            size *= 2
+
+        runs.append((index, j, times[j - 1] - times[index]))
+
+        # points up to j has been considered
+        index = j
+
+    counters.add('stay_point_distance', n_dist)
+    return runs
+
+
+def _label_stay_points(runs, time_th):
+    """
+    Assigns stay point ids to runs from `_stay_point_runs`.
+
+    Parameters
+    ----------
+    runs : list
+        Runs returned by `_stay_point_runs`.
+
+    time_th : str or pd.timedelta
+        Time threshold, see `get_stay_point`.
+
+    Returns
+    -------
+    stay_points : list
+        See `get_stay_point`.
+    """
+
+    time_th = pd.to_timedelta(time_th).value
+    stay_points_c = 0  # total stay points count
+    stay_points = []
+
+    for start, end, time_diff in runs:
+        mem_c = end - start
+
         # Check if previous points met the time threshold constraint
         if time_diff >= time_th:
             # All these points share same stay point id
@@ -626,9 +876,6 @@ def get_stay_point(df, lat_c='latitude',
             # these are not valid stay points
             stay_points.extend([np.nan] * mem_c)
 
-        # points up to j has been considered
-        index = j
-
     return stay_points
 
 
@@ -672,7 +919,28 @@ def merge_neighboring_grid(geo_hash):
     """
 
     c = Counter(geo_hash.dropna())
+    return geo_hash.map(_merge_grids(c))
+
+
+def _merge_grids(c):
+    """
+    Merges neighboring grids, see `merge_neighboring_grid`.
+
+    Parameters
+    ----------
+    c : Counter
+        Frequency of each grid. Grids with same frequency are
+        visited in insertion order.
+
+    Returns
+    -------
+    dict
+        Maps each grid to its merged grid.
+    """
+
+    c = Counter(c)
     d = {}
+    n_grids = 0  # number of merged grids
 
     # sort by frequency
     for z, _ in c.most_common():
@@ -680,6 +948,7 @@ def merge_neighboring_grid(geo_hash):
         # items dynamically
         if z in c:
             d[z] = z
+            n_grids += 1
 
             # go through the potential merge options
             for n in geohash.neighbors(z):
@@ -687,7 +956,8 @@ def merge_neighboring_grid(geo_hash):
                     d[n] = z
                     del c[n]  # merged with grid z
 
-    return geo_hash.map(d)
+    counters.add('geohash_neighbors', n_grids)
+    return d
 
 
 def get_stay_region(df, stay_point_c='stay_point',
@@ -730,6 +1000,28 @@ def get_stay_region(df, stay_point_c='stay_point',
         is defined by a geohash value.
     """
 
+    centers = _stay_point_centers(df, stay_point_c=stay_point_c,
+                                  lat_c=lat_c, lon_c=lon_c,
+                                  precision=precision)
+
+    # associate same stay point centers
+    # to each record
+    stay_points = df[stay_point_c].map(centers)
+
+    # now convert the stay points to stay regions
+    return merge_neighboring_grid(stay_points)
+
+
+def _stay_point_centers(df, stay_point_c, lat_c, lon_c, precision):
+    """
+    Computes geohash values of stay point centers.
+
+    Returns
+    -------
+    dict
+        Maps stay point ids to geohash values.
+    """
+
     centers = {}
     for k, v in df.groupby(stay_point_c):
         # get stay point centers
@@ -741,12 +1033,65 @@ def get_stay_region(df, stay_point_c='stay_point',
                            precision=precision)
         centers[k] = h
 
-    # associate same stay point centers
-    # to each record
-    stay_points = df[stay_point_c].map(centers)
+    counters.add('geohash_encode', len(centers))
+    return centers
 
-    # now convert the stay points to stay regions
-    return merge_neighboring_grid(stay_points)
+
+def get_stay_regions(df, precisions=(6, 7, 8),
+                     stay_point_c='stay_point',
+                     lat_c='latitude', lon_c='longitude'):
+    """
+    Calculates stay regions for several precisions at once.
+
+    The result for each precision is the same as calling
+    `get_stay_region` with that precision. However, stay point
+    centers are computed and encoded only once (at the maximum
+    precision), the geohash of a lower precision being a prefix
+    of it. Neighboring grids are then merged per precision on the
+    unique grids instead of the rows.
+
+    Parameters
+    ----------
+    df : DataFrame
+
+    precisions : iterables
+        Geo hash precisions. Default is (6, 7, 8).
+
+    stay_point_c, lat_c, lon_c : str
+        See `get_stay_region`.
+
+    Returns
+    -------
+    DataFrame
+        It has the same index as `df` and a column of stay
+        regions for each precision (the column name is the
+        precision).
+    """
+
+    precisions = list(precisions)
+    centers = _stay_point_centers(df, stay_point_c=stay_point_c,
+                                  lat_c=lat_c, lon_c=lon_c,
+                                  precision=max(precisions))
+
+    # unique grids in order of first appearance, same order
+    # as the Counter in merge_neighboring_grid
+    codes, cells = pd.factorize(df[stay_point_c].map(centers))
+    counts = np.bincount(codes[codes >= 0], minlength=len(cells))
+
+    regions = pd.DataFrame(index=df.index, columns=precisions)
+    for precision in precisions:
+        c = Counter()
+        for cell, n in zip(cells, counts):
+            c[cell[:precision]] += n
+
+        d = _merge_grids(c)
+        merged = np.array([d[cell[:precision]] for cell in cells] +
+                          [np.nan], dtype=object)
+
+        # missing values have -1 code, i.e., the last item
+        regions[precision] = merged[codes]
+
+    return regions
 
 
 def _save_nodes(nodes, path):
@@ -835,19 +1180,16 @@ def _load_nodes(path, convert_tz=True, target_tz=None):
 
         # converting to datetime
         if convert_tz:
-            nodes.time = pd.to_datetime(nodes.time)
-
-            # convert to utc
-            nodes.time = nodes.time.map(lambda z: z.tz_localize('utc'))
-
             # timezone information
             if target_tz is None:
                 tz_c = tz
             else:
                 tz_c = target_tz
 
-            # convert to target timezone
-            nodes.time = nodes.time.map(lambda z: z.tz_convert(tz_c))
+            # saved times are in utc
+            ns, _ = epoch.to_epoch(pd.to_datetime(nodes.time))
+            nodes.time = pd.Series(epoch.to_timestamps(ns, tz_c),
+                                   index=nodes.index)
 
         l.append((timestamp, nodes))
 
@@ -862,7 +1204,11 @@ def compute_nodes(df,
                   node_args=None,
                   daily_args=None,
                   stay_info_output=None,
-                  node_output=None):
+                  node_output=None,
+                  instrument=None,
+                  engine='greedy',
+                  compression=None,
+                  compression_args=None):
     """
     Utility function for generating location motif
 
@@ -875,8 +1221,9 @@ def compute_nodes(df,
     lat_c : str
         Column containing latitude values. Default is `latitude`.
     stay_point_args : dict
-        Arguments to pass to `get_stay_point`. Default is `None`,
-        default parameters will be used in that case.
+        Arguments to pass to `get_stay_point` (or the function of the
+        selected `engine`). Default is `None`, default parameters
+        will be used in that case.
     stay_region_args : dict
         Arguments to pass to `get_stay_region`. Default is `None`,
         default parameters will be used in that case.
@@ -893,6 +1240,25 @@ def compute_nodes(df,
     node_output : Path
         The output path to save generated daily nodes. Default is `None`,
         no output will be saved in that case.
+    instrument : location.instrument.Instrument
+        Receives start/stop events for 'prepare', 'compress' (if
+        `compression` is given), 'stay_point', 'stay_region' and
+        'daily_nodes' stages (and 'compute_nodes' as a whole).
+        Default is `None`, no events are emitted in that case.
+    engine : str
+        Stay point detection method. Either 'greedy' (`get_stay_point`)
+        or 'st_dbscan' (`location.cluster.st_dbscan`). Default is
+        'greedy'.
+    compression : str
+        Trajectory compression before stay point detection, one of
+        'collapse', 'decimate' and 'douglas_peucker' (see
+        `location.compress`). 'collapse' requires the greedy engine and
+        does not change the result. The other strategies drop rows, so
+        the returned data frame only has the kept rows. Default is
+        `None`, no compression is performed in that case.
+    compression_args : dict
+        Arguments to pass to the compression function. Default is
+        `None`, default parameters will be used in that case.
 
     Returns
     -------
@@ -913,32 +1279,88 @@ def compute_nodes(df,
     if daily_args is None:
         daily_args = {}
 
-    df = df.loc[:, [lon_c, lat_c]].copy()
-    df['stay_point'] = get_stay_point(df,
-                                      lon_c=lon_c,
-                                      lat_c=lat_c,
-                                      **stay_point_args)
-    df['stay_region'] = get_stay_region(df,
-                                        lon_c=lon_c,
-                                        lat_c=lat_c,
-                                        **stay_region_args)
-
-    nodes = generate_daily_nodes(df.dropna(subset=['stay_region']),
-                                 hash_c='stay_region',
-                                 node_args=node_args,
-                                 **daily_args)
-
-    if stay_info_output is not None:
-        df.to_csv(stay_info_output)
-
-    if node_output is not None:
-        _save_nodes(nodes, node_output)
+    if engine == 'greedy':
+        stay_point_f = get_stay_point
+    elif engine == 'st_dbscan':
+        stay_point_f = cluster.st_dbscan
+    else:
+        raise ValueError('Engine {0} is not supported'.format(engine))
+
+    if compression_args is None:
+        compression_args = {}
+
+    if compression not in (None, 'collapse', 'decimate', 'douglas_peucker'):
+        err = 'Compression {0} is not supported'
+        raise ValueError(err.format(compression))
+
+    if compression == 'collapse' and engine != 'greedy':
+        raise ValueError('Collapse compression requires the greedy engine')
+
+    with instrumentation.stage(instrument, 'compute_nodes',
+                               rows_in=len(df)) as total:
+        with instrumentation.stage(instrument, 'prepare',
+                                   rows_in=len(df)) as s:
+            df = df.loc[:, [lon_c, lat_c]].copy()
+            s.rows_out = len(df)
+
+        if compression is not None:
+            with instrumentation.stage(instrument, 'compress',
+                                       rows_in=len(df)) as s:
+                if compression == 'collapse':
+                    collapsed = compress.collapse_runs(df, lon_c=lon_c,
+                                                       lat_c=lat_c,
+                                                       **compression_args)
+                    stay_point_args = dict(stay_point_args,
+                                           collapsed=collapsed)
+                    s.rows_out = len(collapsed)
+                elif compression == 'decimate':
+                    df = compress.decimate(df, **compression_args)
+                    s.rows_out = len(df)
+                else:
+                    df = compress.douglas_peucker(df, lon_c=lon_c,
+                                                  lat_c=lat_c,
+                                                  **compression_args)
+                    s.rows_out = len(df)
+
+        with instrumentation.stage(instrument, 'stay_point',
+                                   rows_in=len(df)) as s:
+            df['stay_point'] = stay_point_f(df,
+                                            lon_c=lon_c,
+                                            lat_c=lat_c,
+                                            **stay_point_args)
+            s.rows_out = int(df['stay_point'].notnull().sum())
+
+        with instrumentation.stage(instrument, 'stay_region',
+                                   rows_in=len(df)) as s:
+            df['stay_region'] = get_stay_region(df,
+                                                lon_c=lon_c,
+                                                lat_c=lat_c,
+                                                **stay_region_args)
+            s.rows_out = int(df['stay_region'].notnull().sum())
+
+        stay = df.dropna(subset=['stay_region'])
+        with instrumentation.stage(instrument, 'daily_nodes',
+                                   rows_in=len(stay)) as s:
+            nodes = generate_daily_nodes(stay,
+                                         hash_c='stay_region',
+                                         node_args=node_args,
+                                         **daily_args)
+            s.rows_out = len(nodes)
+
+        if stay_info_output is not None:
+            df.to_csv(stay_info_output)
+
+        if node_output is not None:
+            _save_nodes(nodes, node_output)
+
+        total.rows_out = len(nodes)
 
     return df, nodes
 
 
 def filter_inadequate_nodes(nodes,
-                            valid_time_slot=8):
+                            valid_time_slot=8,
+                            instrument=None):
     """
     Discard nodes whose valid time slot is lower
     than the given threshold.
@@ -952,19 +1374,27 @@ def filter_inadequate_nodes(nodes,
         Valid time slot thresold required to compute daily motifs.
         Defualt is 8 intervals.
 
+    instrument: location.instrument.Instrument
+        Receives start/stop events for this step.
+        Default is None, no events are emitted in that case.
+
     Return:
     filtered_nodes: tuple
         Filtered nodes.
     """
-    filtered_nodes = []
-    for node in nodes:
-        if len(node[1].node.dropna()) >= valid_time_slot:
-            filtered_nodes.append(node)
+    with instrumentation.stage(instrument, 'filter_inadequate_nodes',
+                               rows_in=len(nodes)) as s:
+        filtered_nodes = []
+        for node in nodes:
+            if len(node[1].node.dropna()) >= valid_time_slot:
+                filtered_nodes.append(node)
+
+        s.rows_out = len(filtered_nodes)
 
     return filtered_nodes
 
 
-def get_home_location(loc_data, sr_col='stay_region'):
+def get_home_location(loc_data, sr_col='stay_region', context=None):
     """
     Get the home location based on the assumption that
     the most frequently visited location from
@@ -980,16 +1410,47 @@ def get_home_location(loc_data, sr_col='stay_region'):
         Column name for stay region.
         Default is 'stay_region'.
 
+    context: location.context.ParticipantContext
+        If given, its (cached) home location is returned.
+        Default is None.
+
     Returns:
     ---------
     home: str
         Home location in geohash form.
         None if there is no data from 0:00 to 6:00.
     """
-    night_hr = list(range(6))
-    loc_data = loc_data.dropna()
-    criterion = loc_data.index.map(lambda z: z.hour in night_hr).get_values()
-    night_locs = loc_data[criterion]
+    if context is not None:
+        return context.home
+
+    hours = epoch.hour_of_day(epoch.local_epoch(loc_data.index))
+    return _home_location(loc_data, hours, sr_col=sr_col)
+
+
+def _home_location(loc_data, hours, sr_col='stay_region'):
+    """
+    Computes the home location, see `get_home_location`.
+
+    Parameters:
+    -----------
+    loc_data: DataFrame
+        Location data.
+
+    hours: iterables
+        Hour of the day for each row of `loc_data`.
+
+    sr_col: str
+        Column name for stay region.
+
+    Returns:
+    ---------
+    home: str
+        Home location in geohash form or None.
+    """
+    # rows with missing values are not considered
+    criterion = loc_data.notnull().all(axis=1).values
+    criterion &= np.asarray(hours) < 6
+    night_locs = loc_data.loc[criterion]
 
     # if no home location is detected,
     # do not insert home location.
@@ -1003,7 +1464,10 @@ def get_home_location(loc_data, sr_col='stay_region'):
 def insert_home_location(data,
                          nodes,
                          sr_col='stay_region',
-                         home=None):
+                         home=None,
+                         instrument=None,
+                         context=None,
+                         copy=True):
     """
     Insert home location to the start of the
     day if the first time slot of that day
@@ -1033,28 +1497,66 @@ def insert_home_location(data,
         Default is None. In this case, home locatoin is approximated using
         user location data.
 
+    instrument: location.instrument.Instrument
+        Receives start/stop events for this step.
+        Default is None, no events are emitted in that case.
+
+    context: location.context.ParticipantContext
+        Cached values of the participant. If given, the home location
+        and decoded regions are taken from it. Default is None.
+
+    copy: bool
+        Whether to deep copy all the given nodes. If false, the returned
+        list shares the DataFrames of days whose first time slot is not
+        missing with the given nodes, and only the days receiving
+        the home location are copied. So, the given nodes are never
+        modified but the memory footprint depends on the number of
+        updated days rather than on the total number of nodes.
+        Default is True.
+
     Returns:
     --------
     filtered_nodes: tuple
         Filtered nodes.
     """
-    filtered_nodes = deepcopy(nodes)
+    with instrumentation.stage(instrument, 'insert_home_location',
+                               rows_in=len(nodes)) as s:
+        # find the home location
+        if home is None:
+            home = get_home_location(data, sr_col=sr_col, context=context)
+
+        if copy:
+            filtered_nodes = deepcopy(nodes)
+
+            for node in filtered_nodes:
+                # if the first time slot is missing,
+                # insert home location
+                if pd.isnull(node[1].ix[0, 'node']):
+                    node[1].ix[0, 'node'] = home
+        elif home is None:
+            # nothing to insert
+            filtered_nodes = list(nodes)
+        else:
+            filtered_nodes = []
+
+            for node in nodes:
+                d = node[1]
+                if pd.isnull(d.ix[0, 'node']):
+                    # only the updated day is copied
+                    d = d.copy()
+                    d.ix[0, 'node'] = home
+                    node = (node[0], d)
 
-    # find the home location
-    if home is None:
-        home = get_home_location(data)
+                filtered_nodes.append(node)
 
-    for node in filtered_nodes:
-        # if the first time slot is missing,
-        # insert home location
-        if pd.isnull(node[1].ix[0, 'node']):
-            node[1].ix[0, 'node'] = home
+        s.rows_out = len(filtered_nodes)
 
     return filtered_nodes
 
 
 def filter_days_without_round_trip(nodes,
-                                   sr_col='stay_region'):
+                                   sr_col='stay_region',
+                                   instrument=None):
     """
     Select daily nodes that start and end at the same location.
 
@@ -1067,22 +1569,31 @@ def filter_days_without_round_trip(nodes,
         Column name for stay region.
         Default is 'stay_region'.
 
+    instrument: location.instrument.Instrument
+        Receives start/stop events for this step.
+        Default is None, no events are emitted in that case.
+
     Returns:
     --------
     filtered_nodes: tuple
         Filtered nodes.
     """
-    filtered_nodes = []
-    for node in nodes:
-        list_nodes = node[1].node.dropna()
-        if list_nodes.iloc[0] == list_nodes.iloc[-1]:
-            filtered_nodes.append(node)
+    with instrumentation.stage(instrument, 'filter_days_without_round_trip',
+                               rows_in=len(nodes)) as s:
+        filtered_nodes = []
+        for node in nodes:
+            list_nodes = node[1].node.dropna()
+            if list_nodes.iloc[0] == list_nodes.iloc[-1]:
+                filtered_nodes.append(node)
+
+        s.rows_out = len(filtered_nodes)
 
     return filtered_nodes
 
 
 def filter_weekday(nodes,
-                   dayofweek=[0, 1, 2, 3, 4]):
+                   dayofweek=[0, 1, 2, 3, 4],
+                   instrument=None):
     """
     Select given weekdays.
 
@@ -1096,15 +1607,23 @@ def filter_weekday(nodes,
         Mon, Tue, Wed, Thurs, Fri, Sat, and Sun.
         Defualt is [0,1,2,3,4].
 
+    instrument: location.instrument.Instrument
+        Receives start/stop events for this step.
+        Default is None, no events are emitted in that case.
+
     Returns:
     --------
     filtered_nodes: tuple
         Filtered nodes.
     """
-    filtered_nodes = []
-    for node in nodes:
-        if node[0].weekday() in dayofweek:
-            filtered_nodes.append(node)
+    with instrumentation.stage(instrument, 'filter_weekday',
+                               rows_in=len(nodes)) as s:
+        filtered_nodes = []
+        for node in nodes:
+            if node[0].weekday() in dayofweek:
+                filtered_nodes.append(node)
+
+        s.rows_out = len(filtered_nodes)
 
     return filtered_nodes
 
@@ -1113,7 +1632,11 @@ def filter_out_travelling_day(data,
                               nodes,
                               sr_col='stay_region',
                               home=None,
-                              trav_dist_th=50000):
+                              trav_dist_th=50000,
+                              instrument=None,
+                              context=None,
+                              pruned=False,
+                              backend=None):
     """
     Filter out days that includes trips longer than the
     specified threshold.
@@ -1139,33 +1662,654 @@ def filter_out_travelling_day(data,
         Travel distance threshold used to filter out days on which the user
         travels to other cities. Default is 50,000 meters (about 31 miles).
 
+    instrument: location.instrument.Instrument
+        Receives start/stop events for this step.
+        Default is None, no events are emitted in that case.
+
+    context: location.context.ParticipantContext
+        Cached values of the participant. If given, the home location,
+        decoded regions and distances from home are taken from it.
+        Default is None.
+
+    pruned: bool
+        If true, the distance from home is computed once per distinct
+        region (instead of once per region per day), and regions sharing
+        a long enough geohash prefix with home are accepted without
+        computing any distance. See `get_far_regions`. The result is
+        the same as the default mode. Default is False.
+
+    backend: str
+        Distance backend (see `geodesic`). Default is None, in that
+        case the global backend is used if set, Vincenty otherwise.
+
     Returns:
     --------
     filtered_nodes: tuple
         Filtered nodes.
     """
-    filtered_nodes = []
+    with instrumentation.stage(instrument, 'filter_out_travelling_day',
+                               rows_in=len(nodes)) as s:
+        filtered_nodes = []
+
+        if context is None:
+            context = ParticipantContext(data, sr_col=sr_col)
+
+        # find the home location
+        if home is None:
+            home = context.home
+
+        if pruned:
+            regions = set()
+            for node in nodes:
+                regions.update(node[1]['node'].dropna())
+
+            far = get_far_regions(regions, home, trav_dist_th,
+                                  context=context, backend=backend)
+            filtered_nodes = [node for node in nodes
+                              if not node[1]['node'].isin(far).any()]
+        else:
+            for node in nodes:
+                visited = np.unique(node[1]['node'].dropna())
+                dist_list = context.distances(visited, [home] * len(visited),
+                                              backend=backend)
+                if np.all(dist_list <= trav_dist_th):
+                    filtered_nodes.append(node)
 
-    # find the home location
-    if home is None:
-        home = get_home_location(data)
+        s.rows_out = len(filtered_nodes)
 
-    for node in nodes:
-        different_visited_locations = np.unique(node[1]['node'].dropna())
-        dist_list = [vincenty(geohash.decode(x), geohash.decode(home)).m
-                     for x in different_visited_locations]
-        if all(d <= trav_dist_th for d in dist_list):
-            filtered_nodes.append(node)
+    return filtered_nodes
+
+
+def get_node_matrix(nodes):
+    """
+    Converts daily nodes into a days x slots matrix of region codes.
+
+    Parameters:
+    -----------
+    nodes: list
+        Nodes generated by generate_daily_nodes(). Days without
+        nodes (i.e., np.nan instead of a DataFrame) are kept as rows
+        without any valid slot.
+
+    Returns:
+    --------
+    (timestamps, codes, regions): (list, ndarray, ndarray)
+        Timestamps of the days, an integer matrix with a row per day
+        and a column per time slot, and the regions corresponding to
+        the codes (i.e., regions[codes[i, j]] is the node of the j-th
+        slot of the i-th day). Missing nodes have -1 as code. Days with
+        fewer slots than the longest day are padded with -1.
+    """
+    timestamps = [n[0] for n in nodes]
+    columns = [n[1]['node'].values if isinstance(n[1], pd.DataFrame)
+               else np.empty(0, dtype=object) for n in nodes]
+
+    lengths = np.array([len(c) for c in columns], dtype=int)
+    n_slots = lengths.max() if len(lengths) > 0 else 0
+
+    if len(columns) > 0:
+        values = np.concatenate(columns).astype(object)
+    else:
+        values = np.empty(0, dtype=object)
+    labels, regions = pd.factorize(values)
+
+    codes = np.full((len(nodes), n_slots), -1, dtype=int)
+    mask = np.arange(n_slots) < lengths[:, None]
+    codes[mask] = labels
+
+    return timestamps, codes, np.asarray(regions, dtype=object)
+
+
+def filter_nodes(nodes,
+                 valid_time_slot=None,
+                 round_trip=False,
+                 dayofweek=None,
+                 trav_dist_th=None,
+                 data=None,
+                 sr_col='stay_region',
+                 home=None,
+                 instrument=None,
+                 context=None):
+    """
+    Selects days satisfying all the given criteria in one pass.
+
+    This is equivalent to chaining filter_inadequate_nodes(),
+    filter_days_without_round_trip(), filter_weekday() and
+    filter_out_travelling_day(pruned=True), but evaluates all the
+    criteria on a days x slots matrix (see get_node_matrix()) instead
+    of iterating over each day's DataFrame. Days without any node are
+    kept unless `valid_time_slot` is positive or `round_trip` is set
+    (filter_days_without_round_trip() can't handle them).
+
+    Parameters:
+    -----------
+    nodes: tuple
+        Nodes generated by generate_daily_nodes().
+
+    valid_time_slot: int
+        Minimum number of valid time slots. See filter_inadequate_nodes().
+        Default is None, no filtering happens in that case.
+
+    round_trip: bool
+        Whether to select only days starting and ending at the same
+        location. See filter_days_without_round_trip(). Default is False.
+
+    dayofweek: list of integers
+        Which days in a week to select. See filter_weekday().
+        Default is None, all days are selected in that case.
+
+    trav_dist_th: int
+        Maximum distance from home in meters. See
+        filter_out_travelling_day(). Default is None, no filtering
+        happens in that case.
+
+    data: DataFrame
+        Location data, used to find the home location if needed.
+
+    sr_col: str
+        Column name for stay region.
+        Default is 'stay_region'.
+
+    home: str
+        Home location in geohash form.
+        Default is None. In this case, home locatoin is approximated using
+        user location data.
+
+    instrument: location.instrument.Instrument
+        Receives start/stop events for this step.
+        Default is None, no events are emitted in that case.
+
+    context: location.context.ParticipantContext
+        Cached values of the participant. If given, the home location
+        and decoded regions are taken from it. Default is None.
+
+    Returns:
+    --------
+    filtered_nodes: tuple
+        Filtered nodes.
+    """
+    with instrumentation.stage(instrument, 'filter_nodes',
+                               rows_in=len(nodes)) as s:
+        timestamps, codes, regions = get_node_matrix(nodes)
+        valid = codes >= 0
+        n_valid = valid.sum(axis=1)
+
+        selected = np.ones(len(codes), dtype=bool)
+
+        if valid_time_slot is not None:
+            selected &= n_valid >= valid_time_slot
+
+        if round_trip:
+            # days without any node have no start or end location
+            selected &= n_valid > 0
+
+            if codes.shape[1] > 0:
+                rows = np.arange(len(codes))
+                first = codes[rows, valid.argmax(axis=1)]
+                last = codes[rows, codes.shape[1] - 1 -
+                             valid[:, ::-1].argmax(axis=1)]
+                selected &= first == last
+
+        if dayofweek is not None and len(timestamps) > 0:
+            weekdays = pd.DatetimeIndex(timestamps).weekday
+            selected &= np.in1d(weekdays, dayofweek)
+
+        if trav_dist_th is not None:
+            if context is None:
+                context = ParticipantContext(data, sr_col=sr_col)
+
+            if home is None:
+                home = context.home
+
+            # only consider regions of days still selected
+            present = np.unique(codes[selected][valid[selected]])
+            far = get_far_regions(regions[present], home, trav_dist_th,
+                                  context=context)
+
+            is_far = np.append(np.array([r in far for r in regions],
+                                        dtype=bool), False)
+            # code -1 maps to the last (False) entry
+            selected &= ~is_far[codes].any(axis=1)
+
+        filtered_nodes = [n for n, x in zip(nodes, selected) if x]
+        s.rows_out = len(filtered_nodes)
 
     return filtered_nodes
 
 
+def geohash_prefix_for_distance(max_dist):
+    """
+    Gets the shortest geohash prefix length such that any two
+    points sharing the prefix are within the given distance.
+
+    Two points sharing a prefix of length k are in the same geohash
+    cell of precision k. So, their distance is bounded by the height
+    plus the width of the cell (a path along a meridian and then
+    along a parallel). A degree of latitude or longitude is at most
+    111.7 km long on the WGS-84 ellipsoid.
+
+    Parameters:
+    -----------
+    max_dist: float
+        Distance in meters.
+
+    Returns:
+    --------
+    k: int
+        Prefix length (<= 12) or None if even 12 characters can't
+        guarantee the distance.
+    """
+    for k in range(1, 13):
+        h, w = spatial.cell_size(k)
+        if (h + w) * 111700 <= max_dist:
+            return k
+
+    return None
+
+
+def get_far_regions(regions, home, max_dist, context=None, backend=None):
+    """
+    Finds regions further than a given distance from home.
+
+    Regions sharing a geohash prefix with home that guarantees
+    they are within `max_dist` (see `geohash_prefix_for_distance`)
+    are accepted without computing any distance. For the rest, the
+    distance from home is computed once per distinct region.
+
+    Parameters:
+    -----------
+    regions: iterables
+        Stay regions in geohash form.
+
+    home: str
+        Home location in geohash form.
+
+    max_dist: float
+        Distance threshold in meters.
+
+    context: location.context.ParticipantContext
+        If given, regions are decoded through its cache.
+        Default is None.
+
+    backend: str
+        Distance backend (see `geodesic`). Default is None, in that
+        case the global backend is used if set, Vincenty otherwise.
+
+    Returns:
+    --------
+    far: set
+        Regions whose distance from home is larger than `max_dist`.
+    """
+    if context is None:
+        context = ParticipantContext(None)
+
+    k = geohash_prefix_for_distance(max_dist)
+    home_lat, home_lon = context.coordinates(home)
+
+    candidates = []
+    n_pruned = 0
+    for r in set(regions):
+        if k is not None and r[:k] == home[:k] and len(r) >= k:
+            n_pruned += 1
+            continue
+
+        candidates.append(r)
+
+    coords = np.array([context.coordinates(r) for r in candidates],
+                      dtype=float).reshape(-1, 2)
+    inside = geodesic.within(coords[:, 0], coords[:, 1], home_lat, home_lon,
+                             max_dist, backend=backend, default='vincenty')
+
+    counters.add('far_regions_pruned', n_pruned)
+    return set(r for r, x in zip(candidates, inside) if not x)
+
+
+def get_motif_key(nodes):
+    """
+    Computes a canonical key of the motif of a node sequence.
+
+    The motif is the directed graph whose nodes are the distinct
+    locations in the sequence, with an edge for every transition
+    between two different consecutive locations (see generate_motifs()).
+    Two sequences have the same key if and only if their motifs are
+    isomorphic, so keys can be compared (or hashed) instead of
+    calling nx.is_isomorphic.
+
+    The key is the smallest adjacency bitmask over all node orderings
+    that sort nodes by their (out-degree, in-degree). Only nodes with
+    the same degrees are permuted, so the search is cheap for the few
+    nodes of a daily motif. Graphs with too many such orderings (see
+    `_MAX_ORDERINGS`) are searched by refining the degree groups
+    instead, see `_refined_canonical_form`.
+
+    Parameters:
+    -----------
+    nodes: iterables
+        Sequence of locations. NaN values are ignored.
+
+    Returns:
+    --------
+    (n, mask): (int, int)
+        Number of nodes and the canonical adjacency bitmask, where bit
+        (i * n + j) is set if there is an edge from the i-th to
+        the j-th node.
+    """
+    return MotifGraph.from_sequence(nodes).key
+
+
+# largest number of node orderings searched by _canonical_form(),
+# graphs with more orderings use _refined_canonical_form()
+_MAX_ORDERINGS = 5040
+
+
+def _canonical_form(n, edges):
+    """
+    Computes the canonical (n, mask) form of a directed graph.
+
+    See get_motif_key().
+
+    Parameters:
+    -----------
+    n: int
+        Number of nodes (labelled 0..n-1).
+
+    edges: iterables
+        (source, target) pairs.
+
+    Returns:
+    --------
+    (n, mask): (int, int)
+    """
+    edges = list(edges)
+    out_deg = [0] * n
+    in_deg = [0] * n
+    for i, j in edges:
+        out_deg[i] += 1
+        in_deg[j] += 1
+
+    # nodes grouped by degrees, groups in sorted order
+    groups = {}
+    for v in range(n):
+        groups.setdefault((out_deg[v], in_deg[v]), []).append(v)
+    groups = [groups[k] for k in sorted(groups)]
+
+    n_orderings = 1
+    for g in groups:
+        n_orderings *= math.factorial(len(g))
+
+    if n_orderings > _MAX_ORDERINGS:
+        return _refined_canonical_form(n, edges, out_deg, in_deg)
+
+    best = None
+    for perms in itertools.product(*[itertools.permutations(g)
+                                     for g in groups]):
+        position = {}
+        for p in perms:
+            for v in p:
+                position[v] = len(position)
+
+        mask = 0
+        for i, j in edges:
+            mask |= 1 << (position[i] * n + position[j])
+
+        if best is None or mask < best:
+            best = mask
+
+    return n, 0 if best is None else best
+
+
+def _refined_canonical_form(n, edges, out_deg, in_deg):
+    """
+    Computes the canonical (n, mask) form of a directed graph with
+    large groups of nodes having the same degrees.
+
+    Degree groups are refined by the groups of the successors and
+    predecessors of each node until they are stable. If some group
+    still has several nodes, each of its nodes is given its own group
+    in turn (except those interchangeable with an already tried
+    node) and the search goes on recursively. The key is the smallest
+    adjacency bitmask among the orderings found this way. For example,
+    a cycle needs n orderings instead of n!.
+
+    The key is canonical but may differ from the smallest mask over
+    all the degree sorted orderings. So, _canonical_form() chooses
+    between both searches from the degrees only, and isomorphic graphs
+    always take the same one.
+
+    Parameters:
+    -----------
+    n: int
+        Number of nodes (labelled 0..n-1).
+
+    edges: list
+        (source, target) pairs.
+
+    out_deg, in_deg: list
+        Degrees of the nodes.
+
+    Returns:
+    --------
+    (n, mask): (int, int)
+    """
+    succ = [set() for _ in range(n)]
+    pred = [set() for _ in range(n)]
+    for i, j in edges:
+        succ[i].add(j)
+        pred[j].add(i)
+
+    def refine(colors):
+        # colors are ranks of groups, the previous color comes first
+        # in the signature so groups are only split, never reordered
+        n_colors = len(set(colors))
+        while True:
+            sig = [(colors[v],
+                    tuple(sorted(colors[u] for u in succ[v])),
+                    tuple(sorted(colors[u] for u in pred[v])))
+                   for v in range(n)]
+            ranks = {s: i for i, s in enumerate(sorted(set(sig)))}
+            colors = [ranks[s] for s in sig]
+            if len(ranks) == n_colors:
+                return colors
+            n_colors = len(ranks)
+
+    def interchangeable(u, v):
+        # swapping u and v maps the graph onto itself
+        return (succ[u] - {v} == succ[v] - {u} and
+                pred[u] - {v} == pred[v] - {u} and
+                (v in succ[u]) == (u in succ[v]))
+
+    def search(colors):
+        colors = refine(colors)
+        counts = Counter(colors)
+        split = [c for c in counts if counts[c] > 1]
+        if not split:
+            mask = 0
+            for i, j in edges:
+                mask |= 1 << (colors[i] * n + colors[j])
+            return mask
+
+        c = min(split)
+        tried = []
+        best = None
+        for v in range(n):
+            if colors[v] != c or any(interchangeable(u, v) for u in tried):
+                continue
+
+            tried.append(v)
+            # v comes first in its group
+            mask = search([2 * x + (x == c and u != v)
+                           for u, x in enumerate(colors)])
+            if best is None or mask < best:
+                best = mask
+
+        return best
+
+    degrees = sorted(set(zip(out_deg, in_deg)))
+    colors = [degrees.index(d) for d in zip(out_deg, in_deg)]
+    return n, search(colors)
+
+
+class MotifGraph(object):
+    """
+    Compact directed graph of a daily motif.
+
+    A motif has only a few nodes, so it is stored as the number of
+    nodes and an adjacency bitmask: bit (i * n + j) is set if there is
+    an edge from node i to node j. Nodes are labelled 0..n-1.
+
+    Two MotifGraph objects are equal (and have the same hash) if their
+    graphs are isomorphic, see `key`.
+
+    Parameters
+    ----------
+    n : int
+        Number of nodes.
+
+    mask : int
+        Adjacency bitmask.
+    """
+
+    __slots__ = ('n', 'mask', '_key')
+
+    def __init__(self, n, mask=0):
+        self.n = n
+        self.mask = mask
+        self._key = None
+
+    @classmethod
+    def from_sequence(cls, nodes):
+        """
+        Creates the motif of a node sequence.
+
+        Nodes are the distinct locations (labelled in the order of
+        their first occurrence) and there is an edge for every
+        transition between two different consecutive locations. See
+        generate_motifs().
+
+        Parameters
+        ----------
+        nodes : iterables
+            Sequence of locations (or location codes). NaN values
+            are ignored.
+
+        Returns
+        -------
+        MotifGraph
+        """
+
+        values = pd.Series(list(nodes), dtype=object).dropna().values
+        codes, uniques = pd.factorize(values)
+        n = len(uniques)
+
+        src = codes[:-1]
+        dst = codes[1:]
+        bits = np.unique(src[src != dst] * n + dst[src != dst])
+
+        mask = 0
+        for b in bits.tolist():
+            mask |= 1 << b
+
+        return cls(n, mask)
+
+    @property
+    def key(self):
+        """
+        Canonical key of the graph.
+
+        The key is (n, mask) of the canonical form, see
+        `canonical`. Isomorphic graphs have the same key.
+        """
+
+        if self._key is None:
+            self._key = _canonical_form(self.n, self.edges())
+
+        return self._key
+
+    def canonical(self):
+        """
+        Gets the canonical form of the graph.
+
+        The canonical form has the smallest adjacency bitmask among all
+        node orderings sorting nodes by their (out-degree, in-degree).
+        Only nodes with the same degrees are permuted, so the search is
+        cheap for small graphs. Larger groups of nodes with the same
+        degrees are refined first, see `get_motif_key`.
+
+        Returns
+        -------
+        MotifGraph
+        """
+
+        return MotifGraph(*self.key)
+
+    def edges(self):
+        """
+        Gets the edges of the graph.
+
+        Returns
+        -------
+        list
+            List of (source, target) tuples.
+        """
+
+        n = self.n
+        mask = self.mask
+        l = []
+        while mask:
+            b = (mask & -mask).bit_length() - 1
+            l.append((b // n, b % n))
+            mask &= mask - 1
+
+        return l
+
+    def number_of_nodes(self):
+        return self.n
+
+    def number_of_edges(self):
+        return bin(self.mask).count('1')
+
+    def to_networkx(self):
+        """
+        Converts the graph into a frozen networkx DiGraph.
+
+        Returns
+        -------
+        networkx.DiGraph
+        """
+
+        import networkx as nx
+
+        g = nx.DiGraph()
+        g.add_nodes_from(range(self.n))
+        g.add_edges_from(self.edges())
+        return nx.freeze(g)
+
+    def __eq__(self, other):
+        if not isinstance(other, MotifGraph):
+            return NotImplemented
+
+        return self.key == other.key
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return 'MotifGraph(n={0}, edges={1})'.format(self.n, self.edges())
+
+
 def generate_motifs(data,
                     nodes,
                     sr_col='stay_region',
                     insert_home=True,
                     home=None,
-                    round_trip=True):
+                    round_trip=True,
+                    instrument=None,
+                    context=None,
+                    fast=False):
     """
     Generate moitfs for given data. A motif is directed graph
     constructed based on the daily nodes.
@@ -1201,6 +2345,21 @@ def generate_motifs(data,
         same.
         Default is true, in which case only consider round-trip days.
 
+    instrument: location.instrument.Instrument
+        Receives start/stop events for 'generate_motifs' and the
+        filtering steps it runs.
+        Default is None, no events are emitted in that case.
+
+    context: location.context.ParticipantContext
+        Cached values of the participant (e.g., the home location).
+        Default is None.
+
+    fast: bool
+        If true, motif graphs are MotifGraph objects (see
+        MotifGraph.to_networkx()) grouped by their canonical key instead
+        of networkx graphs grouped by isomorphism tests.
+        Default is False.
+
     Returns:
     --------
 
@@ -1208,45 +2367,137 @@ def generate_motifs(data,
         List of motifs, key is a graph object, value is the list of timestamp
         for days having the same motif
     """
-    # insert home location if required
-    if insert_home:
-        nodes = insert_home_location(data, nodes, home=home)
+    with instrumentation.stage(instrument, 'generate_motifs',
+                               rows_in=len(nodes)) as s:
+        # insert home location if required
+        if insert_home:
+            nodes = insert_home_location(data, nodes, sr_col=sr_col,
+                                         home=home,
+                                         instrument=instrument,
+                                         context=context,
+                                         copy=False)
+
+        if round_trip:
+            nodes = filter_days_without_round_trip(nodes,
+                                                   instrument=instrument)
+
+        motifs = []
+        n_iso = 0  # number of isomorphism checks
+
+        if fast:
+            # motif position by canonical key
+            positions = {}
+            for n in nodes:
+                g = MotifGraph.from_sequence(n[1].node)
+                if g.key in positions:
+                    motifs[positions[g.key]]['data'].append(n[0])
+                else:
+                    positions[g.key] = len(motifs)
+                    motifs.append({'graph': g, 'data': [n[0]]})
+        else:
+            import networkx as nx
+
+            for n in nodes:
+                tsp = n[0]  # timestamp for current daily nodes
+                list_nodes = n[1].node.dropna()
+
+                # generate graph
+                g = nx.DiGraph()
+                # add nodes/daily visited locations
+                g.add_nodes_from(list_nodes)
+                # add edges
+                for i in range(1, len(list_nodes)):
+                    if list_nodes.iloc[i] != list_nodes.iloc[i - 1]:
+                        g.add_edge(list_nodes.iloc[i - 1], list_nodes.iloc[i])
+                g = nx.freeze(g)
+
+                # Add current timestamp to corresponding motif/graph
+                # Motifs are directed graph representing daily networks
+                # that consist of set of visited locations and trips
+                # among them. The nodes and edges are unspecifed and
+                # interchangable, so two motifs are the same if the
+                # underlying graphs are isomorphic.
+                found = False
+                for item in motifs:
+                    n_iso += 1
+                    if nx.is_isomorphic(item['graph'], g):
+                        item['data'].append(tsp)
+                        found = True
+                        break
+                if not found:
+                    motifs.append({'graph': g, 'data': [tsp]})
+
+        counters.add('motif_isomorphism', n_iso)
+
+        s.rows_out = len(motifs)
 
-    if round_trip:
-        nodes = filter_days_without_round_trip(nodes)
+    return motifs
 
-    motifs = []
 
-    for n in nodes:
-        tsp = n[0]  # timestamp for current daily nodes
-        list_nodes = n[1].node.dropna()
+def _motif_table(motifs):
+    """
+    Converts motifs from `generate_motifs` (in fast mode) into a table.
 
-        # generate graph
-        g = nx.DiGraph()
-        # add nodes/daily visited locations
-        g.add_nodes_from(list_nodes)
-        # add edges
-        for i in range(1, len(list_nodes)):
-            if list_nodes.iloc[i] != list_nodes.iloc[i - 1]:
-                g.add_edge(list_nodes.iloc[i - 1], list_nodes.iloc[i])
-        g = nx.freeze(g)
-
-        # Add current timestamp to corresponding motif/graph
-        # Motifs are directed graph representing daily networks
-        # that consist of set of visited locations and trips
-        # among them. The nodes and edges are unspecifed and
-        # interchangable, so two motifs are the same if the
-        # underlying graphs are isomorphic.
-        found = False
-        for item in motifs:
-            if nx.is_isomorphic(item['graph'], g):
-                item['data'].append(tsp)
-                found = True
-                break
-        if not found:
-            motifs.append({'graph': g, 'data': [tsp]})
+    Returns
+    -------
+    DataFrame
+        One row per day, indexed by 'timestamp' (sorted), with 'motif'
+        (position in `motifs`), 'n_nodes' and 'mask' (the canonical
+        key, see `get_motif_key`) columns. Masks of motifs with 9 or
+        more nodes don't fit in int64, so 'mask' is a hexadecimal
+        string (e.g., '0x62').
+    """
 
-    return motifs
+    rows = []
+    for i, m in enumerate(motifs):
+        n_nodes, mask = m['graph'].key
+        for t in m['data']:
+            rows.append({'timestamp': t, 'motif': i,
+                         'n_nodes': n_nodes, 'mask': hex(mask)})
+
+    columns = ['timestamp', 'motif', 'n_nodes', 'mask']
+    df = pd.DataFrame(rows, columns=columns)
+    return df.sort_values('timestamp').set_index('timestamp')
+
+
+# output formats of the motif and features commands
+_TABLE_FORMATS = ('.csv', '.parquet', '.feather')
+
+
+def _write_table(df, path):
+    """
+    Writes a table in the format given by the file extension.
+
+    Parquet (.parquet) and feather (.feather) files require the
+    corresponding pandas support (e.g., pyarrow). Other extensions
+    than these and .csv raise a ValueError.
+
+    Parameters
+    ----------
+    df : DataFrame
+        The index is written as a column.
+
+    path : str
+        Output path.
+    """
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in _TABLE_FORMATS:
+        err = 'Unknown output format {0!r}, use one of {1}'
+        raise ValueError(err.format(ext, ', '.join(_TABLE_FORMATS)))
+
+    df = df.reset_index()
+
+    try:
+        if ext == '.parquet':
+            df.to_parquet(path)
+        elif ext == '.feather':
+            df.to_feather(path)
+        else:
+            df.to_csv(path, index=False)
+    except (AttributeError, ImportError) as e:
+        err = 'Writing {0} files is not supported: {1}'
+        raise ValueError(err.format(ext, e))
 
 
 def main():
@@ -1254,28 +2505,119 @@ def main():
     Handles command line options.
     """
 
+    import argparse
+
     parser = argparse.ArgumentParser()
 
     # command
-    parser.add_argument('-g', '--generate', required=True, choices=['node'],
-                        help="Generate motif or node")
+    parser.add_argument('-g', '--generate', required=True,
+                        choices=['node', 'motif', 'features'],
+                        help="Generate node, motif or features")
     parser.add_argument('-f', '--file', help='File path')
     parser.add_argument('-c', '--config', help='JSON config file path')
+    parser.add_argument('-o', '--output',
+                        help='Output path for motif and features. The '
+                             'format is given by the extension: '
+                             '.csv, .parquet or .feather')
     parser.add_argument('-tz', '--timezone', default='America/New_York',
                         help='Target timezone (default: America/New_York)')
     parser.add_argument('-tc', '--timecolumn', default='time',
                         help='Column with DateTime info (default: time)')
+    parser.add_argument('--timeformat',
+                        help='strftime format of the time column '
+                             '(default: inferred)')
+    parser.add_argument('--timezonecolumn',
+                        help='Column with the target timezone of each row. '
+                             'Times are converted to naive local times '
+                             '(default: --timezone for all rows)')
+    parser.add_argument('--timings',
+                        help='Write per-stage timing events as JSON lines '
+                             'to the given path')
+    parser.add_argument('--memory',
+                        help='Record peak traced allocation and RSS delta '
+                             'per stage and write them as csv to the '
+                             'given path')
+    parser.add_argument('--metrics',
+                        help='Write operation counters as a Prometheus '
+                             'text file to the given path')
 
     args = parser.parse_args()
 
-    if args.generate == 'node':
-        df = pd.read_csv(args.file)
-        df = convert_time_zone(df, args.timecolumn, to_timezone=args.timezone)
+    if args.generate != 'node':
+        if args.output is None:
+            parser.error('--output is required for {0}'.format(
+                args.generate))
+
+        ext = os.path.splitext(args.output)[1].lower()
+        if ext not in _TABLE_FORMATS:
+            parser.error('--output must end with one of {0}'.format(
+                ', '.join(_TABLE_FORMATS)))
+
+    timings = None
+    instrument = None
+    if args.timings is not None or args.memory is not None:
+        callback = None
+        if args.timings is not None:
+            timings = open(args.timings, 'w')
+            callback = instrumentation.JsonLinesWriter(timings)
+
+        instrument = instrumentation.Instrument(
+            callback=callback,
+            keep_events=args.memory is not None,
+            memory=args.memory is not None)
+
+    if args.metrics is not None:
+        counters.enable()
+
+    try:
+        with instrumentation.stage(instrument, 'load') as s:
+            df = pd.read_csv(args.file)
+            df = convert_time_zone(df, args.timecolumn,
+                                   to_timezone=args.timezone,
+                                   time_format=args.timeformat,
+                                   timezone_column=args.timezonecolumn)
+            s.rows_out = len(df)
 
         with open(args.config) as f:
             params = json.load(f)
 
-        compute_nodes(df, **params)
+        # arguments of later stages
+        motif_args = params.pop('motif_args', {})
+        feature_args = params.pop('feature_args', {})
+
+        stay, nodes = compute_nodes(df, instrument=instrument, **params)
+
+        if args.generate == 'motif':
+            motifs = generate_motifs(stay, nodes, instrument=instrument,
+                                     fast=True, **motif_args)
+            table = _motif_table(motifs)
+        elif args.generate == 'features':
+            # features imports this module
+            from location import features
+
+            with instrumentation.stage(instrument, 'features',
+                                       rows_in=len(nodes)) as s:
+                table = features.daily_features(
+                    stay, [n[0] for n in nodes],
+                    lat_c=params.get('lat_c', 'latitude'),
+                    lon_c=params.get('lon_c', 'longitude'),
+                    **feature_args)
+                s.rows_out = len(table)
+
+        if args.generate != 'node':
+            with instrumentation.stage(instrument, 'write',
+                                       rows_in=len(table)):
+                _write_table(table, args.output)
+    finally:
+        if timings is not None:
+            timings.close()
+
+        if args.memory is not None:
+            instrument.close()
+            instrument.report().to_csv(args.memory, index=False)
+
+        if args.metrics is not None:
+            counters.write_prometheus(args.metrics)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+    population
+    ~~~~~~~~~~
+
+    Population level analysis of daily nodes.
+
+    Functions in this module work on many participants at once. The
+    participants are given as a dict mapping participant ids to
+    (data, nodes) tuples, where `data` is the location data and `nodes`
+    are the daily nodes of that participant (i.e., the values returned
+    by `motif.compute_nodes`).
+"""
+
+import numpy as np
+import pandas as pd
+
+from location import motif
+
+
+def _participant_motifs(args):
+    """
+    Computes motif keys for the days of one participant.
+
+    Parameters
+    ----------
+    args : tuple
+        (data, nodes, insert_home, home, round_trip), see
+        `count_motifs`.
+
+    Returns
+    -------
+    list
+        A list of (timestamp, key) tuples, see `motif.get_motif_key`.
+    """
+
+    data, nodes, insert_home, home, round_trip = args
+
+    # days without nodes are not part of any motif
+    nodes = [n for n in nodes if isinstance(n[1], pd.DataFrame)]
+
+    if insert_home:
+        nodes = motif.insert_home_location(data, nodes, home=home,
+                                           copy=False)
+
+    if round_trip:
+        nodes = motif.filter_days_without_round_trip(nodes)
+
+    return [(n[0], motif.get_motif_key(n[1]['node'])) for n in nodes]
+
+
+def count_motifs(participants,
+                 insert_home=True,
+                 home=None,
+                 round_trip=True,
+                 n_jobs=1,
+                 return_assignments=False):
+    """
+    Counts motifs of many participants in a shared motif id space.
+
+    Every participant-day is classified by the canonical key of its
+    motif (see `motif.get_motif_key`), so motifs are matched across
+    participants without any isomorphism test.
+
+    Parameters
+    ----------
+    participants : dict
+        Maps participant ids to (data, nodes) tuples. `data` is only
+        used to find the home location and can be None if
+        `insert_home` is False or `home` is given.
+
+    insert_home, home, round_trip :
+        See `motif.generate_motifs`. A given `home` is used for all
+        participants.
+
+    n_jobs : int
+        Number of worker processes. Default is 1, in that case all
+        participants are processed in the current process.
+
+    return_assignments : bool
+        If the motif of each participant-day should be returned.
+        Default is False.
+
+    Returns
+    -------
+    (counts, motifs) : (DataFrame, DataFrame)
+        `counts` is the sparse participants x motifs count matrix in
+        coordinate form: 'participant', 'motif' and 'count' columns
+        with a row for each non-zero entry. `motifs` is indexed by
+        motif id and has 'n_nodes' and 'mask' columns (the canonical
+        key). Motif ids are assigned in the order of canonical keys.
+
+        If `return_assignments` is True, a third DataFrame is returned
+        with 'participant', 'timestamp' and 'motif' columns.
+    """
+
+    ids = list(participants)
+    args = [(participants[p][0], participants[p][1],
+             insert_home, home, round_trip) for p in ids]
+
+    if n_jobs == 1:
+        results = [_participant_motifs(a) for a in args]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_participant_motifs, args))
+
+    # shared motif id space
+    keys = sorted(set(k for r in results for _, k in r))
+    motif_ids = {k: i for i, k in enumerate(keys)}
+
+    motifs = pd.DataFrame({'n_nodes': [k[0] for k in keys],
+                           'mask': [k[1] for k in keys]},
+                          columns=['n_nodes', 'mask'])
+    motifs.index.name = 'motif'
+
+    participant_c = []
+    timestamps = []
+    motif_c = []
+    for p, r in zip(ids, results):
+        participant_c.extend([p] * len(r))
+        timestamps.extend([t for t, _ in r])
+        motif_c.extend([motif_ids[k] for _, k in r])
+
+    assignments = pd.DataFrame({'participant': participant_c,
+                                'timestamp': timestamps,
+                                'motif': np.array(motif_c, dtype=int)},
+                               columns=['participant', 'timestamp',
+                                        'motif'])
+
+    counts = assignments.groupby(['participant', 'motif'],
+                                 sort=False).size()
+    counts = counts.reset_index(name='count')
+    counts = counts.sort_values(['participant', 'motif'])
+    counts = counts.reset_index(drop=True)
+
+    if return_assignments:
+        return counts, motifs, assignments
+
+    return counts, motifs
+
+
+def build_od_network(participants, time_bucket=None):
+    """
+    Builds a weighted origin-destination network of all participants.
+
+    A trip is a transition between two different consecutive nodes of
+    a day, ignoring missing nodes (same as `motif.generate_graph`).
+    Trips of all participants are aggregated over a shared region
+    vocabulary with array operations, without building any string
+    edges or networkx graphs.
+
+    Parameters
+    ----------
+    participants : dict
+        Maps participant ids to (data, nodes) tuples. Only the
+        nodes are used, so `data` can be None.
+
+    time_bucket : str or pd.Timedelta
+        If not None, trips are also grouped by time of day in
+        buckets of the given duration (e.g., '3H'). The time of a
+        trip is the start time of the slot of its destination.
+        Default is None.
+
+    Returns
+    -------
+    (edges, regions) : (DataFrame, ndarray)
+        `edges` has 'origin', 'destination' and 'weight' columns (and
+        a 'bucket' column with the start of the time of day bucket as
+        pd.Timedelta, if `time_bucket` is given). Origin and destination
+        are positions in `regions`, the shared region vocabulary.
+    """
+
+    nodes_l = []
+    days_l = []
+    seconds_l = []
+    n_days = 0
+    for p in participants:
+        frames = [n[1] for n in participants[p][1]
+                  if isinstance(n[1], pd.DataFrame)]
+        if len(frames) == 0:
+            continue
+
+        lengths = [len(f) for f in frames]
+        df = pd.concat(frames, ignore_index=True)
+        days_l.append(np.repeat(np.arange(n_days, n_days + len(frames)),
+                                lengths))
+        nodes_l.append(df['node'].values.astype(object))
+        n_days += len(frames)
+
+        if time_bucket is not None:
+            t = pd.to_datetime(df['time'])
+            seconds_l.append((t.dt.hour * 3600 + t.dt.minute * 60 +
+                              t.dt.second).values)
+
+    columns = ['origin', 'destination', 'weight']
+    if time_bucket is not None:
+        columns.insert(2, 'bucket')
+
+    if len(nodes_l) == 0:
+        return pd.DataFrame(columns=columns), np.empty(0, dtype=object)
+
+    codes, regions = pd.factorize(np.concatenate(nodes_l))
+    days = np.concatenate(days_l)
+
+    # missing nodes are ignored
+    valid = codes >= 0
+    codes = codes[valid]
+    days = days[valid]
+
+    trip = (days[1:] == days[:-1]) & (codes[1:] != codes[:-1])
+    trips = pd.DataFrame({'origin': codes[:-1][trip],
+                          'destination': codes[1:][trip]})
+
+    keys = ['origin', 'destination']
+    if time_bucket is not None:
+        bucket = pd.to_timedelta(time_bucket).total_seconds()
+        seconds = np.concatenate(seconds_l)[valid][1:][trip]
+        trips['bucket'] = pd.to_timedelta((seconds // bucket) * bucket,
+                                          unit='s')
+        keys.append('bucket')
+
+    if len(trips) == 0:
+        return pd.DataFrame(columns=columns), np.asarray(regions)
+
+    edges = trips.groupby(keys).size().reset_index(name='weight')
+    return edges.loc[:, columns], np.asarray(regions)
+
+
+def to_od_matrix(edges, regions):
+    """
+    Converts origin-destination edges into a scipy sparse matrix.
+
+    Requires scipy.
+
+    Parameters
+    ----------
+    edges, regions :
+        Values returned by `build_od_network`. Weights of different
+        time of day buckets are summed.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        A regions x regions matrix, where entry (i, j) is the number
+        of trips from regions[i] to regions[j].
+    """
+
+    from scipy import sparse
+
+    n = len(regions)
+    return sparse.csr_matrix((edges['weight'].values.astype(int),
+                              (edges['origin'].values.astype(int),
+                               edges['destination'].values.astype(int))),
+                             shape=(n, n))
+
+
+def to_sparse_matrix(counts, participants=None, n_motifs=None):
+    """
+    Converts motif counts into a scipy sparse matrix.
+
+    Requires scipy.
+
+    Parameters
+    ----------
+    counts : DataFrame
+        Counts returned by `count_motifs`.
+
+    participants : iterables
+        Participant ids in row order. Default is None, in that case
+        participants with any count are used in sorted order.
+
+    n_motifs : int
+        Number of columns. Default is None, in that case 1 + the
+        largest motif id is used.
+
+    Returns
+    -------
+    (matrix, participants) : (scipy.sparse.csr_matrix, list)
+        The participants x motifs count matrix and the participant
+        id of each row.
+    """
+
+    from scipy import sparse
+
+    if participants is None:
+        participants = sorted(counts['participant'].unique())
+    participants = list(participants)
+
+    if n_motifs is None:
+        n_motifs = int(counts['motif'].max()) + 1 if len(counts) > 0 else 0
+
+    rows = pd.Index(participants).get_indexer(counts['participant'])
+    matrix = sparse.csr_matrix((counts['count'].values,
+                                (rows, counts['motif'].values)),
+                               shape=(len(participants), n_motifs))
+
+    return matrix, participants
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+"""
+    server
+    ~~~~~~
+
+    Local HTTP service for on-demand node, motif and feature computation.
+
+    The server keeps a pool of warm worker processes, so a request does
+    not pay the startup cost of Python, pandas and networkx. Requests
+    are handled by an asyncio event loop and the computation runs in
+    the process pool. Only the standard library is used.
+
+    Endpoints:
+
+        - POST /nodes, /motifs, /features: the body is a JSON object
+          with a 'trace' (list of records with a time column, see
+          `motif.convert_time_zone`) and optionally 'config' (arguments
+          of `motif.compute_nodes`, with 'motif_args' and
+          'feature_args' keys as in the config file of the command line
+          interface), 'timezone' and 'timecolumn'. The result is
+          streamed back as JSON lines, one record per row. Config keys
+          not in `CONFIG_KEYS` (e.g., the output paths of
+          `motif.compute_nodes`) are rejected with 400.
+        - GET /health: returns 'ok'.
+
+    Responses carry 'X-Queue-Time' and 'X-Compute-Time' headers (in
+    seconds) and a 'Server-Timing' header. If too many requests are
+    pending, new ones are rejected with 503.
+
+    Run it with `python -m location.server`.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+# size of streamed chunks in bytes
+_CHUNK_SIZE = 64 * 1024
+
+# config keys accepted from clients, arguments writing files
+# (stay_info_output, node_output) are left out
+CONFIG_KEYS = ('lon_c', 'lat_c', 'stay_point_args', 'stay_region_args',
+               'node_args', 'daily_args', 'engine', 'compression',
+               'compression_args', 'motif_args', 'feature_args')
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+            405: 'Method Not Allowed', 413: 'Payload Too Large',
+            500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+def _warm_up():
+    """
+    Imports the pipeline in a worker process.
+    """
+
+    from location import features, motif  # noqa: F401
+
+    return True
+
+
+def _compute(command, trace, config, timezone, timecolumn):
+    """
+    Runs the pipeline in a worker process.
+
+    Returns
+    -------
+    str
+        The result as JSON lines.
+    """
+
+    import pandas as pd
+
+    from location import features, motif
+
+    config = dict(config)
+    motif_args = config.pop('motif_args', {})
+    feature_args = config.pop('feature_args', {})
+
+    df = pd.DataFrame(trace)
+    df = motif.convert_time_zone(df, timecolumn, to_timezone=timezone)
+    stay, nodes = motif.compute_nodes(df, **config)
+
+    if command == 'nodes':
+        tables = []
+        for timestamp, n in nodes:
+            if isinstance(n, pd.DataFrame):
+                n = n.loc[:, ['time', 'node']].copy()
+                n.insert(0, 'timestamp', timestamp)
+                tables.append(n)
+
+        if len(tables) == 0:
+            return ''
+        table = pd.concat(tables, ignore_index=True)
+    elif command == 'motifs':
+        motifs = motif.generate_motifs(stay, nodes, fast=True,
+                                       **motif_args)
+        table = motif._motif_table(motifs).reset_index()
+    else:
+        table = features.daily_features(
+            stay, [n[0] for n in nodes],
+            lat_c=config.get('lat_c', 'latitude'),
+            lon_c=config.get('lon_c', 'longitude'),
+            **feature_args).reset_index()
+
+    if len(table) == 0:
+        return ''
+
+    return table.to_json(orient='records', lines=True,
+                         date_format='iso') + '\n'
+
+
+class Server(object):
+    """
+    HTTP server computing nodes, motifs and features.
+
+    Parameters
+    ----------
+    n_workers : int
+        Number of worker processes. Default is 2.
+
+    max_pending : int
+        Maximum number of requests waiting for or running in a worker.
+        Further requests are rejected with 503. Default is 16.
+
+    max_body : int
+        Maximum request body size in bytes. Default is 64MB.
+
+    timezone : str
+        Default timezone of traces. Default is America/New_York.
+    """
+
+    commands = ('nodes', 'motifs', 'features')
+
+    def __init__(self, n_workers=2, max_pending=16, max_body=64 * 2 ** 20,
+                 timezone='America/New_York'):
+        self.n_workers = n_workers
+        self.max_pending = max_pending
+        self.max_body = max_body
+        self.timezone = timezone
+
+        self.pending = 0
+        self.executor = None
+        self.server = None
+        self._slots = None
+
+    @asyncio.coroutine
+    def start(self, host='127.0.0.1', port=8000, loop=None):
+        """
+        Starts the worker processes and the server.
+
+        Returns
+        -------
+        asyncio.AbstractServer
+        """
+
+        if loop is None:
+            loop = asyncio.get_event_loop()
+
+        self.loop = loop
+        self._slots = asyncio.Semaphore(self.n_workers, loop=loop)
+        self.executor = ProcessPoolExecutor(max_workers=self.n_workers)
+
+        # one import per worker process
+        warm_up = [loop.run_in_executor(self.executor, _warm_up)
+                   for _ in range(self.n_workers)]
+        yield from asyncio.wait(warm_up, loop=loop)
+
+        self.server = yield from asyncio.start_server(self.handle, host,
+                                                      port, loop=loop)
+        return self.server
+
+    @asyncio.coroutine
+    def close(self):
+        """
+        Stops the server and the worker processes.
+        """
+
+        if self.server is not None:
+            self.server.close()
+            yield from self.server.wait_closed()
+            self.server = None
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    @asyncio.coroutine
+    def handle(self, reader, writer):
+        """
+        Handles a connection (one request per connection).
+        """
+
+        try:
+            yield from self._handle(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @asyncio.coroutine
+    def _handle(self, reader, writer):
+        received = time.perf_counter()
+
+        request_line = yield from reader.readline()
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3:
+            self._respond(writer, 400, 'Malformed request line\n')
+            return
+
+        method, path, _ = parts
+        headers = {}
+        while True:
+            line = yield from reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        path = path.split('?')[0].strip('/')
+        if path == 'health':
+            self._respond(writer, 200, 'ok\n')
+            return
+
+        if path not in self.commands:
+            self._respond(writer, 404, 'Unknown path\n')
+            return
+
+        if method != 'POST':
+            self._respond(writer, 405, 'Use POST\n')
+            return
+
+        try:
+            length = int(headers.get('content-length', '0'))
+        except ValueError:
+            length = -1
+
+        if length < 0 or length > self.max_body:
+            self._respond(writer, 413, 'Invalid body size\n')
+            return
+
+        body = yield from reader.readexactly(length)
+        try:
+            payload = json.loads(body.decode('utf-8'))
+            trace = payload['trace']
+            config = payload.get('config', {})
+        except (ValueError, KeyError, TypeError):
+            self._respond(writer, 400, 'Expected JSON with a trace\n')
+            return
+
+        if not isinstance(config, dict):
+            self._respond(writer, 400, 'Expected a config object\n')
+            return
+
+        unknown = sorted(k for k in config if k not in CONFIG_KEYS)
+        if unknown:
+            self._respond(writer, 400, 'Unsupported config keys: {0}\n'
+                          .format(', '.join(unknown)))
+            return
+
+        if self.pending >= self.max_pending:
+            self._respond(writer, 503, 'Too many pending requests\n',
+                          headers={'Retry-After': '1'})
+            return
+
+        self.pending += 1
+        try:
+            with (yield from self._slots):
+                started = time.perf_counter()
+                try:
+                    result = yield from self.loop.run_in_executor(
+                        self.executor, _compute, path, trace, config,
+                        payload.get('timezone', self.timezone),
+                        payload.get('timecolumn', 'time'))
+                except Exception as e:
+                    self._respond(writer, 500, '{0}: {1}\n'.format(
+                        type(e).__name__, e))
+                    return
+                finished = time.perf_counter()
+        finally:
+            self.pending -= 1
+
+        queue_time = started - received
+        compute_time = finished - started
+        timing = {
+            'X-Queue-Time': '{0:.6f}'.format(queue_time),
+            'X-Compute-Time': '{0:.6f}'.format(compute_time),
+            'Server-Timing': 'queue;dur={0:.3f}, compute;dur={1:.3f}'.format(
+                queue_time * 1000, compute_time * 1000)}
+
+        yield from self._stream(writer, result.encode('utf-8'), timing)
+
+    def _write_head(self, writer, status, headers):
+        lines = ['HTTP/1.1 {0} {1}'.format(status, _REASONS[status])]
+        for name, value in headers.items():
+            lines.append('{0}: {1}'.format(name, value))
+
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+    def _respond(self, writer, status, text, headers=None):
+        body = text.encode('utf-8')
+
+        h = {'Content-Type': 'text/plain; charset=utf-8',
+             'Content-Length': str(len(body)),
+             'Connection': 'close'}
+        if headers is not None:
+            h.update(headers)
+
+        self._write_head(writer, status, h)
+        writer.write(body)
+
+    @asyncio.coroutine
+    def _stream(self, writer, body, headers):
+        h = {'Content-Type': 'application/x-ndjson',
+             'Transfer-Encoding': 'chunked',
+             'Connection': 'close'}
+        h.update(headers)
+        self._write_head(writer, 200, h)
+
+        for i in range(0, len(body), _CHUNK_SIZE):
+            chunk = body[i:i + _CHUNK_SIZE]
+            writer.write('{0:x}\r\n'.format(len(chunk)).encode('latin-1'))
+            writer.write(chunk + b'\r\n')
+            yield from writer.drain()
+
+        writer.write(b'0\r\n\r\n')
+        yield from writer.drain()
+
+
+def main():
+    """
+    Handles command line options.
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Host to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000,
+                        help='Port to listen on (default: 8000)')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='Number of worker processes (default: 2)')
+    parser.add_argument('--max-pending', type=int, default=16,
+                        help='Maximum number of pending requests '
+                             '(default: 16)')
+    parser.add_argument('-tz', '--timezone', default='America/New_York',
+                        help='Default timezone of traces '
+                             '(default: America/New_York)')
+
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    server = Server(n_workers=args.workers, max_pending=args.max_pending,
+                    timezone=args.timezone)
+    loop.run_until_complete(server.start(args.host, args.port, loop=loop))
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.close())
+        loop.close()
+
+if __name__ == '__main__':
+    main()
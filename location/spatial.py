@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+    spatial
+    ~~~~~~~
+
+    Spatial index over stay regions.
+
+    Stay regions are geohash cells (see `motif.get_stay_region`). The
+    index keeps a bucket per geohash prefix for every prefix length,
+    so the regions around a fix can be found by looking at the cell of
+    the fix and its neighbors at a suitable prefix length instead of
+    computing the distance to every region.
+"""
+
+import json
+import math
+
+import geohash
+import numpy as np
+import pandas as pd
+
+from location import counters, geodesic
+
+
+EARTH_RADIUS = geodesic.EARTH_RADIUS
+
+
+def _haversine(lat1, lon1, lat2, lon2, backend=None):
+    """
+    Computes great circle distances in meters.
+
+    All arguments are in degrees and broadcast against each other.
+    The haversine kernel is used unless another backend is given or
+    set globally (see `geodesic.set_backend`).
+    """
+
+    return geodesic.distance(lat1, lon1, lat2, lon2, backend=backend,
+                             default='haversine')
+
+
+def cell_size(precision):
+    """
+    Gets the size of a geohash cell in degrees.
+
+    Parameters
+    ----------
+    precision : int
+        Geohash length.
+
+    Returns
+    -------
+    (lat, lon) : (float, float)
+        Height and width of the cell in degrees.
+    """
+
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+
+    return 180 / 2 ** lat_bits, 360 / 2 ** lon_bits
+
+
+def _min_escape_distance(precision, lat):
+    """
+    Computes a lower bound of the distance between a point and
+    any location outside the 3x3 block of geohash cells centered
+    on the cell of the point.
+
+    Parameters
+    ----------
+    precision : int
+        Geohash length.
+
+    lat : float
+        Latitude of the point.
+
+    Returns
+    -------
+    float
+        Distance in meters.
+
+    Notes
+    -----
+        The bound holds for every distance backend: it uses the
+        smallest radius of curvature of the sphere and the ellipsoid
+        and leaves out the largest absolute error of the kernels.
+    """
+
+    h, w = cell_size(precision)
+    radius = geodesic.MIN_RADIUS
+
+    # leaving the block to north or south requires
+    # at least one full cell of latitude
+    d_lat = radius * math.radians(h)
+
+    # otherwise the location is within the latitude band of
+    # the block and at least one cell width away in longitude
+    band = min(abs(lat) + 2 * h, 90)
+    s = math.cos(math.radians(band)) * math.sin(math.radians(w) / 2)
+    d_lon = 2 * radius * math.asin(min(s, 1))
+
+    return min(d_lat, d_lon) - geodesic.MAX_KERNEL_ERROR
+
+
+class RegionIndex(object):
+    """
+    Nearest region and within-radius queries over stay regions.
+
+    Parameters
+    ----------
+    regions : iterables
+        Geohash values of stay regions (e.g., the 'stay_region' column
+        returned by `motif.compute_nodes`). Duplicates and NaN values
+        are ignored.
+
+    Notes
+    -----
+        Region locations are the centers of their geohash cells
+        (see `features.convert_geohash_to_gps`) and distances are
+        great circle distances in meters.
+
+        A query looks at the cell containing the fix and its
+        neighbors, starting with the longest prefix and moving to
+        shorter prefixes until the block of cells is guaranteed to
+        contain the answer. So, the cost of a query is proportional to
+        the geohash length plus the number of regions nearby. Near the
+        poles, where the guarantee cannot be met, the query falls back
+        to computing distances to all regions.
+    """
+
+    def __init__(self, regions):
+        regions = pd.Series(list(regions)).dropna()
+        self.regions = list(pd.unique(regions))
+
+        coords = [geohash.decode(r) for r in self.regions]
+        counters.add('geohash_decode', len(coords))
+        self.latitudes = np.array([c[0] for c in coords], dtype=float)
+        self.longitudes = np.array([c[1] for c in coords], dtype=float)
+
+        self._build()
+
+    def _build(self):
+        if len(self.regions) == 0:
+            self.precision = 0
+        else:
+            self.precision = min(len(r) for r in self.regions)
+
+        # prefix length -> {prefix: [region positions]}
+        self._buckets = {}
+        for level in range(1, self.precision + 1):
+            buckets = {}
+            for i, r in enumerate(self.regions):
+                buckets.setdefault(r[:level], []).append(i)
+            self._buckets[level] = buckets
+
+    def __len__(self):
+        return len(self.regions)
+
+    def _candidates(self, cell):
+        """
+        Gets positions of regions within the 3x3 block around a cell.
+        """
+
+        buckets = self._buckets[len(cell)]
+        c = list(buckets.get(cell, []))
+        for n in geohash.neighbors(cell):
+            c.extend(buckets.get(n, []))
+
+        return np.array(c, dtype=int)
+
+    def _cell(self, lat, lon):
+        counters.add('geohash_encode')
+        return geohash.encode(latitude=lat, longitude=lon,
+                              precision=self.precision)
+
+    def _distances(self, lat, lon, candidates=None):
+        if candidates is None:
+            return _haversine(lat, lon, self.latitudes, self.longitudes)
+
+        return _haversine(lat, lon, self.latitudes[candidates],
+                          self.longitudes[candidates])
+
+    def _escape_level(self, lat, distance, start):
+        """
+        Gets the longest prefix (<= start) whose 3x3 block contains
+        every location within the given distance. Returns 0 if no
+        such prefix exists.
+        """
+
+        for level in range(start, 0, -1):
+            if _min_escape_distance(level, lat) >= distance:
+                return level
+
+        return 0
+
+    def nearest(self, lat, lon):
+        """
+        Finds the nearest region of a fix.
+
+        Parameters
+        ----------
+        lat, lon : float
+            Coordinates of the fix.
+
+        Returns
+        -------
+        (region, distance) : (str, float)
+            The nearest region and the distance to it in meters.
+            If the index is empty, (None, np.nan) is returned.
+        """
+
+        if len(self.regions) == 0:
+            return None, np.nan
+
+        cell = self._cell(lat, lon)
+
+        # find a nearby region with the longest prefix
+        for level in range(self.precision, 0, -1):
+            candidates = self._candidates(cell[:level])
+            if len(candidates) > 0:
+                d = self._distances(lat, lon, candidates).min()
+                break
+        else:
+            d = np.inf
+
+        # regions closer than d are within the block of the
+        # longest prefix that can't be escaped within d
+        level = self._escape_level(lat, d, self.precision)
+        if level == 0:
+            candidates = None
+            dist = self._distances(lat, lon)
+        else:
+            candidates = self._candidates(cell[:level])
+            dist = self._distances(lat, lon, candidates)
+
+        i = dist.argmin()
+        position = i if candidates is None else candidates[i]
+        return self.regions[position], float(dist[i])
+
+    def within(self, lat, lon, radius):
+        """
+        Finds all regions within a given radius of a fix.
+
+        Parameters
+        ----------
+        lat, lon : float
+            Coordinates of the fix.
+
+        radius : float
+            Radius in meters.
+
+        Returns
+        -------
+        list
+            List of (region, distance) tuples sorted by distance.
+        """
+
+        if len(self.regions) == 0:
+            return []
+
+        level = self._escape_level(lat, radius, self.precision)
+        if level == 0:
+            candidates = np.arange(len(self.regions))
+        else:
+            candidates = self._candidates(self._cell(lat, lon)[:level])
+
+        dist = self._distances(lat, lon, candidates)
+        order = np.argsort(dist, kind='mergesort')
+
+        return [(self.regions[candidates[i]], float(dist[i]))
+                for i in order if dist[i] <= radius]
+
+    def nearest_many(self, lats, lons, max_dist=None):
+        """
+        Finds the nearest region for many fixes.
+
+        Parameters
+        ----------
+        lats, lons : iterables
+            Coordinates of the fixes.
+
+        max_dist : float
+            If not None, fixes further than `max_dist` meters from
+            their nearest region are not assigned any region (their
+            'region' value would be np.nan). Default is None.
+
+        Returns
+        -------
+        DataFrame
+            It contains 'region' and 'distance' columns, one row
+            per fix.
+        """
+
+        regions = []
+        distances = []
+        for lat, lon in zip(lats, lons):
+            r, d = self.nearest(lat, lon)
+            if r is None or (max_dist is not None and d > max_dist):
+                r = np.nan
+            regions.append(r)
+            distances.append(d)
+
+        return pd.DataFrame({'region': regions, 'distance': distances},
+                            columns=['region', 'distance'])
+
+    def within_many(self, lats, lons, radius):
+        """
+        Finds all regions within a given radius for many fixes.
+
+        Parameters
+        ----------
+        lats, lons : iterables
+            Coordinates of the fixes.
+
+        radius : float
+            Radius in meters.
+
+        Returns
+        -------
+        list
+            One list per fix, see `within`.
+        """
+
+        return [self.within(lat, lon, radius)
+                for lat, lon in zip(lats, lons)]
+
+    def to_dict(self):
+        """
+        Converts the index into a JSON serializable dict.
+
+        Returns
+        -------
+        dict
+            The dict can be used with `from_dict`.
+        """
+
+        return {'regions': self.regions,
+                'latitudes': self.latitudes.tolist(),
+                'longitudes': self.longitudes.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Creates an index from a dict returned by `to_dict`.
+
+        Parameters
+        ----------
+        d : dict
+
+        Returns
+        -------
+        RegionIndex
+        """
+
+        index = cls.__new__(cls)
+        index.regions = list(d['regions'])
+        index.latitudes = np.array(d['latitudes'], dtype=float)
+        index.longitudes = np.array(d['longitudes'], dtype=float)
+        index._build()
+
+        return index
+
+    def save(self, path):
+        """
+        Saves the index as a JSON file.
+
+        Parameters
+        ----------
+        path : str
+            Output path.
+        """
+
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index saved by `save`.
+
+        Parameters
+        ----------
+        path : str
+            Input path.
+
+        Returns
+        -------
+        RegionIndex
+        """
+
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
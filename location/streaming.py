@@ -0,0 +1,708 @@
+# -*- coding: utf-8 -*-
+"""
+    streaming
+    ~~~~~~~~~
+
+    Mergeable accumulators of location features.
+
+    The functions in `features` compute a feature over a whole frame.
+    The accumulators here compute the same values incrementally:
+
+        - `update(chunk)` adds the rows of a DataFrame chunk.
+        - `merge(other)` adds the rows summarized by another
+          accumulator of the same kind and configuration.
+        - `result()` returns the feature value for all rows so far,
+          as the corresponding function in `features` does.
+
+    Chunks (and merged accumulators) must follow each other in time
+    order, since trips, displacements and waiting times depend on
+    consecutive rows. So, a day can be split into shards, summarized
+    in parallel and combined left to right. Both `update` and `merge`
+    modify the accumulator in place and return it.
+
+    Results are equal to the batch functions, up to floating point
+    rounding for sums and variances.
+"""
+
+import copy
+import math
+
+from collections import Counter, OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from location import epoch, features, geodesic
+
+
+class _Accumulator(object):
+    """
+    Base class of accumulators.
+
+    Subclasses implement `_reset` (empty state), `_config` (values
+    that must be equal to merge two accumulators), `_summarize`
+    (accumulator of a chunk) and `_merge`.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _spawn(self):
+        acc = copy.copy(self)
+        acc._reset()
+        return acc
+
+    def update(self, chunk):
+        """
+        Adds the rows of a chunk.
+
+        Parameters
+        ----------
+        chunk : DataFrame
+            Location data following the rows added so far.
+
+        Returns
+        -------
+        self
+        """
+
+        if len(chunk) > 0:
+            self._merge(self._summarize(chunk))
+
+        return self
+
+    def merge(self, other):
+        """
+        Adds the rows summarized by another accumulator.
+
+        Parameters
+        ----------
+        other : accumulator
+            Accumulator of the same class and configuration, whose rows
+            follow the rows of this one.
+
+        Returns
+        -------
+        self
+        """
+
+        if (type(other) is not type(self) or
+                other._config() != self._config()):
+            raise ValueError('Only accumulators of the same kind and '
+                             'configuration can be merged')
+
+        self._merge(other)
+        return self
+
+
+class NumClustersAccumulator(_Accumulator):
+    """
+    Accumulates `features.num_clusters`.
+
+    Parameters
+    ----------
+    cluster_c : str
+        Location cluster id column. Default is 'cluster'.
+    """
+
+    def __init__(self, cluster_c='cluster'):
+        self.cluster_c = cluster_c
+        super(NumClustersAccumulator, self).__init__()
+
+    def _reset(self):
+        self.clusters = set()
+
+    def _config(self):
+        return (self.cluster_c,)
+
+    def _summarize(self, chunk):
+        acc = self._spawn()
+        acc.clusters.update(chunk[self.cluster_c].dropna())
+        return acc
+
+    def _merge(self, other):
+        self.clusters.update(other.clusters)
+
+    def result(self):
+        return len(self.clusters)
+
+
+class NumTripsAccumulator(_Accumulator):
+    """
+    Accumulates `features.num_trips`.
+
+    The state is the first and last cluster and the number of
+    transitions between them.
+
+    Parameters
+    ----------
+    cluster_c : str
+        Location cluster id column. Default is 'cluster'.
+    """
+
+    def __init__(self, cluster_c='cluster'):
+        self.cluster_c = cluster_c
+        super(NumTripsAccumulator, self).__init__()
+
+    def _reset(self):
+        self.n_rows = 0
+        self.first = None
+        self.last = None
+        self.trips = 0
+
+    def _config(self):
+        return (self.cluster_c,)
+
+    def _summarize(self, chunk):
+        acc = self._spawn()
+        values = chunk[self.cluster_c].dropna().values
+        if len(values) > 0:
+            acc.n_rows = len(values)
+            acc.first = values[0]
+            acc.last = values[-1]
+            acc.trips = int(np.sum(values[1:] != values[:-1]))
+
+        return acc
+
+    def _merge(self, other):
+        if other.n_rows == 0:
+            return
+
+        if self.n_rows == 0:
+            self.first = other.first
+        elif self.last != other.first:
+            self.trips += 1
+
+        self.n_rows += other.n_rows
+        self.last = other.last
+        self.trips += other.trips
+
+    def result(self):
+        if self.n_rows == 0:
+            return np.nan
+
+        return self.trips
+
+
+class LocVarAccumulator(_Accumulator):
+    """
+    Accumulates `features.loc_var`.
+
+    Latitude and longitude variances are accumulated with Welford's
+    algorithm: every chunk is reduced to its count, mean and sum of
+    squared deviations, and those are combined pairwise.
+
+    Parameters
+    ----------
+    lat_c, lon_c, cluster_c : str
+        Latitude, longitude, and cluster columns. Default values are
+        'latitude', 'longitude', and 'cluster' respectively.
+    """
+
+    def __init__(self, lat_c='latitude', lon_c='longitude',
+                 cluster_c='cluster'):
+        self.lat_c = lat_c
+        self.lon_c = lon_c
+        self.cluster_c = cluster_c
+        super(LocVarAccumulator, self).__init__()
+
+    def _reset(self):
+        # rows with a cluster
+        self.n_rows = 0
+
+        # latitude and longitude
+        self.count = np.zeros(2)
+        self.mean = np.zeros(2)
+        self.m2 = np.zeros(2)
+
+    def _config(self):
+        return (self.lat_c, self.lon_c, self.cluster_c)
+
+    def _summarize(self, chunk):
+        acc = self._spawn()
+        chunk = chunk.loc[~pd.isnull(chunk[self.cluster_c])]
+        acc.n_rows = len(chunk)
+
+        for i, c in enumerate((self.lat_c, self.lon_c)):
+            values = chunk[c].dropna().values.astype(float)
+            if len(values) > 0:
+                acc.count[i] = len(values)
+                acc.mean[i] = values.mean()
+                acc.m2[i] = np.sum((values - acc.mean[i]) ** 2)
+
+        return acc
+
+    def _merge(self, other):
+        self.n_rows += other.n_rows
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0,
+                            self.mean + delta * other.count / count, 0)
+            m2 = np.where(count > 0,
+                          self.m2 + other.m2 +
+                          delta ** 2 * self.count * other.count / count, 0)
+
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def result(self):
+        if self.n_rows == 0:
+            return np.nan
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            lat_v, lon_v = self.m2 / self.count
+
+        if abs(lat_v + lon_v) < 0.000000001:
+            return np.nan
+
+        return math.log(lat_v + lon_v)
+
+
+class TotalDistAccumulator(_Accumulator):
+    """
+    Accumulates `features.total_dist`.
+
+    A visit starts at the first row of consecutive rows with the same
+    cluster (rows without a cluster are skipped). The state is the
+    total distance between consecutive visit starts, the first two
+    and the last visit starts and the first distance, which are
+    needed when the first visit of a merged accumulator continues the
+    last visit of this one.
+
+    Parameters
+    ----------
+    cluster_c, lat_c, lon_c : str
+        Cluster, latitude and longitude columns. Default values are
+        'cluster', 'latitude' and 'longitude' respectively.
+
+    backend : str
+        Distance backend (see `geodesic`). Default is None, in that
+        case the global backend is used if set, Vincenty otherwise.
+    """
+
+    def __init__(self, cluster_c='cluster', lat_c='latitude',
+                 lon_c='longitude', backend=None):
+        self.cluster_c = cluster_c
+        self.lat_c = lat_c
+        self.lon_c = lon_c
+        self.backend = backend
+        super(TotalDistAccumulator, self).__init__()
+
+    def _reset(self):
+        self.n_visits = 0
+        # (cluster, lat, lon) of the first two and the last visit
+        self.head = []
+        self.last = None
+        self.first_dist = None
+        self.total = 0
+
+    def _config(self):
+        return (self.cluster_c, self.lat_c, self.lon_c, self.backend)
+
+    def _distance(self, a, b):
+        return geodesic.distance(a[1], a[2], b[1], b[2],
+                                 backend=self.backend, default='vincenty')
+
+    def _summarize(self, chunk):
+        acc = self._spawn()
+        chunk = chunk.loc[~pd.isnull(chunk[self.cluster_c])]
+        if len(chunk) == 0:
+            return acc
+
+        chunk = chunk.loc[chunk[self.cluster_c] !=
+                          chunk[self.cluster_c].shift()]
+        visits = list(zip(chunk[self.cluster_c].values,
+                          chunk[self.lat_c].values.astype(float),
+                          chunk[self.lon_c].values.astype(float)))
+
+        acc.n_visits = len(visits)
+        acc.head = visits[:2]
+        acc.last = visits[-1]
+        if len(visits) > 1:
+            lats = chunk[self.lat_c].values.astype(float)
+            lons = chunk[self.lon_c].values.astype(float)
+            d = geodesic.distance(lats[:-1], lons[:-1], lats[1:], lons[1:],
+                                  backend=self.backend, default='vincenty')
+            acc.first_dist = float(d[0])
+            acc.total = sum(d.tolist())
+
+        return acc
+
+    def _merge(self, other):
+        if other.n_visits == 0:
+            return
+
+        if self.n_visits == 0:
+            self.__dict__.update(copy.deepcopy(other.__dict__))
+            return
+
+        if self.last[0] != other.head[0][0]:
+            d = self._distance(self.last, other.head[0])
+            if self.n_visits == 1:
+                self.first_dist = d
+
+            self.total += d + other.total
+            self.n_visits += other.n_visits
+            self.head = (self.head + other.head)[:2]
+            self.last = other.last
+            return
+
+        # the first visit of other continues the last visit
+        if other.n_visits > 1:
+            d = self._distance(self.last, other.head[1])
+            if self.n_visits == 1:
+                self.first_dist = d
+
+            self.total += other.total - other.first_dist + d
+            self.head = (self.head + other.head[1:])[:2]
+            self.last = other.last
+
+        self.n_visits += other.n_visits - 1
+
+    def result(self):
+        return self.total
+
+
+def _half(ns):
+    """
+    Halves integer nanoseconds as pandas halves timedeltas
+    (truncating towards zero).
+    """
+
+    return np.sign(ns) * (np.abs(ns) // 2)
+
+
+class WaitTimeAccumulator(_Accumulator):
+    """
+    Accumulates `features.wait_time`.
+
+    The time spent at a row is half the time between its neighbors,
+    so the first and last rows of a chunk are pending until the
+    neighboring chunks (or `result`) are known. Visits (consecutive
+    rows with the same cluster) keep the sum of their completed rows.
+
+    Parameters
+    ----------
+    cluster_c : str
+        Cluster id column. Default is 'cluster'.
+
+    time_c : str
+        Time column. Default is 'index', in which case the index is
+        used.
+    """
+
+    def __init__(self, cluster_c='cluster', time_c='index'):
+        self.cluster_c = cluster_c
+        self.time_c = time_c
+        super(WaitTimeAccumulator, self).__init__()
+
+    def _reset(self):
+        self.n_rows = 0
+        # (time, cluster) of the first two and last two rows
+        self.head = []
+        self.tail = []
+        # [cluster, nanoseconds] of visits in order
+        self.visits = []
+
+    def _config(self):
+        return (self.cluster_c, self.time_c)
+
+    def _summarize(self, chunk):
+        acc = self._spawn()
+
+        if self.time_c == 'index':
+            times, _ = epoch.to_epoch(chunk.index)
+        else:
+            times, _ = epoch.to_epoch(chunk[self.time_c])
+        clusters = chunk[self.cluster_c].values
+        valid = ~pd.isnull(clusters)
+        n = len(times)
+
+        acc.n_rows = n
+        rows = list(zip(times, clusters))
+        acc.head = rows[:2]
+        acc.tail = rows[-2:]
+
+        # time spent at rows with both neighbors in the chunk
+        td = np.zeros(n, dtype=np.int64)
+        if n > 2:
+            td[1:-1] = _half((times[2:] - times[1:-1]) +
+                             (times[1:-1] - times[:-2]))
+
+        # visits start at valid rows following an invalid row or
+        # a row of another cluster
+        start = valid.copy()
+        start[1:] &= ~(valid[:-1] & (clusters[1:] == clusters[:-1]))
+        visit = np.cumsum(start) - 1
+
+        for v in np.flatnonzero(start):
+            acc.visits.append([clusters[v], 0])
+
+        if len(acc.visits) > 0:
+            sums = np.zeros(len(acc.visits), dtype=np.int64)
+            np.add.at(sums, visit[valid], td[valid])
+            for v, s in zip(acc.visits, sums):
+                v[1] = int(s)
+
+        return acc
+
+    def _add_time(self, row, ns, position):
+        """
+        Adds time spent at a pending row to its visit.
+        """
+
+        if not pd.isnull(row[1]):
+            self.visits[position][1] += int(ns)
+
+    def _merge(self, other):
+        if other.n_rows == 0:
+            return
+
+        if self.n_rows == 0:
+            self.__dict__.update(copy.deepcopy(other.__dict__))
+            return
+
+        last = self.tail[-1]
+        first = other.head[0]
+
+        # pending rows at the boundary get their missing neighbor
+        if self.n_rows > 1:
+            self._add_time(last, _half((first[0] - last[0]) +
+                                       (last[0] - self.tail[0][0])), -1)
+        if other.n_rows > 1:
+            other = copy.deepcopy(other)
+            other._add_time(first, _half((other.head[1][0] - first[0]) +
+                                         (first[0] - last[0])), 0)
+
+        visits = other.visits
+        if (len(self.visits) > 0 and len(visits) > 0 and
+                not pd.isnull(last[1]) and not pd.isnull(first[1]) and
+                last[1] == first[1]):
+            self.visits[-1][1] += visits[0][1]
+            visits = visits[1:]
+
+        self.visits.extend(visits)
+        self.n_rows += other.n_rows
+        self.head = (self.head + other.head)[:2]
+        self.tail = (self.tail + other.tail)[-2:]
+
+    def result(self):
+        """
+        Returns
+        -------
+        (waittime, cluster_wt) : (list, dict)
+            See `features.wait_time`.
+        """
+
+        if self.n_rows <= 1:
+            return [], {}
+
+        if len(self.visits) == 0:
+            # wait_time reports an empty visit if no row has a cluster
+            return [0], {}
+
+        acc = copy.deepcopy(self)
+        first, second = acc.head
+        acc._add_time(first, _half(second[0] - first[0]), 0)
+        before, last = acc.tail
+        acc._add_time(last, _half(last[0] - before[0]), -1)
+
+        waittime = [pd.Timedelta(ns).seconds for _, ns in acc.visits]
+
+        cluster_ns = OrderedDict()
+        for c, ns in acc.visits:
+            cluster_ns[c] = cluster_ns.get(c, 0) + ns
+        cluster_wt = {c: pd.Timedelta(ns).seconds
+                      for c, ns in cluster_ns.items()}
+
+        return waittime, cluster_wt
+
+
+class EntropyAccumulator(WaitTimeAccumulator):
+    """
+    Accumulates `features.entropy` inputs: waiting times (see
+    `WaitTimeAccumulator`), the time range and visited clusters.
+
+    Parameters
+    ----------
+    cluster_c, time_c : str
+        See `WaitTimeAccumulator`.
+    """
+
+    def _reset(self):
+        super(EntropyAccumulator, self)._reset()
+        self.min_time = None
+        self.max_time = None
+        self.clusters = set()
+
+    def _summarize(self, chunk):
+        acc = super(EntropyAccumulator, self)._summarize(chunk)
+
+        if self.time_c == 'index':
+            times, _ = epoch.to_epoch(chunk.index)
+        else:
+            times, _ = epoch.to_epoch(chunk[self.time_c])
+        acc.min_time = times.min()
+        acc.max_time = times.max()
+        acc.clusters.update(chunk[self.cluster_c].dropna())
+
+        return acc
+
+    def _merge(self, other):
+        if other.n_rows > 0 and self.n_rows > 0:
+            self.min_time = min(self.min_time, other.min_time)
+            self.max_time = max(self.max_time, other.max_time)
+            self.clusters.update(other.clusters)
+        elif other.n_rows > 0:
+            self.min_time = other.min_time
+            self.max_time = other.max_time
+            self.clusters = set(other.clusters)
+
+        super(EntropyAccumulator, self)._merge(other)
+
+    def wait_time(self):
+        """
+        Returns
+        -------
+        (waittime, cluster_wt) : (list, dict)
+            See `features.wait_time`.
+        """
+
+        return super(EntropyAccumulator, self).result()
+
+    def result(self):
+        """
+        Returns
+        -------
+        (ent, nent) : (float, float)
+            See `features.entropy`.
+        """
+
+        if self.n_rows == 0:
+            return np.nan, np.nan
+
+        total_time = pd.Timedelta(int(self.max_time - self.min_time)).seconds
+        wt, cwt = self.wait_time()
+
+        if len(wt) == 0:
+            return np.nan, np.nan
+
+        ent = 0
+        for k in cwt:
+            p = cwt[k] / total_time
+            ent -= p * math.log(p)
+
+        # the log of a single cluster is 0
+        n = len(self.clusters)
+        if n == 1:
+            return ent, np.nan
+
+        return ent, ent / math.log(n)
+
+
+class GyrationAccumulator(_Accumulator):
+    """
+    Accumulates `features.gyration_radius` inputs.
+
+    For every cluster, the number of rows and the sums of sines and
+    cosines of their coordinates (see `motif.get_geo_center`) are
+    kept, so the center of mass and the radius can be computed for
+    any subset of clusters.
+
+    Parameters
+    ----------
+    lat_c, lon_c, cluster_c : str
+        Columns of latitude, longitude, and cluster ids (geohash
+        values). Default values are 'latitude', 'longitude', and
+        'cluster' respectively.
+
+    backend : str
+        Distance backend (see `geodesic`). Default is None, in that
+        case the global backend is used if set, Vincenty otherwise.
+    """
+
+    def __init__(self, lat_c='latitude', lon_c='longitude',
+                 cluster_c='cluster', backend=None):
+        self.lat_c = lat_c
+        self.lon_c = lon_c
+        self.cluster_c = cluster_c
+        self.backend = backend
+        super(GyrationAccumulator, self).__init__()
+
+    def _reset(self):
+        # cluster -> [count, sum sin(lat), sum cos(lat), sum sin(lon),
+        # sum cos(lon)] in order of first appearance
+        self.clusters = OrderedDict()
+
+    def _config(self):
+        return (self.lat_c, self.lon_c, self.cluster_c, self.backend)
+
+    def _summarize(self, chunk):
+        acc = self._spawn()
+        chunk = chunk[[self.lat_c, self.lon_c, self.cluster_c]].dropna()
+        if len(chunk) == 0:
+            return acc
+
+        angle = math.pi / 180
+        lat = chunk[self.lat_c].values.astype(float) * angle
+        lon = chunk[self.lon_c].values.astype(float) * angle
+        terms = np.column_stack([np.ones(len(chunk)),
+                                 np.sin(lat), np.cos(lat),
+                                 np.sin(lon), np.cos(lon)])
+
+        codes, uniques = pd.factorize(chunk[self.cluster_c])
+        sums = np.zeros((len(uniques), terms.shape[1]))
+        np.add.at(sums, codes, terms)
+
+        for c, s in zip(uniques, sums):
+            acc.clusters[c] = s
+
+        return acc
+
+    def _merge(self, other):
+        for c, s in other.clusters.items():
+            if c in self.clusters:
+                self.clusters[c] = self.clusters[c] + s
+            else:
+                self.clusters[c] = s.copy()
+
+    def result(self, k=None):
+        """
+        Parameters
+        ----------
+        k : int
+            See `features.gyration_radius`.
+
+        Returns
+        -------
+        float
+            Radius of gyration in meters.
+        """
+
+        if len(self.clusters) == 0:
+            return np.nan
+
+        counts = Counter(OrderedDict(
+            (c, int(s[0])) for c, s in self.clusters.items()))
+        clusters = list(self.clusters)
+        if k is not None:
+            if k > len(clusters):
+                return np.nan
+
+            clusters = [x[0] for x in counts.most_common()[:k]]
+
+        sums = np.sum([self.clusters[c] for c in clusters], axis=0)
+        n = sums[0]
+        center_lat = math.atan2(sums[1] / n, sums[2] / n) * 180 / math.pi
+        center_lon = math.atan2(sums[3] / n, sums[4] / n) * 180 / math.pi
+
+        gps = np.array([features.convert_geohash_to_gps(c)
+                        for c in clusters], dtype=float)
+        d = geodesic.distance(center_lat, center_lon, gps[:, 0], gps[:, 1],
+                              backend=self.backend, default='vincenty')
+        cnt = np.array([counts[c] for c in clusters], dtype=float)
+
+        return math.sqrt(float(np.sum(cnt * d ** 2)) / n)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+    sweep
+    ~~~~~
+
+    Parameter sweeps over stay point thresholds.
+
+    Choosing stay point thresholds requires computing nodes for a grid
+    of values. Running `motif.compute_nodes` for each combination
+    repeats a lot of work, so `sweep_nodes` shares it across the grid:
+
+        - The greedy stay point segmentation only depends on the
+          distance threshold, so it is computed once per distance and
+          every time threshold is applied to the resulting runs.
+        - Stay regions of all precisions are computed in one pass
+          (see `motif.get_stay_regions`).
+        - Combinations resulting in the same stay points share their
+          stay regions and nodes.
+"""
+
+import numpy as np
+
+from location import instrument as instrumentation
+from location import motif
+
+
+def sweep_nodes(df,
+                dist_ths,
+                time_ths,
+                precisions=(7,),
+                lon_c='longitude',
+                lat_c='latitude',
+                node_args=None,
+                daily_args=None,
+                instrument=None):
+    """
+    Computes nodes for every combination of given thresholds.
+
+    Parameters
+    ----------
+    df : DataFrame
+        DataFrame with sorted DateTimeIndex.
+
+    dist_ths : iterables
+        Distance thresholds in meters, see `motif.get_stay_point`.
+
+    time_ths : iterables
+        Time thresholds, see `motif.get_stay_point`.
+
+    precisions : iterables
+        Geo hash precisions of stay regions, see
+        `motif.get_stay_region`. Default is (7,).
+
+    lon_c, lat_c, node_args, daily_args :
+        See `motif.compute_nodes`.
+
+    instrument : location.instrument.Instrument
+        Receives start/stop events for 'segment', 'stay_point',
+        'stay_region' and 'daily_nodes' stages (and 'sweep_nodes' as
+        a whole). Default is None, no events are emitted in that case.
+
+    Returns
+    -------
+    dict
+        Maps (dist_th, time_th, precision) tuples to (df, nodes)
+        tuples, the same values `motif.compute_nodes` returns with
+        corresponding `stay_point_args` and `stay_region_args`.
+        Combinations resulting in the same stay points share the
+        same objects, so they should not be modified in place.
+    """
+
+    if daily_args is None:
+        daily_args = {}
+
+    precisions = list(precisions)
+    results = {}
+
+    # stay point labels -> {precision: (df, nodes)}
+    cache = {}
+
+    with instrumentation.stage(instrument, 'sweep_nodes',
+                               rows_in=len(df)) as total:
+        data = df.loc[:, [lon_c, lat_c]].copy()
+
+        for dist_th in dist_ths:
+            with instrumentation.stage(instrument, 'segment',
+                                       rows_in=len(data)) as s:
+                runs = motif._stay_point_runs(data, lat_c=lat_c,
+                                              lon_c=lon_c, dist_th=dist_th)
+                s.rows_out = len(runs)
+
+            for time_th in time_ths:
+                with instrumentation.stage(instrument, 'stay_point',
+                                           rows_in=len(runs)) as s:
+                    stay_points = motif._label_stay_points(runs, time_th)
+                    key = np.asarray(stay_points, dtype=float).tobytes()
+                    s.rows_out = len(stay_points)
+
+                if key not in cache:
+                    cache[key] = _compute_regions_and_nodes(
+                        data, stay_points, precisions,
+                        lon_c=lon_c, lat_c=lat_c,
+                        node_args=node_args, daily_args=daily_args,
+                        instrument=instrument)
+
+                for precision in precisions:
+                    results[(dist_th, time_th, precision)] = \
+                        cache[key][precision]
+
+        total.rows_out = len(results)
+
+    return results
+
+
+def _compute_regions_and_nodes(data, stay_points, precisions,
+                               lon_c, lat_c, node_args, daily_args,
+                               instrument):
+    """
+    Computes stay regions and nodes for given stay points.
+
+    Returns
+    -------
+    dict
+        Maps precisions to (df, nodes) tuples.
+    """
+
+    data = data.copy()
+    data['stay_point'] = stay_points
+
+    with instrumentation.stage(instrument, 'stay_region',
+                               rows_in=len(data)) as s:
+        regions = motif.get_stay_regions(data, precisions=precisions,
+                                         lon_c=lon_c, lat_c=lat_c)
+        s.rows_out = len(regions)
+
+    results = {}
+    for precision in precisions:
+        df = data.copy()
+        df['stay_region'] = regions[precision]
+
+        stay = df.dropna(subset=['stay_region'])
+        with instrumentation.stage(instrument, 'daily_nodes',
+                                   rows_in=len(stay)) as s:
+            nodes = motif.generate_daily_nodes(stay,
+                                               hash_c='stay_region',
+                                               node_args=node_args,
+                                               **daily_args)
+            s.rows_out = len(nodes)
+
+        results[precision] = (df, nodes)
+
+    return results
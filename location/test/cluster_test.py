@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+    location.test.cluster_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Unit testing cluster module
+
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from location import cluster, geodesic, motif, spatial
+
+
+def get_location_data(seed=0):
+    """
+    Two stays at the same place separated by a trip, sampled
+    every minute.
+    """
+
+    rng = np.random.RandomState(seed)
+    home = (42.447, -76.483)
+    work = (42.44, -76.45)  # ~3km away
+
+    places = [home] * 60 + [work] * 40 + [home] * 50
+    lats = np.array([p[0] for p in places]) + rng.randn(150) * 0.0002
+    lons = np.array([p[1] for p in places]) + rng.randn(150) * 0.0002
+
+    # a single stray fix in the middle of the second stay
+    lats[80] += 0.02
+
+    time = pd.date_range('2016-11-16 08:00', periods=150, freq='1min')
+    return pd.DataFrame({'latitude': lats, 'longitude': lons},
+                        index=time)
+
+
+def brute_force_dbscan(df, dist_th, time_eps, min_samples):
+    """
+    Computes clusters without the grid (core fixes only).
+    """
+
+    times = df.index.asi8
+    lats = df.latitude.values
+    lons = df.longitude.values
+    time_eps = pd.to_timedelta(time_eps).value
+
+    d = spatial._haversine(lats[:, None], lons[:, None], lats, lons)
+    adjacent = (d <= dist_th) & (np.abs(times[:, None] - times) <= time_eps)
+    core = adjacent.sum(axis=1) >= min_samples
+
+    # connected components of core fixes
+    labels = -np.ones(len(df), dtype=int)
+    n = 0
+    for i in np.where(core)[0]:
+        if labels[i] >= 0:
+            continue
+        stack = [i]
+        labels[i] = n
+        while stack:
+            j = stack.pop()
+            for k in np.where(adjacent[j] & core)[0]:
+                if labels[k] < 0:
+                    labels[k] = n
+                    stack.append(k)
+        n += 1
+
+    return labels, core
+
+
+def test_st_dbscan():
+    df = get_location_data()
+    actual = cluster.st_dbscan(df, dist_th=200, time_th='30m',
+                               time_eps='5m', min_samples=3)
+
+    assert len(actual) == len(df)
+
+    # stays are split in time, the stray fix is noise
+    assert actual[:60] == [0] * 60
+    assert actual[60:80] + actual[81:100] == [1] * 39
+    assert np.isnan(actual[80])
+    assert actual[100:] == [2] * 50
+
+    # short stays are discarded
+    actual = cluster.st_dbscan(df, dist_th=200, time_th='45m',
+                               time_eps='5m', min_samples=3)
+    assert actual[:60] == [0] * 60
+    assert all(np.isnan(v) for v in actual[60:100])
+    assert actual[100:] == [1] * 50
+
+
+def test_st_dbscan_grid():
+    rng = np.random.RandomState(1)
+    n = 400
+    df = pd.DataFrame({'latitude': 60 + rng.rand(n) * 0.02,
+                       'longitude': 10 + rng.rand(n) * 0.02},
+                      index=pd.date_range('2016-11-16', periods=n,
+                                          freq='30s'))
+
+    actual = cluster.st_dbscan(df, dist_th=250, time_th='0s',
+                               time_eps='3m', min_samples=4)
+    expected, core = brute_force_dbscan(df, 250, '3m', 4)
+
+    # same partition of core fixes
+    actual = np.array(actual, dtype=float)
+    assert not np.isnan(actual[core]).any()
+    pairs = pd.crosstab(actual[core], expected[core])
+    assert ((pairs > 0).sum(axis=0) == 1).all()
+    assert ((pairs > 0).sum(axis=1) == 1).all()
+
+
+def test_st_dbscan_backend():
+    # near the equator, a degree of latitude is shorter on the
+    # ellipsoid than on the sphere
+    lat_cell, _ = cluster._grid_cell_size(300, np.zeros(1))
+    lat = lat_cell * 0.999
+    step = np.degrees(299.4 / 6335439.0)
+    assert geodesic.vincenty(lat, 0, lat + step, 0) < 300
+
+    df = pd.DataFrame({'latitude': [lat, lat + step] * 4,
+                       'longitude': [0.0] * 8},
+                      index=pd.date_range('2016-11-16', periods=8,
+                                          freq='1min'))
+
+    previous = geodesic.set_backend('vincenty')
+    try:
+        actual = cluster.st_dbscan(df, dist_th=300, time_th='0s',
+                                   time_eps='10m', min_samples=8)
+        expected, core = brute_force_dbscan(df, 300, '10m', 8)
+    finally:
+        geodesic.set_backend(previous)
+
+    assert core.all()
+    assert actual == [0] * 8
+
+    # same with the backend argument
+    assert cluster.st_dbscan(df, dist_th=300, time_th='0s',
+                             time_eps='10m', min_samples=8,
+                             backend='vincenty') == actual
+    # on the sphere, the fixes are too far apart
+    assert all(np.isnan(cluster.st_dbscan(df, dist_th=300, time_th='0s',
+                                          time_eps='10m', min_samples=8)))
+
+
+def test_compute_nodes_engine():
+    df = get_location_data()
+    args = {'dist_th': 200, 'time_th': '30m', 'time_eps': '5m'}
+    stay, nodes = motif.compute_nodes(df, stay_point_args=args,
+                                      engine='st_dbscan',
+                                      daily_args={'valid_day_th': 2})
+
+    expected = cluster.st_dbscan(df, **args)
+    assert stay.stay_point.equals(pd.Series(expected, index=df.index,
+                                            dtype=float))
+    assert stay.stay_region.notnull().sum() == len(df) - 1
+    assert len(nodes) == 1
+    assert nodes[0][1].node.nunique() == 2
+
+    with pytest.raises(ValueError):
+        motif.compute_nodes(df, engine='unknown')
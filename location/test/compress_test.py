@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+    location.test.compress_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Unit testing compress module
+
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from location import compress, counters, motif, spatial
+
+
+def get_location_data(seed=0, n=1500):
+    """
+    A trace alternating between stationary periods (with GPS noise)
+    and moving periods, one fix every 20 seconds.
+    """
+
+    rng = np.random.RandomState(seed)
+    lat, lon = 42.447, -76.483
+
+    lats = []
+    lons = []
+    while len(lats) < n:
+        k = rng.randint(5, 120)
+        if rng.rand() < 0.5:
+            # stationary
+            lats.extend(lat + rng.randn(k) * 0.00005)
+            lons.extend(lon + rng.randn(k) * 0.00005)
+        else:
+            # moving
+            lats.extend(lat + np.cumsum(rng.randn(k) * 0.0005))
+            lons.extend(lon + np.cumsum(rng.randn(k) * 0.0005))
+            lat, lon = lats[-1], lons[-1]
+
+    time = pd.date_range('2016-11-16', periods=n, freq='20s',
+                         tz='America/New_York')
+    return pd.DataFrame({'latitude': lats[:n], 'longitude': lons[:n]},
+                        index=time)
+
+
+def test_collapse_runs():
+    df = get_location_data()
+    runs = compress.collapse_runs(df, eps=15)
+
+    assert runs.weight.sum() == len(df)
+    assert len(runs) < len(df)
+    assert (runs['first'].values == np.cumsum(
+        np.append(0, runs.weight.values[:-1]))).all()
+    assert (runs.index == df.index[runs['first'].values]).all()
+    assert (runs.end_time.values ==
+            df.index[runs['first'].values + runs.weight.values - 1].values
+            ).all()
+
+    # every fix is within the radius of its representative
+    run_of = np.repeat(np.arange(len(runs)), runs.weight.values)
+    d = spatial._haversine(runs.latitude.values[run_of],
+                           runs.longitude.values[run_of],
+                           df.latitude.values, df.longitude.values)
+    assert (d <= runs.radius.values[run_of] + 1e-9).all()
+    assert (runs.radius <= 15).all()
+
+    # runs are maximal
+    nxt = runs['first'].values[1:]
+    d = spatial._haversine(runs.latitude.values[:-1],
+                           runs.longitude.values[:-1],
+                           df.latitude.values[nxt],
+                           df.longitude.values[nxt])
+    assert (d > 15).all()
+
+
+@pytest.mark.parametrize('eps', [5, 15, 50, 200])
+def test_collapse_stay_point(eps):
+    df = get_location_data()
+    runs = compress.collapse_runs(df, eps=eps)
+
+    for dist_th in [50, 200]:
+        with counters.counting():
+            expected = motif.get_stay_point(df, dist_th=dist_th,
+                                            time_th='5m')
+            n_expected = counters.snapshot()['stay_point_distance']
+            counters.reset()
+
+            actual = motif.get_stay_point(df, dist_th=dist_th,
+                                          time_th='5m', collapsed=runs)
+            n_actual = counters.snapshot()['stay_point_distance']
+
+        assert pd.Series(actual).equals(pd.Series(expected))
+
+        # ambiguous runs cost at most one extra evaluation
+        assert n_actual <= 2 * n_expected
+        if eps * 4 <= dist_th:
+            assert n_actual < n_expected
+
+
+def test_decimate():
+    df = get_location_data()
+    actual = compress.decimate(df, interval='1min')
+
+    assert len(actual) == len(df) // 3
+    assert (actual.index.second == 0).all()
+    assert actual.equals(df.iloc[::3])
+
+
+def test_douglas_peucker():
+    df = get_location_data()
+    actual = compress.douglas_peucker(df, eps=20, stationary_eps=15)
+
+    assert len(actual) < len(df)
+    assert actual.index[0] == df.index[0]
+    assert actual.index[-1] == df.index[-1]
+    assert actual.index.isin(df.index).all()
+
+    # stationary fixes are kept
+    runs = compress.collapse_runs(df, eps=15)
+    stationary = np.repeat(runs.weight.values > 1, runs.weight.values)
+    assert df.index[stationary].isin(actual.index).all()
+
+    # a straight line is reduced to its end points
+    line = pd.DataFrame({'latitude': np.linspace(42, 42.1, 50),
+                         'longitude': np.linspace(-76, -76.1, 50)},
+                        index=pd.date_range('2016-11-16', periods=50,
+                                            freq='1min'))
+    actual = compress.douglas_peucker(line, eps=5, stationary_eps=1)
+    assert actual.index.tolist() == [line.index[0], line.index[-1]]
+
+
+def test_compute_nodes_compression():
+    df = get_location_data()
+    args = {'stay_point_args': {'dist_th': 100, 'time_th': '10m'},
+            'daily_args': {'valid_day_th': 2}}
+
+    stay, nodes = motif.compute_nodes(df, **args)
+    actual_stay, actual_nodes = motif.compute_nodes(
+        df, compression='collapse', compression_args={'eps': 20}, **args)
+
+    assert stay.equals(actual_stay)
+    assert len(nodes) == len(actual_nodes)
+    for (t1, n1), (t2, n2) in zip(nodes, actual_nodes):
+        assert t1 == t2
+        assert n1.equals(n2)
+
+    actual_stay, _ = motif.compute_nodes(
+        df, compression='decimate', compression_args={'interval': '1min'},
+        **args)
+    assert len(actual_stay) == len(df) // 3
+
+    actual_stay, _ = motif.compute_nodes(
+        df, compression='douglas_peucker', **args)
+    assert len(actual_stay) < len(df)
+
+    with pytest.raises(ValueError):
+        motif.compute_nodes(df, compression='unknown')
+
+    with pytest.raises(ValueError):
+        motif.compute_nodes(df, compression='collapse', engine='st_dbscan')
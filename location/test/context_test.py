@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+    location.test.context_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Unit testing context module
+
+"""
+
+from unittest.mock import patch
+
+import geohash
+import numpy as np
+import pandas as pd
+
+from location import counters, geodesic, motif
+from location.context import ParticipantContext
+
+
+def get_location_data():
+    timestamp = pd.Timestamp('2016-01-07 03:30:00-0500')
+    df = pd.DataFrame()
+    stay_region = ['dr5rw5u'] * 20
+    stay_region.extend(['dr5xg57'] * 70)
+    df['stay_region'] = stay_region
+    df['time'] = pd.date_range(timestamp, periods=90, freq='15min')
+    return df.set_index('time')
+
+
+def test_home():
+    df = get_location_data()
+    context = ParticipantContext(df)
+
+    with patch.object(motif, '_home_location',
+                      wraps=motif._home_location) as p:
+        assert context.home == 'dr5rw5u'
+        assert context.home == 'dr5rw5u'
+        assert motif.get_home_location(None, context=context) == 'dr5rw5u'
+
+    assert p.call_count == 1
+
+    # no home location in the data
+    df = df.iloc[:40]
+    df.index = df.index + pd.to_timedelta('3H')
+    context = ParticipantContext(df)
+    with patch.object(motif, '_home_location',
+                      wraps=motif._home_location) as p:
+        assert context.home is None
+        assert context.home is None
+    assert p.call_count == 1
+
+    # given home location
+    context = ParticipantContext(df, home='dr5xg57')
+    assert context.home == 'dr5xg57'
+
+
+def test_time_bins():
+    df = get_location_data()
+    context = ParticipantContext(df)
+
+    assert np.all(context.hours == df.index.hour)
+    assert np.all(context.dayofweek == df.index.dayofweek)
+    assert context.hours is context.hours
+
+
+def test_coordinates():
+    context = ParticipantContext(get_location_data())
+
+    with counters.counting():
+        for _ in range(3):
+            c = context.coordinates('dr5rw5u')
+            assert c == geohash.decode('dr5rw5u')
+
+        snapshot = counters.snapshot()
+
+    assert snapshot['context_coordinates_misses'] == 1
+    assert snapshot['context_coordinates_hits'] == 2
+    assert snapshot['geohash_decode'] == 1
+
+
+def test_distances():
+    context = ParticipantContext(get_location_data(), max_distances=3)
+    a, b, c = 'dr5rw5u', 'dr5xg57', 'dr5ru6b'
+
+    with counters.counting():
+        d = context.distances([a, b, a], [b, a, a])
+        snapshot = counters.snapshot()
+
+    # unordered pairs are computed once, every lookup is counted
+    assert snapshot['context_distance_misses'] == 2
+    assert snapshot['context_distance_hits'] == 1
+    assert d[0] == d[1]
+    assert d[2] == 0
+    assert d[0] == geodesic.vincenty(*(geohash.decode(a) +
+                                       geohash.decode(b)))
+
+    # backends are cached separately
+    h = context.distances([a], [b], backend='haversine')
+    assert h[0] == geodesic.haversine(*(geohash.decode(a) +
+                                        geohash.decode(b)))
+
+    # least recently used pairs are evicted
+    context.distances([b], [c])
+    assert len(context._distances) == 3
+    assert (a, b, 'vincenty') not in context._distances
+    assert (a, a, 'vincenty') in context._distances
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+    location.test.counters_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Unit testing counters module
+
+"""
+
+import pytest
+
+from location import counters
+
+
+@pytest.fixture
+def registry():
+    with counters.counting():
+        yield
+
+
+def test_add(registry):
+    counters.add('a')
+    counters.add('a', 2)
+    counters.add('b', 5)
+    assert counters.snapshot() == {'a': 3, 'b': 5}
+
+    counters.disable()
+    counters.add('a')
+    assert not counters.is_enabled()
+    assert counters.snapshot() == {'a': 3, 'b': 5}
+
+    counters.reset()
+    assert counters.snapshot() == {}
+
+
+def test_merge(registry):
+    counters.add('a')
+    counters.merge({'a': 2, 'b': 1})
+    assert counters.snapshot() == {'a': 3, 'b': 1}
+
+
+def test_counting():
+    counters.add('a')
+    with counters.counting():
+        assert counters.is_enabled()
+        counters.add('a')
+        assert counters.snapshot() == {'a': 1}
+
+    assert not counters.is_enabled()
+    assert counters.snapshot() == {}
+
+
+def test_to_prometheus():
+    text = counters.to_prometheus({'b': 2, 'a.x': 1})
+    expected = ('# TYPE location_a_x_total counter\n'
+                'location_a_x_total 1\n'
+                '# TYPE location_b_total counter\n'
+                'location_b_total 2\n')
+    assert text == expected
+
+    text = counters.to_prometheus({'a_total': 1}, prefix='')
+    assert text == '# TYPE a_total counter\na_total 1\n'
+
+
+def test_write_prometheus(registry, tmpdir):
+    counters.add('a', 4)
+    path = str(tmpdir.join('location.prom'))
+    counters.write_prometheus(path)
+
+    with open(path) as f:
+        assert f.read() == counters.to_prometheus()
+
+    # no temporary files left behind
+    assert tmpdir.listdir() == [tmpdir.join('location.prom')]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+    location.test.epoch_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Unit testing epoch module
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from location import epoch
+
+
+def test_to_epoch():
+    index = pd.date_range('2016-03-12', periods=10, freq='7H',
+                          tz='America/New_York')
+    ns, tz = epoch.to_epoch(index)
+
+    assert ns.dtype == np.int64
+    assert tz.zone == 'America/New_York'
+    assert ns[0] == index[0].value
+    assert (np.diff(ns) == pd.to_timedelta('7H').value).all()
+
+    ns, tz = epoch.to_epoch(index.tz_localize(None))
+    assert tz is None
+
+
+def test_hour_of_day_and_day_of_week():
+    # crosses a daylight saving time change
+    index = pd.date_range('2016-03-10', periods=200, freq='53min',
+                          tz='America/New_York')
+    local_ns = epoch.local_epoch(index)
+
+    assert (epoch.hour_of_day(local_ns) == index.hour).all()
+    assert (epoch.day_of_week(local_ns) == index.dayofweek).all()
+
+    # before epoch
+    index = pd.date_range('1969-12-25', periods=30, freq='11H')
+    local_ns = epoch.local_epoch(index)
+    assert (epoch.hour_of_day(local_ns) == index.hour).all()
+    assert (epoch.day_of_week(local_ns) == index.dayofweek).all()
+
+
+def test_to_timestamps():
+    index = pd.date_range('2016-11-05', periods=5, freq='12H',
+                          tz='America/New_York')
+    ns, tz = epoch.to_epoch(index)
+
+    actual = epoch.to_timestamps(ns, tz)
+    assert (actual == index).all()
+    assert actual.tz.zone == 'America/New_York'
+
+    actual = epoch.to_timestamps(epoch.local_epoch(index))
+    assert actual.tz is None
+    assert (actual == index.tz_localize(None)).all()
@@ -10,6 +10,8 @@ import numpy as np
 import pandas as pd
 import pytest
 import location.features as lf
+from location import counters, motif
+from location.context import ParticipantContext
 from geopy.distance import vincenty
 import math
 import geohash
@@ -459,3 +461,114 @@ def test_convert_and_append_geohash():
                                    'latitude',
                                    'longitude'])
     assert df2.equals(lf.convert_and_append_geohash(df))
+
+
+def test_daily_features():
+    time = pd.date_range('2015-04-14 00:00:00', periods=96, freq='30min')
+    df = pd.DataFrame({'latitude': [40.72] * 96, 'longitude': [-73.98] * 96,
+                       'stay_region': ['dr5rsqq'] * 96}, index=time)
+    df.loc[time[16:34], 'stay_region'] = 'dr5ru6b'
+    df.loc[time[16:34], 'latitude'] = 40.75
+    df.loc[time[34], 'stay_region'] = np.nan
+
+    days = pd.to_datetime(['2015-04-14', '2015-04-15', '2015-04-16'])
+    actual = lf.daily_features(df, days)
+
+    assert actual.index.tolist() == days.tolist()
+    assert actual.loc[days[0], 'num_clusters'] == 2
+    assert actual.loc[days[0], 'num_trips'] == 2
+    assert actual.loc[days[1], 'num_clusters'] == 1
+    assert actual.loc[days[1], 'num_trips'] == 0
+    assert actual.loc[days[2], 'num_clusters'] == 0
+
+    day = df.loc[df.index < days[1]]
+    assert actual.loc[days[0], 'total_dist'] == lf.total_dist(
+        day, cluster_c='stay_region')
+    assert actual.loc[days[0], 'home_stay'] == lf.home_stay(
+        day, 'dr5rsqq', cluster_c='stay_region')
+    assert actual.loc[days[0], 'entropy'] == lf.entropy(
+        day, cluster_c='stay_region')[0]
+
+
+def test_day_slices():
+    rs = np.random.RandomState(0)
+    time = pd.date_range('2015-04-14', periods=500, freq='17min',
+                         tz='America/New_York')
+    df = pd.DataFrame({'x': np.arange(500)}, index=time)
+    days = pd.date_range('2015-04-13', periods=8, freq='1D',
+                         tz='America/New_York')
+
+    # sorted, shuffled and repeated timestamps
+    shuffled = df.iloc[rs.permutation(len(df))]
+    repeated = df.iloc[np.repeat(np.arange(0, 500, 2), 2)]
+    for data in (df, shuffled, repeated, df.iloc[:0]):
+        actual = list(lf._day_slices(data, days))
+        assert len(actual) == len(days)
+        for d, day in zip(days, actual):
+            end = d + pd.to_timedelta('1D')
+            expected = next(motif.get_df_slices(data, [d, end]))
+            assert day.x.tolist() == expected.x.tolist()
+
+
+def test_daily_features_context_home():
+    time = pd.date_range('2015-04-14 00:00:00', periods=96 * 30,
+                         freq='15min')
+    regions = np.array(['dr5rsqq', 'dr5ru6b', 'dr5rw5u', 'dr5xg57'])
+    rs = np.random.RandomState(0)
+    visits = np.repeat(rs.randint(0, 4, 96 * 30 // 8), 8)
+    visits[::96] = 0
+    df = pd.DataFrame({'stay_region': regions[visits]}, index=time)
+    # fixes around the region centers
+    df['latitude'] = [geohash.decode(r)[0] + rs.normal(0, 0.0005)
+                      for r in df.stay_region]
+    df['longitude'] = [geohash.decode(r)[1] + rs.normal(0, 0.0005)
+                       for r in df.stay_region]
+
+    days = pd.date_range('2015-04-14', periods=30, freq='1D')
+    context = ParticipantContext(df)
+
+    with counters.counting():
+        actual = lf.daily_features(df, days, context=context)
+        snapshot = counters.snapshot()
+
+    # the home location of the context gives the same result
+    expected = lf.daily_features(df, days)
+    assert actual.columns.tolist() == expected.columns.tolist()
+    assert np.array_equal(actual.isnull().values, expected.isnull().values)
+    assert (actual.fillna(0).values == expected.fillna(0).values).all()
+
+    # the distance cache is not used
+    assert snapshot.get('context_distance_misses', 0) == 0
+
+    # the home location is taken from the context
+    context = ParticipantContext(df, home='dr5ru6b')
+    actual = lf.daily_features(df, days, context=context)
+    expected = lf.daily_features(df, days, home_loc='dr5ru6b')
+    assert actual.home_stay.equals(expected.home_stay)
+    assert not actual.home_stay.equals(
+        lf.daily_features(df, days).home_stay)
+
+
+def test_accurate_mode():
+    rs = np.random.RandomState(0)
+    lats = rs.uniform(-60, 60, 50)
+    lons = rs.uniform(-180, 180, 50)
+    df = pd.DataFrame({'latitude': lats, 'longitude': lons,
+                       'cluster': np.arange(50)})
+
+    # vectorized Vincenty matches geopy
+    expected = [vincenty((lats[i], lons[i]), (lats[i + 1], lons[i + 1])).m
+                for i in range(49)]
+    actual = lf.displacement(df)
+    assert np.abs(np.array(actual) - expected).max() < 1e-3
+    total = sum(expected)
+    assert lf.total_dist(df) == pytest.approx(total)
+
+    expected = max(vincenty((lats[i], lons[i]), (lats[j], lons[j])).m
+                   for i in range(50) for j in range(i + 1, 50))
+    assert lf.max_dist_between_clusters(df) == pytest.approx(expected)
+
+    # other backends
+    assert lf.total_dist(df, backend='haversine') == \
+        pytest.approx(total, rel=0.01)
+    assert lf.total_dist(df, backend='haversine') != lf.total_dist(df)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+    location.test.geodesic_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Unit testing geodesic module
+
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from geopy.distance import great_circle, vincenty
+from pytest import approx
+
+from location import compress, geodesic, motif
+
+
+def get_pairs(n=200, seed=0):
+    rs = np.random.RandomState(seed)
+    # short and long distances
+    lat1 = rs.uniform(-80, 80, n)
+    lon1 = rs.uniform(-180, 180, n)
+    lat2 = np.where(np.arange(n) % 2 == 0,
+                    lat1 + rs.uniform(-0.01, 0.01, n),
+                    rs.uniform(-80, 80, n))
+    lon2 = np.where(np.arange(n) % 2 == 0,
+                    lon1 + rs.uniform(-0.01, 0.01, n),
+                    rs.uniform(-180, 180, n))
+    return lat1, lon1, lat2, lon2
+
+
+def test_kernels():
+    lat1, lon1, lat2, lon2 = get_pairs()
+    pairs = list(zip(lat1, lon1, lat2, lon2))
+
+    expected = np.array([great_circle((a, b), (c, d)).m
+                         for a, b, c, d in pairs])
+    actual = geodesic.haversine(lat1, lon1, lat2, lon2)
+    assert np.allclose(actual, expected, rtol=1e-9, atol=0)
+    actual = geodesic.cosine(lat1, lon1, lat2, lon2)
+    assert np.allclose(actual, expected, rtol=1e-6, atol=0)
+
+    expected = np.array([vincenty((a, b), (c, d)).m
+                         for a, b, c, d in pairs])
+    actual = geodesic.vincenty(lat1, lon1, lat2, lon2)
+    assert np.abs(actual - expected).max() < 1e-6
+
+    # scalars and broadcasting
+    d = geodesic.vincenty(lat1[0], lon1[0], lat2[0], lon2[0])
+    assert isinstance(d, float)
+    assert d == approx(expected[0])
+    d = geodesic.haversine(lat1[0], lon1[0], lat2[:3], lon2[:3])
+    assert d.shape == (3,)
+
+
+def test_vincenty_special_cases():
+    # coincident points
+    assert geodesic.vincenty(42.44, -76.48, 42.44, -76.48) == 0
+    # along the equator
+    assert geodesic.vincenty(0, 0, 0, 1) == \
+        approx(vincenty((0, 0), (0, 1)).m)
+    # nearly antipodal points do not converge, they fall back to a
+    # great circle distance
+    with pytest.raises(ValueError):
+        vincenty((0, 0), (0.5, 179.7))
+    assert np.isnan(geodesic.vincenty(0, 0, 0.5, 179.7, fallback=False))
+    d = geodesic.vincenty([0, 0], [0, 0], [0.5, 0.5], [179.7, 1])
+    assert d[0] == approx(great_circle((0, 0), (0.5, 179.7)).m, rel=5e-3)
+    assert d[1] == approx(vincenty((0, 0), (0.5, 1)).m)
+
+
+def test_vincenty_geopy():
+    # vincenty matches geopy within millimeters at all distances
+    rs = np.random.RandomState(1)
+    n = 5000
+    lat1 = rs.uniform(-90, 90, n)
+    lon1 = rs.uniform(-180, 180, n)
+    scale = 10 ** rs.uniform(-6, 2, n)
+    lat2 = np.clip(lat1 + rs.uniform(-1, 1, n) * scale, -90, 90)
+    lon2 = lon1 + rs.uniform(-1, 1, n) * scale * 2
+
+    expected = []
+    for pair in zip(lat1, lon1, lat2, lon2):
+        try:
+            expected.append(vincenty(pair[:2], pair[2:]).m)
+        except ValueError:
+            expected.append(np.nan)
+    expected = np.array(expected)
+    converged = ~np.isnan(expected)
+
+    actual = geodesic.vincenty(lat1, lon1, lat2, lon2)
+    assert converged.sum() > n * 0.99
+    assert np.abs(actual - expected)[converged].max() < 1e-3
+    assert not np.isnan(actual).any()
+
+
+def test_backend():
+    assert geodesic.get_backend() == 'haversine'
+    assert geodesic.get_backend(default='vincenty') == 'vincenty'
+
+    previous = geodesic.set_backend('cosine')
+    try:
+        assert previous is None
+        assert geodesic.get_backend(default='vincenty') == 'cosine'
+        assert geodesic.get_backend('vincenty') == 'vincenty'
+        assert geodesic.distance(0, 0, 0, 1) == \
+            approx(geodesic.cosine(0, 0, 0, 1))
+    finally:
+        geodesic.set_backend(previous)
+
+    assert geodesic.get_backend() == 'haversine'
+
+    with pytest.raises(ValueError):
+        geodesic.set_backend('manhattan')
+    with pytest.raises(ValueError):
+        geodesic.distance(0, 0, 0, 1, backend='manhattan')
+
+
+@pytest.mark.parametrize('backend', geodesic.BACKENDS)
+def test_stay_point_backend(backend):
+    rs = np.random.RandomState(0)
+    n = 600
+    index = pd.date_range('2017-01-01', periods=n, freq='1min')
+    # visits with jitter and trips between them
+    centers = np.repeat(rs.uniform(-0.02, 0.02, (6, 2)), n // 6, axis=0)
+    df = pd.DataFrame({'latitude': 42.44 + centers[:, 0] +
+                       rs.normal(0, 0.0003, n),
+                       'longitude': -76.48 + centers[:, 1] +
+                       rs.normal(0, 0.0003, n)},
+                      index=index)
+
+    expected = motif.get_stay_point(df)
+    actual = motif.get_stay_point(df, backend=backend)
+    assert np.allclose(expected, actual, equal_nan=True)
+
+    # runs are measured with the same kernel, so they do not change
+    # the result
+    collapsed = compress.collapse_runs(df, eps=30)
+    actual = motif.get_stay_point(df, collapsed=collapsed, backend=backend)
+    assert np.allclose(expected, actual, equal_nan=True)
+
+
+@pytest.mark.parametrize('backend', geodesic.BACKENDS)
+@pytest.mark.parametrize('dist_th', [0, 1, 300, 50000])
+def test_within(backend, dist_th):
+    rs = np.random.RandomState(0)
+    n = 5000
+    kernel = geodesic.get_kernel(backend)
+
+    # pairs around the threshold at all latitudes, some of them across
+    # the antimeridian
+    lat1 = rs.uniform(-89, 89, n)
+    lon1 = np.where(rs.uniform(size=n) < 0.1, 179.999,
+                    rs.uniform(-180, 180, n))
+    bearing = rs.uniform(0, 2 * np.pi, n)
+    d = max(dist_th, 1) * rs.uniform(0, 2, n)
+    lat2 = lat1 + np.degrees(d * np.cos(bearing) / geodesic.EARTH_RADIUS)
+    lon2 = lon1 + np.degrees(d * np.sin(bearing) / geodesic.EARTH_RADIUS /
+                             np.cos(np.radians(lat1)))
+    lon2 = (lon2 + 180) % 360 - 180
+    lat2 = np.clip(lat2, -90, 90)
+
+    # coincident pairs
+    lat2[:10] = lat1[:10]
+    lon2[:10] = lon1[:10]
+
+    expected = kernel(lat1, lon1, lat2, lon2) <= dist_th
+    actual = geodesic.within(lat1, lon1, lat2, lon2, dist_th,
+                             backend=backend)
+    assert np.array_equal(actual, expected)
+
+    _, n_exact = geodesic.within(lat1, lon1, lat2, lon2, dist_th,
+                                 backend=backend, return_evaluations=True)
+    if dist_th == 300:
+        assert n_exact < n / 10
+
+    assert geodesic.within(0, 0, 0, 1, 111000) is False
+    assert geodesic.within(0, 0, 0, 1, 112000) is True
+    result, n_exact = geodesic.within(0, 0, 0, 1, 112000,
+                                      return_evaluations=True)
+    assert result is True and n_exact <= 1
+
+
+def test_fast_stay_point():
+    rs = np.random.RandomState(1)
+    n = 2000
+    index = pd.date_range('2017-01-01', periods=n, freq='1min')
+    steps = rs.normal(0, 0.0005, (n, 2))
+    steps[rs.uniform(size=n) < 0.02] *= 20
+    df = pd.DataFrame({'latitude': 42.44 + steps[:, 0].cumsum(),
+                       'longitude': -76.48 + steps[:, 1].cumsum()},
+                      index=index)
+
+    for backend in geodesic.BACKENDS:
+        for dist_th in (50, 300):
+            expected = motif.get_stay_point(df, dist_th=dist_th,
+                                            backend=backend)
+            actual = motif.get_stay_point(df, dist_th=dist_th,
+                                          backend=backend, fast=True)
+            assert np.allclose(expected, actual, equal_nan=True)
+
+    with pytest.raises(ValueError):
+        motif.get_stay_point(df, fast=True,
+                             collapsed=compress.collapse_runs(df))
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+    location.test.helpers
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Location data shared by unit tests
+
+"""
+
+import pandas as pd
+
+
+def get_stay_point_df():
+    """
+    Generates location data resulting in one stay point
+    per hour for 8 hours.
+
+    Returns
+    -------
+    (df, start) : (DataFrame, Timestamp)
+        Location data and the first timestamp.
+    """
+
+    # We need at least 8 records for generate_daily_nodes
+    # And, for each of this value, we should have a stay
+    # point. This means, we need
+    #    i) at least two subsequent within 300m of each other,
+    #   ii) the timestamp between each pair should be >= 30 mins
+    #   iii) each pair should be followed by another point which
+    #   is suffciently far enough (> 300 m)
+
+    coords = [(-76.48327, 42.44701),
+              (-76.4761338923341, 42.44583908268239)]
+    time = []
+    longitudes = []
+    latitudes = []
+    start = pd.to_datetime('2016-11-16')
+    for index, h in enumerate(range(8)):
+        s = start + pd.to_timedelta('{0}h'.format(h))
+        time.append(s)
+
+        # next time stamp should be at least 30 mins away
+        n = s + pd.to_timedelta('45min')
+        time.append(n)
+
+        c = coords[index % 2 == 0]
+        # we need two records
+        longitudes.extend([c[0]] * 2)
+        latitudes.extend([c[1]] * 2)
+
+    df = pd.DataFrame({'longitude': longitudes,
+                       'latitude': latitudes}, index=time)
+
+    return df, start
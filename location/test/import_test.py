@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+    location.test.import_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Testing import cost of the package
+
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+
+# seconds spent importing the package on top of its dependencies
+IMPORT_BUDGET = 0.5
+
+SCRIPT = '''
+import json, sys, time
+t = time.perf_counter()
+import geohash, numpy, pandas
+t1 = time.perf_counter()
+import {0}
+t2 = time.perf_counter()
+print(json.dumps({{'time': t2 - t1,
+                   'modules': [m for m in ('networkx', 'geopy')
+                               if m in sys.modules]}}))
+'''
+
+
+def run_import(module):
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in [env.get('PYTHONPATH')] if p])
+
+    out = subprocess.check_output([sys.executable, '-c',
+                                   SCRIPT.format(module)], env=env)
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+
+def test_import_features():
+    result = run_import('location.features')
+
+    assert result['modules'] == []
+    assert result['time'] < IMPORT_BUDGET
+
+
+def test_import_utils():
+    result = run_import('location.utils')
+
+    assert result['modules'] == []
+    assert result['time'] < IMPORT_BUDGET
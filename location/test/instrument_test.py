@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+    location.test.instrument_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Unit testing instrument module
+
+"""
+
+import json
+import tracemalloc
+from io import StringIO
+
+import pytest
+
+from location import instrument
+
+
+def test_stage():
+    received = []
+    instr = instrument.Instrument(callback=received.append)
+
+    with instr.stage('a', rows_in=10) as s:
+        s.rows_out = 4
+
+    assert len(instr.events) == 2
+    assert received == instr.events
+
+    start, stop = instr.events
+    assert start['stage'] == 'a'
+    assert start['event'] == 'start'
+    assert start['rows_in'] == 10
+
+    assert stop['event'] == 'stop'
+    assert stop['rows_in'] == 10
+    assert stop['rows_out'] == 4
+    assert stop['wall'] >= 0
+    assert stop['cpu'] >= 0
+    assert stop['error'] is None
+
+    assert instr.stop_events() == [stop]
+    assert instr.stop_events('b') == []
+
+
+def test_stage_error():
+    instr = instrument.Instrument()
+
+    with pytest.raises(ValueError):
+        with instr.stage('a'):
+            raise ValueError()
+
+    assert instr.stop_events('a')[0]['error'] == 'ValueError'
+
+
+def test_stage_without_instrument():
+    with instrument.stage(None, 'a', rows_in=1) as s:
+        s.rows_out = 2
+
+    instr = instrument.Instrument(keep_events=False)
+    with instrument.stage(instr, 'a'):
+        pass
+
+    assert instr.events == []
+
+
+def test_json_lines_writer():
+    f = StringIO()
+    instr = instrument.Instrument(callback=instrument.JsonLinesWriter(f))
+
+    with instr.stage('a', rows_in=1) as s:
+        s.rows_out = 1
+
+    lines = f.getvalue().splitlines()
+    assert len(lines) == 2
+    assert [json.loads(l)['event'] for l in lines] == ['start', 'stop']
+
+
+def test_memory():
+    instr = instrument.Instrument(memory=True)
+
+    with instr.stage('outer'):
+        with instr.stage('inner'):
+            x = bytearray(10 ** 6)
+            del x
+        y = bytearray(10 ** 5)
+        del y
+
+    assert tracemalloc.is_tracing()
+    instr.close()
+    assert not tracemalloc.is_tracing()
+
+    inner = instr.stop_events('inner')[0]
+    outer = instr.stop_events('outer')[0]
+    assert inner['peak_traced'] >= 10 ** 6
+    # the outer stage includes the peak of the nested stage
+    assert outer['peak_traced'] >= inner['peak_traced']
+    assert 'rss_delta' in outer
+
+    report = instr.report()
+    assert report.stage.tolist() == ['inner', 'outer']
+    assert 'peak_traced' in report.columns
+
+    assert 'peak_traced' not in instrument.Instrument().report().columns
+
+
+def test_memory_after_large_stage():
+    instr = instrument.Instrument(memory=True)
+
+    try:
+        for name, size in [('large', 5 * 10 ** 7), ('small', 10 ** 6)]:
+            with instr.stage('outer'):
+                with instr.stage(name):
+                    x = bytearray(size)
+                    del x
+    finally:
+        instr.close()
+
+    large = instr.stop_events('large')[0]['peak_traced']
+    small = instr.stop_events('small')[0]['peak_traced']
+    assert large >= 5 * 10 ** 7
+    assert 10 ** 6 <= small < 2 * 10 ** 6
+
+    outer = [e['peak_traced'] for e in instr.stop_events('outer')]
+    assert outer[0] >= large
+    assert 10 ** 6 <= outer[1] < 2 * 10 ** 6
+
+
+def test_memory_external_tracing():
+    tracemalloc.start()
+    try:
+        instr = instrument.Instrument(memory=True)
+        with instr.stage('a'):
+            x = bytearray(10 ** 6)
+            del x
+        instr.close()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+    peak = instr.stop_events('a')[0]['peak_traced']
+    if hasattr(tracemalloc, 'reset_peak'):
+        assert peak >= 10 ** 6
+    else:
+        # the peak can't be reset without restarting tracing
+        assert peak is None
@@ -9,6 +9,8 @@
 
 """
 
+import itertools
+import json
 from io import StringIO
 from unittest.mock import ANY, patch
 
@@ -22,7 +24,9 @@ from pytest import approx
 import geohash
 from geopy.distance import vincenty
 
-from location import motif
+from location import counters, instrument, motif
+from location.context import ParticipantContext
+from location.test.helpers import get_stay_point_df
 
 
 def get_nearby_point(lon, lat, dist_m, bearing=0):
@@ -62,6 +66,74 @@ def test_convert_timezone():
                                             to_timezone=timezone)
     assert converted_rng.index.tz.zone == timezone
 
+    # already sorted input is not reordered
+    df = pd.DataFrame({'time': ['2011-01-01 05:00:00',
+                                '2011-01-01 06:00:00',
+                                '2011-01-01 06:00:00'],
+                       'v': [1, 2, 3]})
+    converted = motif.convert_time_zone(df, 'time', to_timezone=timezone,
+                                        time_format='%Y-%m-%d %H:%M:%S')
+    assert converted.v.tolist() == [1, 2, 3]
+    assert converted.index[0] == pd.Timestamp('2010-12-31 21:00:00',
+                                              tz=timezone)
+
+    unsorted = df.iloc[::-1]
+    converted = motif.convert_time_zone(unsorted, 'time',
+                                        to_timezone=timezone)
+    assert converted.index.is_monotonic_increasing
+
+
+def test_convert_timezone_per_row():
+    df = pd.DataFrame({'time': ['2011-06-01 05:00:00',
+                                '2011-06-01 06:00:00',
+                                '2011-06-01 07:00:00',
+                                '2011-06-01 08:00:00'],
+                       'tz': ['America/New_York', 'America/New_York',
+                              'Europe/London', None]})
+    converted = motif.convert_time_zone(df, 'time',
+                                        to_timezone='Asia/Dhaka',
+                                        timezone_column='tz')
+
+    assert converted.index.tz is None
+    expected = pd.to_datetime(['2011-06-01 01:00:00',
+                               '2011-06-01 02:00:00',
+                               '2011-06-01 08:00:00',
+                               '2011-06-01 14:00:00'])
+    assert (converted.index == expected).all()
+    assert converted.tz.tolist() == df.tz.tolist()
+
+    # same as converting everything to a single timezone
+    df['tz'] = 'America/Los_Angeles'
+    per_row = motif.convert_time_zone(df, 'time', timezone_column='tz')
+    single = motif.convert_time_zone(df, 'time',
+                                     to_timezone='America/Los_Angeles')
+    assert (per_row.index == single.index.tz_localize(None)).all()
+
+
+def test_convert_timezone_westwards():
+    # New York to Los Angeles, local times go back
+    df = pd.DataFrame({'time': ['2011-06-02 01:00:00',
+                                '2011-06-01 22:00:00',
+                                '2011-06-02 00:00:00',
+                                '2011-06-01 23:00:00'],
+                       'tz': ['America/Los_Angeles', 'America/New_York',
+                              'America/Los_Angeles', 'America/New_York'],
+                       'order': [3, 0, 2, 1]})
+    # stay durations would shrink or become negative
+    with pytest.raises(ValueError):
+        motif.convert_time_zone(df, 'time', timezone_column='tz')
+
+    # Los Angeles to New York, local times jump forward
+    df['tz'] = ['America/New_York', 'America/Los_Angeles',
+                'America/New_York', 'America/Los_Angeles']
+    converted = motif.convert_time_zone(df, 'time', timezone_column='tz')
+    assert converted.order.tolist() == [0, 1, 2, 3]
+    expected = pd.to_datetime(['2011-06-01 15:00:00',
+                               '2011-06-01 16:00:00',
+                               '2011-06-01 20:00:00',
+                               '2011-06-01 21:00:00'])
+    assert (converted.index == expected).all()
+
 
 def test_get_df_slices():
     rng = pd.date_range('1/1/2011', periods=14, freq='D')
@@ -297,6 +369,30 @@ def test_get_stay_point():
     assert stay_points == expected
 
 
+def test_get_stay_point_counters():
+    start = pd.to_datetime('2016-11-16')
+    index = pd.date_range(start, periods=4, freq='20min')
+    origin = (-76.48327, 42.44701)
+
+    with counters.counting():
+        # all points are within the threshold: 3 evaluations
+        df = pd.DataFrame({'longitude': [origin[0]] * 4,
+                           'latitude': [origin[1]] * 4}, index=index)
+        motif.get_stay_point(df)
+        assert counters.snapshot()['stay_point_distance'] == 3
+
+        # all points are far apart: one evaluation per point
+        # except for the last one
+        points = [get_nearby_point(origin[0], origin[1], 1000 * i)
+                  for i in range(4)]
+        df = pd.DataFrame({'longitude': [p.longitude for p in points],
+                           'latitude': [p.latitude for p in points]},
+                          index=index)
+        counters.reset()
+        motif.get_stay_point(df)
+        assert counters.snapshot()['stay_point_distance'] == 3
+
+
 def test_merge_neighboring_grid():
 
     #
@@ -374,6 +470,35 @@ def test_get_stay_region():
     assert np.all(actual == expected)
 
 
+def test_get_stay_regions():
+    rng = np.random.RandomState(7)
+    n = 300
+    df = pd.DataFrame({'lat': 40.7 + rng.rand(n) * 0.05,
+                       'lon': -73.9 + rng.rand(n) * 0.05,
+                       'stay_point': rng.randint(0, 60, n).astype(float)})
+    df.loc[rng.rand(n) < 0.2, 'stay_point'] = np.nan
+
+    precisions = [5, 6, 7]
+    actual = motif.get_stay_regions(df, precisions=precisions,
+                                    lat_c='lat', lon_c='lon')
+
+    assert actual.columns.tolist() == precisions
+    assert (actual.index == df.index).all()
+
+    for p in precisions:
+        expected = motif.get_stay_region(df, lat_c='lat', lon_c='lon',
+                                         precision=p)
+        assert actual[p].isnull().equals(expected.isnull())
+        assert (actual[p].dropna() == expected.dropna()).all()
+
+    # stay point centers are encoded only once
+    with counters.counting():
+        motif.get_stay_regions(df, precisions=precisions,
+                               lat_c='lat', lon_c='lon')
+        n_centers = df.stay_point.nunique()
+        assert counters.snapshot()['geohash_encode'] == n_centers
+
+
 def test_save_nodes():
     h = list(range(48))
     start = pd.to_datetime('2016-11-16', utc=True).tz_convert('US/Eastern')
@@ -429,36 +554,8 @@ def test_load_nodes():
 
 
 def test_compute_nodes():
-
-    # We need at least 8 records for generate_daily_nodes
-    # And, for each of this value, we should have a stay
-    # point. This means, we need
-    #    i) at least two subsequent within 300m of each other,
-    #   ii) the timestamp between each pair should be >= 30 mins
-    #   iii) each pair should be followed by another point which
-    #   is suffciently far enough (> 300 m)
-
-    coords = [(-76.48327, 42.44701),
-              (-76.4761338923341, 42.44583908268239)]
-    time = []
-    longitudes = []
-    latitudes = []
-    start = pd.to_datetime('2016-11-16')
-    for index, h in enumerate(range(8)):
-        s = start + pd.to_timedelta('{0}h'.format(h))
-        time.append(s)
-
-        # next time stamp should be at least 30 mins away
-        n = s + pd.to_timedelta('45min')
-        time.append(n)
-
-        c = coords[index % 2 == 0]
-        # we need two records
-        longitudes.extend([c[0]] * 2)
-        latitudes.extend([c[1]] * 2)
-
-    df = pd.DataFrame({'longitude': longitudes,
-                       'latitude': latitudes}, index=time)
+    df, start = get_stay_point_df()
+    time = df.index
 
     stay, nodes = motif.compute_nodes(df, lon_c='longitude',
                                       lat_c='latitude')
@@ -542,6 +639,149 @@ def test_compute_nodes():
     p.assert_called_once_with(ANY, 'node')
 
 
+def test_compute_nodes_instrument():
+    df, _ = get_stay_point_df()
+
+    instr = instrument.Instrument()
+    stay, nodes = motif.compute_nodes(df, instrument=instr)
+
+    stages = [e['stage'] for e in instr.stop_events()]
+    assert stages == ['prepare', 'stay_point', 'stay_region',
+                      'daily_nodes', 'compute_nodes']
+
+    e = instr.stop_events('stay_point')[0]
+    assert e['rows_in'] == len(df)
+    assert e['rows_out'] == len(df)
+
+    e = instr.stop_events('daily_nodes')[0]
+    assert e['rows_in'] == len(df)
+    assert e['rows_out'] == len(nodes)
+
+
+def test_main_instrument(tmpdir):
+    df, _ = get_stay_point_df()
+    df.index = df.index.tz_localize('UTC')
+    data_path = str(tmpdir.join('data.csv'))
+    df.to_csv(data_path, index_label='time')
+
+    config_path = str(tmpdir.join('config.json'))
+    with open(config_path, 'w') as f:
+        f.write('{"lat_c": "latitude", "lon_c": "longitude"}')
+
+    timings_path = str(tmpdir.join('timings.jsonl'))
+    metrics_path = str(tmpdir.join('location.prom'))
+    memory_path = str(tmpdir.join('memory.csv'))
+    argv = ['motif', '-g', 'node', '-f', data_path, '-c', config_path,
+            '--timings', timings_path, '--metrics', metrics_path,
+            '--memory', memory_path]
+    with counters.counting():
+        with patch('sys.argv', argv):
+            motif.main()
+
+    with open(metrics_path) as f:
+        assert 'location_stay_point_distance_total' in f.read()
+
+    with open(timings_path) as f:
+        events = [json.loads(l) for l in f]
+
+    stops = [e['stage'] for e in events if e['event'] == 'stop']
+    assert stops == ['load', 'prepare', 'stay_point', 'stay_region',
+                     'daily_nodes', 'compute_nodes']
+
+    memory = pd.read_csv(memory_path)
+    assert memory.stage.tolist() == stops
+    assert (memory.peak_traced >= 0).all()
+    assert all('peak_traced' in e for e in events if e['event'] == 'stop')
+
+
+def write_main_input(tmpdir):
+    """
+    Writes two days of data and a config for motif.main().
+    """
+
+    df, start = get_stay_point_df()
+    df.index = df.index.tz_localize('America/New_York')
+    df = df.append(df.set_index(df.index + pd.to_timedelta('1D')))
+    data_path = str(tmpdir.join('data.csv'))
+    df.to_csv(data_path, index_label='time')
+
+    config = {'lat_c': 'latitude', 'lon_c': 'longitude',
+              'motif_args': {'round_trip': False}}
+    config_path = str(tmpdir.join('config.json'))
+    with open(config_path, 'w') as f:
+        json.dump(config, f)
+
+    return df, data_path, config_path
+
+
+def test_main_motif_and_features(tmpdir):
+    df, data_path, config_path = write_main_input(tmpdir)
+    stay, nodes = motif.compute_nodes(df)
+
+    motif_path = str(tmpdir.join('motif.csv'))
+    argv = ['motif', '-g', 'motif', '-f', data_path, '-c', config_path,
+            '-o', motif_path]
+    with patch('sys.argv', argv):
+        motif.main()
+
+    actual = pd.read_csv(motif_path)
+    assert actual.columns.tolist() == ['timestamp', 'motif',
+                                       'n_nodes', 'mask']
+    assert len(actual) == 2
+    assert actual.motif.tolist() == [0, 0]
+
+    expected = motif.get_motif_key(nodes[0][1].node)
+    assert actual.n_nodes[0] == expected[0]
+    assert int(actual['mask'][0], 16) == expected[1]
+
+    features_path = str(tmpdir.join('features.csv'))
+    argv = ['motif', '-g', 'features', '-f', data_path, '-c', config_path,
+            '-o', features_path]
+    with patch('sys.argv', argv):
+        motif.main()
+
+    actual = pd.read_csv(features_path)
+    assert len(actual) == 2
+    assert (actual.num_clusters == 2).all()
+    assert (actual.num_trips == 7).all()
+
+    # output is required, in a known format
+    argv = ['motif', '-g', 'motif', '-f', data_path, '-c', config_path]
+    for output in ([], ['-o', str(tmpdir.join('motif.parq'))]):
+        with patch('sys.argv', argv + output):
+            with pytest.raises(SystemExit):
+                motif.main()
+
+    with pytest.raises(ValueError):
+        motif._write_table(actual, str(tmpdir.join('motif.txt')))
+
+
+def test_main_parquet(tmpdir):
+    pytest.importorskip('pyarrow')
+    if not hasattr(pd.DataFrame, 'to_parquet'):
+        pytest.skip('pandas has no parquet support')
+
+    _, data_path, config_path = write_main_input(tmpdir)
+
+    tables = []
+    for name in ('motif.csv', 'motif.parquet'):
+        path = str(tmpdir.join(name))
+        argv = ['motif', '-g', 'motif', '-f', data_path, '-c',
+                config_path, '-o', path]
+        with patch('sys.argv', argv):
+            motif.main()
+        tables.append(path)
+
+    expected = pd.read_csv(tables[0])
+    actual = pd.read_parquet(tables[1])
+    assert actual.columns.tolist() == expected.columns.tolist()
+    assert actual.motif.tolist() == expected.motif.tolist()
+    assert actual.n_nodes.tolist() == expected.n_nodes.tolist()
+    assert actual['mask'].tolist() == expected['mask'].tolist()
+    assert (pd.to_datetime(actual.timestamp, utc=True) ==
+            pd.to_datetime(expected.timestamp, utc=True)).all()
+
+
 def test_filter_inadequate_nodes():
     node = pd.DataFrame()
     timestamp = pd.Timestamp('2016-01-07 03:30:00-0500')
@@ -590,6 +830,27 @@ def test_insert_home_location():
     nodes = motif.insert_home_location(df, nodes, home='dr5xg57')
     assert nodes[0][1].ix[0, 'node'] == 'dr5xg57'
 
+    # without copying untouched days
+    nodes[0][1].ix[0, 'node'] = np.nan
+    untouched = node.copy()
+    untouched.ix[0, 'node'] = 'dr5xg5g'
+    nodes.append((timestamp + pd.to_timedelta('1D'), untouched))
+    expected = motif.insert_home_location(df, nodes)
+
+    actual = motif.insert_home_location(df, nodes, copy=False)
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert a[0] == e[0]
+        assert a[1].equals(e[1])
+
+    # the given nodes are not modified
+    assert pd.isnull(nodes[0][1].ix[0, 'node'])
+    assert actual[1][1] is untouched
+
+    # no home location
+    actual = motif.insert_home_location(df.iloc[40:60], nodes, copy=False)
+    assert pd.isnull(actual[0][1].ix[0, 'node'])
+
 
 def test_filter_days_without_round_trip():
     # a day without round trip
@@ -649,6 +910,155 @@ def test_filter_out_travelling_day():
     assert len(filtered_nodes) == 1
     assert filtered_nodes[0][0] == timestamp
 
+    # home location is detected once per context
+    context = ParticipantContext(df)
+    with patch.object(motif, '_home_location',
+                      wraps=motif._home_location) as p:
+        for th, expected in [(th - 100, 0), (th + 100, 1)]:
+            filtered_nodes = motif.filter_out_travelling_day(
+                None, nodes, trav_dist_th=th, context=context)
+            assert len(filtered_nodes) == expected
+
+    assert p.call_count == 1
+
+    # pruned mode
+    for t in [th - 100, th + 100, 1000, 10 ** 7]:
+        expected = motif.filter_out_travelling_day(df, nodes,
+                                                   trav_dist_th=t)
+        actual = motif.filter_out_travelling_day(df, nodes,
+                                                 trav_dist_th=t,
+                                                 pruned=True)
+        assert [x[0] for x in actual] == [x[0] for x in expected]
+
+
+def get_random_nodes(n_days=30, seed=0):
+    rs = np.random.RandomState(seed)
+    regions = ['dr5rw5u', 'dr5rw5v', 'dr5xg57', 'dr5xg5g', 'dr7', '9q8yy']
+    start = pd.Timestamp('2016-12-12 03:30:00-0500')
+
+    nodes = []
+    for i in range(n_days):
+        timestamp = start + pd.to_timedelta('{0}D'.format(i))
+        node = pd.DataFrame()
+        node['time'] = pd.date_range(timestamp, periods=48, freq='30min')
+        n = rs.choice(regions, 48, p=[.5, .1, .2, .1, .05, .05])
+        n = n.astype(object)
+        n[rs.uniform(size=48) < rs.uniform()] = np.nan
+        # at least one valid slot
+        n[rs.randint(48)] = 'dr5rw5u'
+        node['node'] = n
+        nodes.append((timestamp, node))
+
+    return nodes
+
+
+def test_get_node_matrix():
+    nodes = get_random_nodes(5)
+    nodes.append((pd.Timestamp('2017-01-01 03:30:00-0500'), np.nan))
+    timestamps, codes, regions = motif.get_node_matrix(nodes)
+
+    assert timestamps == [n[0] for n in nodes]
+    assert codes.shape == (6, 48)
+    assert np.all(codes[5] == -1)
+    for i in range(5):
+        expected = [None if pd.isnull(x) else x for x in nodes[i][1].node]
+        actual = [regions[c] if c >= 0 else None for c in codes[i]]
+        assert actual == expected
+
+    timestamps, codes, regions = motif.get_node_matrix([])
+    assert codes.shape == (0, 0)
+
+
+def test_filter_nodes():
+    nodes = get_random_nodes(60)
+    home = 'dr5rw5u'
+
+    criteria = [{}, {'valid_time_slot': 20}, {'round_trip': True},
+                {'dayofweek': [0, 6]}, {'trav_dist_th': 50000},
+                {'valid_time_slot': 10, 'round_trip': True,
+                 'dayofweek': [0, 1, 2, 3, 4], 'trav_dist_th': 10 ** 6}]
+
+    for c in criteria:
+        expected = nodes
+        if 'valid_time_slot' in c:
+            expected = motif.filter_inadequate_nodes(expected,
+                                                     c['valid_time_slot'])
+        if c.get('round_trip', False):
+            expected = motif.filter_days_without_round_trip(expected)
+        if 'dayofweek' in c:
+            expected = motif.filter_weekday(expected, c['dayofweek'])
+        if 'trav_dist_th' in c:
+            expected = motif.filter_out_travelling_day(
+                None, expected, home=home, trav_dist_th=c['trav_dist_th'])
+
+        actual = motif.filter_nodes(nodes, home=home, **c)
+        assert [x[0] for x in actual] == [x[0] for x in expected]
+        assert all(a is e for a, e in zip(actual, expected))
+
+    # days without any node are kept unless some criterion requires
+    # a node
+    empty = nodes[1][1].copy()
+    empty['node'] = np.nan
+    with_empty = nodes[:5] + [(nodes[1][0], empty)] + nodes[5:]
+
+    criteria = [{}, {'valid_time_slot': 0}, {'valid_time_slot': 1},
+                {'dayofweek': [nodes[1][0].weekday()]},
+                {'trav_dist_th': 50000}]
+    for c in criteria:
+        expected = with_empty
+        if 'valid_time_slot' in c:
+            expected = motif.filter_inadequate_nodes(expected,
+                                                     c['valid_time_slot'])
+        if 'dayofweek' in c:
+            expected = motif.filter_weekday(expected, c['dayofweek'])
+        if 'trav_dist_th' in c:
+            expected = motif.filter_out_travelling_day(
+                None, expected, home=home, trav_dist_th=c['trav_dist_th'])
+
+        actual = motif.filter_nodes(with_empty, home=home, **c)
+        assert len(actual) == len(expected)
+        assert all(a is e for a, e in zip(actual, expected))
+
+    actual = motif.filter_nodes(with_empty, round_trip=True)
+    expected = motif.filter_nodes(nodes, round_trip=True)
+    assert all(a is e for a, e in zip(actual, expected))
+    assert len(actual) == len(expected)
+
+    # home location from the location data
+    df = pd.DataFrame({'stay_region': ['dr5rw5u'] * 4},
+                      index=pd.date_range('2016-12-12', periods=4,
+                                          freq='1H'))
+    actual = motif.filter_nodes(nodes, data=df, trav_dist_th=50000)
+    expected = motif.filter_nodes(nodes, home=home, trav_dist_th=50000)
+    assert len(actual) == len(expected)
+
+
+def test_geohash_prefix_for_distance():
+    assert motif.geohash_prefix_for_distance(50000) == 5
+    assert motif.geohash_prefix_for_distance(0.01) is None
+
+    rs = np.random.RandomState(0)
+    for _ in range(200):
+        lat = rs.uniform(-80, 80)
+        lon = rs.uniform(-180, 180)
+        h = geohash.encode(lat, lon, 12)
+        for th in [100, 1000, 50000]:
+            k = motif.geohash_prefix_for_distance(th)
+            # opposite corners of the cell
+            bbox = geohash.bbox(h[:k])
+            d = vincenty((bbox['s'], bbox['w']), (bbox['n'], bbox['e'])).m
+            assert d <= th
+
+
+def test_get_far_regions():
+    home = 'dr5rw5u'
+    home_coord = geohash.decode(home)
+    regions = ['dr5rw5u', 'dr5rw5v', 'dr5rw', 'dr5xg57', 'dr7', '9q8yy']
+    for th in [10, 1000, 50000, 10 ** 6, 10 ** 8]:
+        expected = set(r for r in regions
+                       if vincenty(geohash.decode(r), home_coord).m > th)
+        assert motif.get_far_regions(regions, home, th) == expected
+
 
 def test_filter_weekday():
     # a Monday
@@ -777,6 +1187,137 @@ def test_generate_motifs():
                                            create_using=nx.MultiDiGraph())
     assert nx.is_isomorphic(motifs[0]['graph'], expected_graph3)
 
+    # test instrument parameter
+    instr = instrument.Instrument()
+    motifs = motif.generate_motifs(df, nodes, instrument=instr)
+    stages = [e['stage'] for e in instr.stop_events()]
+    assert stages == ['insert_home_location',
+                      'filter_days_without_round_trip',
+                      'generate_motifs']
+    e = instr.stop_events('generate_motifs')[0]
+    assert e['rows_in'] == len(nodes)
+    assert e['rows_out'] == len(motifs)
+
+    # test context parameter
+    context = ParticipantContext(df)
+    motifs = motif.generate_motifs(None, nodes, context=context)
+    assert len(motifs) == 1
+    assert motifs[0]['data'][0] == timestamp3
+    assert context.home == 'dr5xg5g'
+
+    # test fast parameter
+    for insert_home in [True, False]:
+        for round_trip in [True, False]:
+            expected = motif.generate_motifs(df, nodes,
+                                             insert_home=insert_home,
+                                             round_trip=round_trip)
+            actual = motif.generate_motifs(df, nodes,
+                                           insert_home=insert_home,
+                                           round_trip=round_trip,
+                                           fast=True)
+            assert len(actual) == len(expected)
+            for a, e in zip(actual, expected):
+                assert isinstance(a['graph'], motif.MotifGraph)
+                assert a['data'] == e['data']
+                assert nx.is_isomorphic(a['graph'].to_networkx(),
+                                        e['graph'])
+
+
+def test_get_motif_key():
+    assert motif.get_motif_key([]) == (0, 0)
+    assert motif.get_motif_key([np.nan, 'a', 'a']) == (1, 0)
+
+    # same graph with different labels and orders
+    k = motif.get_motif_key(['a', 'b', np.nan, 'c', 'a'])
+    assert k == motif.get_motif_key(['x', 'y', 'z', 'x', np.nan])
+    assert k != motif.get_motif_key(['a', 'c', 'b', 'c'])
+
+    # compare with isomorphism of random graphs
+    rs = np.random.RandomState(0)
+    sequences = [rs.choice(list('abcde'), rs.randint(1, 8))
+                 for _ in range(200)]
+
+    def graph(s):
+        g = nx.DiGraph()
+        g.add_nodes_from(s)
+        g.add_edges_from((x, y) for x, y in zip(s[:-1], s[1:]) if x != y)
+        return g
+
+    graphs = [graph(s) for s in sequences]
+    keys = [motif.get_motif_key(s) for s in sequences]
+    for i in range(0, len(sequences), 4):
+        for j in range(len(sequences)):
+            assert (keys[i] == keys[j]) == \
+                nx.is_isomorphic(graphs[i], graphs[j])
+
+
+def test_get_motif_key_large():
+    # a cycle has n! degree sorted orderings
+    cycle = list('abcdefghijkl') + ['a']
+    k = motif.get_motif_key(cycle)
+    assert k[0] == 12
+    assert k == motif.get_motif_key(cycle[5:] + cycle[1:6])
+    assert k != motif.get_motif_key(cycle + ['g'])
+
+    # complete graph
+    complete = list(itertools.permutations('abcdefghij', 2))
+    k = motif.get_motif_key([x for e in complete for x in e])
+    assert k == (10, sum(1 << (i * 10 + j) for i, j in
+                         itertools.permutations(range(10), 2)))
+
+    # compare with isomorphism, mostly in the refined path
+    rs = np.random.RandomState(0)
+    letters = np.array(list('abcdefghij'))
+    sequences = []
+    for _ in range(40):
+        # cycles with a few chords
+        s = rs.permutation(letters)[:rs.randint(8, 11)]
+        s = np.concatenate([s, s[:1], rs.choice(s, rs.randint(0, 3))])
+        sequences.append(s)
+        # relabelled
+        sequences.append(rs.permutation(letters)[
+            np.searchsorted(letters, s)])
+
+    with patch('location.motif._refined_canonical_form',
+               wraps=motif._refined_canonical_form) as p:
+        graphs = [motif.MotifGraph.from_sequence(s) for s in sequences]
+        keys = [g.key for g in graphs]
+    assert p.call_count > 10
+
+    for i, g in enumerate(graphs):
+        assert keys[i // 2 * 2] == keys[i // 2 * 2 + 1]
+        for j, h in enumerate(graphs):
+            assert (keys[i] == keys[j]) == \
+                nx.is_isomorphic(g.to_networkx(), h.to_networkx())
+
+
+def test_motif_graph():
+    g = motif.MotifGraph.from_sequence(['a', 'b', np.nan, 'b', 'c', 'a'])
+    assert g.number_of_nodes() == 3
+    assert g.number_of_edges() == 3
+    assert sorted(g.edges()) == [(0, 1), (1, 2), (2, 0)]
+    assert g.mask == (1 << 1) | (1 << 5) | (1 << 6)
+
+    # isomorphic graphs are equal
+    h = motif.MotifGraph.from_sequence([1, 2, 0, 1])
+    assert g == h
+    assert hash(g) == hash(h)
+    assert g.key == h.key
+    assert g.canonical().mask == g.key[1]
+    assert g.canonical() == g
+    assert g != motif.MotifGraph.from_sequence(['a', 'b', 'c'])
+    assert len({g, h}) == 1
+
+    nx_g = g.to_networkx()
+    assert nx_g.number_of_nodes() == 3
+    assert sorted(nx_g.edges()) == sorted(g.edges())
+    assert nx.is_frozen(nx_g)
+
+    empty = motif.MotifGraph.from_sequence([np.nan])
+    assert empty.n == 0
+    assert empty.edges() == []
+    assert 'n=3' in repr(g)
+
 
 def test_get_home_location():
     timestamp = pd.Timestamp('2016-01-07 03:30:00-0500')
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+    location.test.population_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Unit testing population module
+
+"""
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+
+from location import motif, population
+
+
+def get_participant(seed, n_days=20):
+    rs = np.random.RandomState(seed)
+    regions = ['dr5rw5u', 'dr5rw5v', 'dr5xg57', 'dr5xg5g']
+    start = pd.Timestamp('2016-12-12 03:30:00-0500')
+
+    nodes = []
+    for i in range(n_days):
+        timestamp = start + pd.to_timedelta('{0}D'.format(i))
+        node = pd.DataFrame()
+        node['time'] = pd.date_range(timestamp, periods=48, freq='30min')
+        # a few long stays per day
+        n = np.repeat(rs.choice(regions, 6), 8).astype(object)
+        n[rs.uniform(size=48) < 0.3] = np.nan
+        node['node'] = n
+        nodes.append((timestamp, node))
+
+    data = pd.DataFrame({'stay_region': ['dr5rw5u'] * 4},
+                        index=pd.date_range(start, periods=4, freq='1H'))
+    return data, nodes
+
+
+def get_participants(n=5):
+    return {'p{0}'.format(i): get_participant(i) for i in range(n)}
+
+
+def test_count_motifs():
+    participants = get_participants()
+    counts, motifs, assignments = population.count_motifs(
+        participants, return_assignments=True)
+
+    assert counts.columns.tolist() == ['participant', 'motif', 'count']
+    assert motifs.columns.tolist() == ['n_nodes', 'mask']
+    assert counts['count'].sum() == len(assignments)
+
+    for p, (data, nodes) in participants.items():
+        expected = motif.generate_motifs(data, nodes)
+        actual = counts.loc[counts.participant == p]
+        assert sorted(actual['count']) == \
+            sorted(len(m['data']) for m in expected)
+
+        # the same motif id for isomorphic graphs
+        for m in expected:
+            a = assignments.loc[(assignments.participant == p) &
+                                (assignments.timestamp.isin(m['data']))]
+            assert len(a.motif.unique()) == 1
+            n_nodes = motifs.loc[a.motif.iloc[0], 'n_nodes']
+            assert n_nodes == m['graph'].number_of_nodes()
+
+    # motif ids are shared across participants
+    motif_graphs = {}
+    for p, (data, nodes) in participants.items():
+        for m in motif.generate_motifs(data, nodes):
+            a = assignments.loc[(assignments.participant == p) &
+                                (assignments.timestamp == m['data'][0])]
+            motif_graphs.setdefault(a.motif.iloc[0], []).append(m['graph'])
+
+    graphs = [g[0] for g in motif_graphs.values()]
+    for i in range(len(graphs)):
+        for j in range(i + 1, len(graphs)):
+            assert not nx.is_isomorphic(graphs[i], graphs[j])
+    for g in motif_graphs.values():
+        assert all(nx.is_isomorphic(g[0], x) for x in g)
+
+
+def test_count_motifs_parallel():
+    participants = get_participants()
+    expected = population.count_motifs(participants, round_trip=False)
+    actual = population.count_motifs(participants, round_trip=False,
+                                     n_jobs=2)
+
+    assert expected[0].equals(actual[0])
+    assert expected[1].equals(actual[1])
+
+
+def test_count_motifs_empty():
+    counts, motifs = population.count_motifs({})
+    assert len(counts) == 0
+    assert len(motifs) == 0
+
+
+def test_to_sparse_matrix():
+    pytest.importorskip('scipy')
+
+    participants = get_participants(3)
+    counts, motifs = population.count_motifs(participants)
+    matrix, ids = population.to_sparse_matrix(counts)
+
+    assert matrix.shape == (3, len(motifs))
+    assert ids == ['p0', 'p1', 'p2']
+    for _, row in counts.iterrows():
+        assert matrix[ids.index(row.participant), row.motif] == row['count']
+
+
+def test_build_od_network():
+    participants = get_participants()
+    participants['empty'] = (None, [])
+
+    edges, regions = population.build_od_network(participants)
+    assert edges.columns.tolist() == ['origin', 'destination', 'weight']
+
+    expected = {}
+    for data, nodes in participants.values():
+        for _, node in nodes:
+            for e in motif.generate_graph(node.node):
+                o, d = e.split()
+                expected[(o, d)] = expected.get((o, d), 0) + 1
+
+    actual = {(regions[o], regions[d]): w
+              for o, d, w in edges.itertuples(index=False)}
+    assert actual == expected
+
+    edges, regions = population.build_od_network({})
+    assert len(edges) == 0
+
+
+def test_build_od_network_time_bucket():
+    participants = get_participants(2)
+    edges, regions = population.build_od_network(participants)
+    bucketed, bucket_regions = population.build_od_network(
+        participants, time_bucket='6H')
+
+    assert bucketed.columns.tolist() == ['origin', 'destination',
+                                         'bucket', 'weight']
+    assert list(regions) == list(bucket_regions)
+    assert bucketed.weight.sum() == edges.weight.sum()
+    assert set(bucketed.bucket) <= set(pd.to_timedelta(
+        ['0H', '6H', '12H', '18H']))
+
+    total = bucketed.groupby(['origin', 'destination']).weight.sum()
+    for o, d, w in edges.itertuples(index=False):
+        assert total[(o, d)] == w
+
+    # a single trip arriving at 04:00
+    node = pd.DataFrame({'time': pd.date_range('2016-12-12 03:30:00',
+                                               periods=3, freq='30min',
+                                               tz='America/New_York'),
+                         'node': ['a', 'b', 'b']})
+    edges, regions = population.build_od_network(
+        {'p': (None, [(node.time[0], node)])}, time_bucket='1H')
+    assert edges.bucket.tolist() == [pd.to_timedelta('4H')]
+
+
+def test_to_od_matrix():
+    pytest.importorskip('scipy')
+
+    edges, regions = population.build_od_network(get_participants(2))
+    matrix = population.to_od_matrix(edges, regions)
+
+    assert matrix.shape == (len(regions), len(regions))
+    assert matrix.sum() == edges.weight.sum()
+    for o, d, w in edges.itertuples(index=False):
+        assert matrix[o, d] == w
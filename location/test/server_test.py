@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+    location.test.server_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Unit testing server module
+
+"""
+
+import asyncio
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from location import motif, server
+from location.test.helpers import get_stay_point_df
+
+
+def get_payload():
+    df, _ = get_stay_point_df()
+    df.index = df.index.tz_localize('UTC')
+    df['time'] = df.index.strftime('%Y-%m-%d %H:%M:%S')
+
+    return {'trace': df.to_dict(orient='records'),
+            'timezone': 'UTC',
+            'config': {'motif_args': {'round_trip': False}}}
+
+
+@asyncio.coroutine
+def request(port, method, path, body=b''):
+    reader, writer = yield from asyncio.open_connection('127.0.0.1', port)
+    head = '{0} /{1} HTTP/1.1\r\nContent-Length: {2}\r\n\r\n'.format(
+        method, path, len(body))
+    writer.write(head.encode('latin-1') + body)
+
+    response = yield from reader.read()
+    writer.close()
+
+    head, _, body = response.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = dict(l.split(': ', 1) for l in lines[1:])
+
+    if headers.get('Transfer-Encoding') == 'chunked':
+        data = b''
+        while True:
+            size, _, body = body.partition(b'\r\n')
+            size = int(size, 16)
+            if size == 0:
+                break
+            data += body[:size]
+            body = body[size + 2:]
+        body = data
+
+    return status, headers, body.decode('utf-8')
+
+
+@pytest.fixture
+def running_server():
+    loop = asyncio.new_event_loop()
+    s = server.Server(n_workers=1, max_pending=2)
+    aio_server = loop.run_until_complete(s.start(port=0, loop=loop))
+    port = aio_server.sockets[0].getsockname()[1]
+
+    yield loop, s, port
+
+    loop.run_until_complete(s.close())
+    loop.close()
+
+
+def test_server(running_server):
+    loop, s, port = running_server
+    body = json.dumps(get_payload()).encode('utf-8')
+
+    status, _, text = loop.run_until_complete(
+        request(port, 'GET', 'health'))
+    assert status == 200 and text == 'ok\n'
+
+    status, headers, text = loop.run_until_complete(
+        request(port, 'POST', 'nodes', body))
+    assert status == 200
+    assert float(headers['X-Compute-Time']) > 0
+    assert float(headers['X-Queue-Time']) >= 0
+    assert 'compute;dur=' in headers['Server-Timing']
+
+    rows = [json.loads(l) for l in text.splitlines()]
+    assert len(rows) == 48
+    assert sum(r['node'] is not None for r in rows) == 16
+
+    status, _, text = loop.run_until_complete(
+        request(port, 'POST', 'motifs', body))
+    assert status == 200
+    rows = [json.loads(l) for l in text.splitlines()]
+    assert len(rows) == 1
+    assert rows[0]['n_nodes'] == 2
+
+    status, _, text = loop.run_until_complete(
+        request(port, 'POST', 'features', body))
+    assert status == 200
+    rows = [json.loads(l) for l in text.splitlines()]
+    assert rows[0]['num_clusters'] == 2
+
+
+def test_server_errors(running_server):
+    loop, s, port = running_server
+
+    status, _, _ = loop.run_until_complete(request(port, 'GET', 'unknown'))
+    assert status == 404
+
+    status, _, _ = loop.run_until_complete(request(port, 'GET', 'nodes'))
+    assert status == 405
+
+    status, _, _ = loop.run_until_complete(
+        request(port, 'POST', 'nodes', b'not json'))
+    assert status == 400
+
+    # clients can't write files
+    for key in ('node_output', 'stay_info_output', 'unknown'):
+        payload = get_payload()
+        payload['config'][key] = '/tmp/location-server-test'
+        body = json.dumps(payload).encode('utf-8')
+        status, _, text = loop.run_until_complete(
+            request(port, 'POST', 'nodes', body))
+        assert status == 400
+        assert key in text
+    assert not os.path.exists('/tmp/location-server-test')
+
+    body = json.dumps({'trace': [], 'config': []}).encode('utf-8')
+    status, _, _ = loop.run_until_complete(
+        request(port, 'POST', 'nodes', body))
+    assert status == 400
+
+    # computation errors are reported
+    body = json.dumps({'trace': [{'a': 1}]}).encode('utf-8')
+    status, _, _ = loop.run_until_complete(
+        request(port, 'POST', 'nodes', body))
+    assert status == 500
+
+    # bounded queue
+    s.pending = s.max_pending
+    body = json.dumps(get_payload()).encode('utf-8')
+    status, headers, _ = loop.run_until_complete(
+        request(port, 'POST', 'nodes', body))
+    assert status == 503
+    assert headers['Retry-After'] == '1'
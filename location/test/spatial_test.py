@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+    location.test.spatial_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Unit testing spatial module
+
+"""
+
+import geohash
+import numpy as np
+import pandas as pd
+import pytest
+from pytest import approx
+
+from location import geodesic, spatial
+
+
+def get_regions(n=200, seed=0):
+    rs = np.random.RandomState(seed)
+    lats = 42.44 + rs.uniform(-0.5, 0.5, n)
+    lons = -76.48 + rs.uniform(-0.5, 0.5, n)
+    regions = [geohash.encode(lat, lon, 7) for lat, lon in zip(lats, lons)]
+
+    # duplicates and missing values should be ignored
+    return pd.Series(regions + regions[:10] + [np.nan])
+
+
+def brute_force(index, lat, lon):
+    d = spatial._haversine(lat, lon, index.latitudes, index.longitudes)
+    return d
+
+
+def test_haversine():
+    assert spatial._haversine(0, 0, 0, 0) == 0
+    # a degree along the equator
+    d = spatial._haversine(0, 0, 0, 1)
+    assert d == approx(spatial.EARTH_RADIUS * np.pi / 180)
+
+
+def test_nearest():
+    regions = get_regions()
+    index = spatial.RegionIndex(regions)
+    assert len(index) == len(regions.dropna().unique())
+    assert index.precision == 7
+
+    rs = np.random.RandomState(1)
+    lats = 42.44 + rs.uniform(-1, 1, 100)
+    lons = -76.48 + rs.uniform(-1, 1, 100)
+    for lat, lon in zip(lats, lons):
+        d = brute_force(index, lat, lon)
+        r, dist = index.nearest(lat, lon)
+        assert dist == approx(d.min())
+        assert r == index.regions[d.argmin()]
+
+    # far away from every region
+    r, dist = index.nearest(-40, 100)
+    d = brute_force(index, -40, 100)
+    assert dist == approx(d.min())
+
+    # at the region itself
+    r, dist = index.nearest(index.latitudes[3], index.longitudes[3])
+    assert r == index.regions[3]
+    assert dist == approx(0)
+
+    assert spatial.RegionIndex([]).nearest(0, 0)[0] is None
+
+
+def test_within():
+    index = spatial.RegionIndex(get_regions())
+
+    lat, lon = 42.44, -76.48
+    for radius in [10, 1000, 5000, 50000, 10 ** 7]:
+        d = brute_force(index, lat, lon)
+        expected = sorted(d[d <= radius])
+        actual = index.within(lat, lon, radius)
+        assert [x[1] for x in actual] == approx(expected)
+
+    assert spatial.RegionIndex([]).within(0, 0, 10) == []
+
+
+def test_backend():
+    # a region just outside the 3x3 block of a fix near the equator,
+    # closer on the ellipsoid than the escape distance on the sphere
+    h, _ = spatial.cell_size(5)
+    lat_c, lon_c, d_lat, _ = geohash.decode_exactly(
+        geohash.encode(0.01, 10.01, 5))
+    lat, lon = lat_c + d_lat - 1e-7, lon_c
+    region = geohash.encode(lat_c + d_lat + h + 1e-6, lon_c, 9)
+
+    previous = geodesic.set_backend('vincenty')
+    try:
+        index = spatial.RegionIndex([region])
+        d = brute_force(index, lat, lon)[0]
+        assert d < 4880
+
+        assert index.nearest(lat, lon) == (region, approx(d))
+        assert index.within(lat, lon, 4880) == [(region, approx(d))]
+    finally:
+        geodesic.set_backend(previous)
+
+
+def test_many():
+    index = spatial.RegionIndex(get_regions())
+    lats = [42.44, 42.0, 10]
+    lons = [-76.48, -76.0, 10]
+
+    df = index.nearest_many(lats, lons)
+    assert df.columns.tolist() == ['region', 'distance']
+    for i in range(len(lats)):
+        assert (df.region[i], df.distance[i]) == index.nearest(lats[i],
+                                                               lons[i])
+
+    df = index.nearest_many(lats, lons, max_dist=100000)
+    assert pd.isnull(df.region[2])
+    assert not pd.isnull(df.region[0])
+
+    l = index.within_many(lats, lons, 2000)
+    assert l == [index.within(lat, lon, 2000)
+                 for lat, lon in zip(lats, lons)]
+
+
+def test_serialization(tmpdir):
+    index = spatial.RegionIndex(get_regions())
+    path = str(tmpdir.join('index.json'))
+    index.save(path)
+
+    loaded = spatial.RegionIndex.load(path)
+    assert loaded.regions == index.regions
+    assert loaded.precision == index.precision
+    assert loaded.nearest(42.4, -76.4) == index.nearest(42.4, -76.4)
+
+    d = spatial.RegionIndex.from_dict(index.to_dict())
+    assert d.within(42.4, -76.4, 3000) == index.within(42.4, -76.4, 3000)
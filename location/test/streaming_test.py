@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+    location.test.streaming_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Unit testing streaming module
+
+"""
+
+import geohash
+import numpy as np
+import pandas as pd
+import pytest
+from pytest import approx
+
+import location.features as lf
+from location import streaming
+
+
+def get_location_data(n=300, seed=0):
+    rs = np.random.RandomState(seed)
+    regions = np.array(['dr5rsqq', 'dr5ru6b', 'dr5rw5u', 'dr5xg57', None],
+                       dtype=object)
+    visits = np.repeat(rs.randint(0, 5, n), rs.randint(1, 6, n))[:n]
+
+    # uneven sampling, with odd nanoseconds
+    gaps = rs.randint(1, 600, n) * 10 ** 9 + rs.randint(0, 3, n)
+    time = pd.to_datetime(pd.Timestamp('2015-04-14').value + np.cumsum(gaps))
+
+    df = pd.DataFrame({'cluster': regions[visits]}, index=time)
+    coords = [geohash.decode(r) if r is not None else (np.nan, np.nan)
+              for r in df.cluster]
+    df['latitude'] = [c[0] + rs.normal(0, 0.001) for c in coords]
+    df['longitude'] = [c[1] + rs.normal(0, 0.001) for c in coords]
+    return df
+
+
+def same(actual, expected):
+    if np.isnan(expected):
+        return np.isnan(actual)
+
+    return actual == approx(expected)
+
+
+def get_chunks(df, seed=0):
+    rs = np.random.RandomState(seed)
+    # empty and single row chunks included
+    bounds = np.sort(np.concatenate([
+        rs.randint(0, len(df) + 1, 20), [1, 2, 2, len(df) - 1]]))
+    bounds = np.clip(bounds, 0, len(df))
+    bounds = np.concatenate([[0], bounds, [len(df)]])
+    return [df.iloc[s:e] for s, e in zip(bounds[:-1], bounds[1:])]
+
+
+def accumulate(acc, df, seed=0):
+    """
+    Results of updating one accumulator chunk by chunk and of
+    merging one accumulator per chunk.
+    """
+
+    chunks = get_chunks(df, seed)
+
+    updated = acc._spawn()
+    for chunk in chunks:
+        updated.update(chunk)
+
+    shards = [acc._spawn().update(chunk) for chunk in chunks]
+    merged = shards[0]
+    for shard in shards[1:]:
+        merged.merge(shard)
+
+    return updated, merged
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_accumulators(seed):
+    df = get_location_data(seed=seed)
+    day = df.iloc[:120]
+
+    for data in (df, day, df.iloc[:2], df.iloc[:1], df.iloc[:0]):
+        for acc in accumulate(streaming.NumClustersAccumulator(), data,
+                              seed):
+            assert acc.result() == lf.num_clusters(data)
+
+        expected = lf.num_trips(data)
+        for acc in accumulate(streaming.NumTripsAccumulator(), data, seed):
+            assert same(acc.result(), expected)
+
+        expected = lf.loc_var(data)
+        for acc in accumulate(streaming.LocVarAccumulator(), data, seed):
+            assert same(acc.result(), expected)
+
+        expected = lf.total_dist(data)
+        for acc in accumulate(streaming.TotalDistAccumulator(), data, seed):
+            assert acc.result() == approx(expected)
+
+        expected = lf.wait_time(data)
+        for acc in accumulate(streaming.WaitTimeAccumulator(), data, seed):
+            assert acc.result() == expected
+
+        try:
+            expected = lf.entropy(data)
+        except ValueError:
+            # no clusters
+            expected = None
+        for acc in accumulate(streaming.EntropyAccumulator(), data, seed):
+            assert acc.wait_time() == lf.wait_time(data)
+            if expected is None:
+                with pytest.raises(ValueError):
+                    acc.result()
+                continue
+
+            ent, nent = acc.result()
+            assert same(ent, expected[0])
+            assert same(nent, expected[1])
+
+        for acc in accumulate(streaming.GyrationAccumulator(), data, seed):
+            for k in (None, 1, 2, 5):
+                assert same(acc.result(k=k),
+                            lf.gyration_radius(data, k=k))
+
+
+def test_wait_time_quirks():
+    # waiting times are Timedelta.seconds, so days are dropped
+    time = pd.date_range('2017-01-01', periods=6, freq='13H')
+    df = pd.DataFrame({'cluster': ['a', 'a', 'a', 'b', np.nan, 'a']},
+                      index=time)
+
+    for acc in accumulate(streaming.WaitTimeAccumulator(), df):
+        assert acc.result() == lf.wait_time(df)
+    for acc in accumulate(streaming.EntropyAccumulator(), df):
+        assert acc.result()[0] == approx(lf.entropy(df)[0])
+
+    # no clusters
+    df['cluster'] = np.nan
+    for acc in accumulate(streaming.WaitTimeAccumulator(), df):
+        assert acc.result() == lf.wait_time(df) == ([0], {})
+
+
+def test_merge():
+    df = get_location_data()
+    acc = streaming.TotalDistAccumulator().update(df.iloc[:10])
+
+    with pytest.raises(ValueError):
+        acc.merge(streaming.TotalDistAccumulator(cluster_c='region'))
+    with pytest.raises(ValueError):
+        acc.merge(streaming.NumTripsAccumulator())
+
+    # other backends
+    acc = streaming.TotalDistAccumulator(backend='haversine').update(df)
+    assert acc.result() == approx(lf.total_dist(df, backend='haversine'))
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+    location.test.sweep_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Unit testing sweep module
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from location import counters, motif, sweep
+from location.instrument import Instrument
+
+
+def get_location_data(seed=3):
+    """
+    Generates two days of data visiting a few places.
+    """
+
+    rng = np.random.RandomState(seed)
+    places = [(42.447, -76.483), (42.446, -76.476),
+              (42.440, -76.490), (42.452, -76.470)]
+
+    lats = []
+    lons = []
+    place = 0
+    while len(lats) < 2 * 24 * 6:
+        n = rng.randint(1, 12)
+        lat, lon = places[place]
+        lats.extend(lat + rng.randn(n) * 0.0002)
+        lons.extend(lon + rng.randn(n) * 0.0002)
+        place = (place + rng.randint(1, len(places))) % len(places)
+
+    n = 2 * 24 * 6
+    time = pd.date_range('2016-11-16', periods=n, freq='10min',
+                         tz='America/New_York')
+    return pd.DataFrame({'latitude': lats[:n], 'longitude': lons[:n]},
+                        index=time)
+
+
+def assert_nodes_equal(actual, expected):
+    assert len(actual) == len(expected)
+    for (t1, n1), (t2, n2) in zip(actual, expected):
+        assert t1 == t2
+        if isinstance(n2, pd.DataFrame):
+            assert n2.equals(n1)
+        else:
+            assert np.isnan(n1) and np.isnan(n2)
+
+
+def test_sweep_nodes():
+    df = get_location_data()
+    dist_ths = [100, 300]
+    time_ths = ['10m', '30m', '60m']
+    precisions = [6, 7]
+    daily_args = {'valid_day_th': 2}
+
+    results = sweep.sweep_nodes(df, dist_ths, time_ths,
+                                precisions=precisions,
+                                daily_args=daily_args)
+    assert len(results) == len(dist_ths) * len(time_ths) * len(precisions)
+
+    for dist_th in dist_ths:
+        for time_th in time_ths:
+            for precision in precisions:
+                stay, nodes = motif.compute_nodes(
+                    df,
+                    stay_point_args={'dist_th': dist_th,
+                                     'time_th': time_th},
+                    stay_region_args={'precision': precision},
+                    daily_args=daily_args)
+
+                actual_stay, actual_nodes = results[(dist_th, time_th,
+                                                     precision)]
+                assert stay.equals(actual_stay)
+                assert_nodes_equal(actual_nodes, nodes)
+
+
+def test_sweep_nodes_shared_work():
+    df = get_location_data()
+    instrument = Instrument()
+
+    with counters.counting():
+        results = sweep.sweep_nodes(df, [300], ['10m', '10min', '60m'],
+                                    precisions=[6, 7],
+                                    instrument=instrument)
+        n_dist = counters.snapshot()['stay_point_distance']
+
+    # segmentation happens once per distance threshold
+    assert len(instrument.stop_events('segment')) == 1
+    assert n_dist < 2 * len(df)
+
+    # same stay points, same results
+    assert len(instrument.stop_events('stay_region')) == 2
+    assert len(instrument.stop_events('daily_nodes')) == 4
+    assert results[(300, '10m', 7)] is results[(300, '10min', 7)]
@@ -13,6 +13,7 @@ import numpy as np
 import pandas as pd
 
 from location import utils
+from location.context import ParticipantContext
 import pytest
 from pytest import approx
 
@@ -77,3 +78,6 @@ def test_compute_regularity():
                             'regularity']
 
     assert reg_computed2.iloc[0] == pytest.approx(1)
+
+    context = ParticipantContext(df)
+    assert reg.equals(utils.compute_regularity(df, context=context))
@@ -10,15 +10,16 @@ import pandas as pd
 import numpy as np
 import math
 from collections import Counter
-from geopy.distance import vincenty
 import geohash
 
-from location import motif
+from location import counters, epoch, geodesic, motif
 
 
 def compute_gyration(data,
                      sr_col='stay_region',
-                     k=None):
+                     k=None,
+                     context=None,
+                     backend=None):
     """
     Compute the total or k-th radius of gyration.
     This follows the work of Pappalardo et al.
@@ -40,6 +41,15 @@ def compute_gyration(data,
         k-th radius of gyration is the radius gyration compuated up to
         the k-th most frequent visited locations.
 
+    context: location.context.ParticipantContext
+        If given, stay regions are decoded through its cache.
+        Default is None.
+
+    backend: str
+        Distance backend (see `geodesic`).
+        Default is None, in this case the global
+        backend is used if set, Vincenty otherwise.
+
 
     Returns:
     --------
@@ -66,7 +76,11 @@ def compute_gyration(data,
             loc_data = loc_data.loc[loc_data[sr_col].isin(k_locations)]
 
     # compute coordinates for visited locations/stay regions
-    locs_hist_coord = [geohash.decode(x) for x in loc_data[sr_col]]
+    if context is None:
+        locs_hist_coord = [geohash.decode(x) for x in loc_data[sr_col]]
+        counters.add('geohash_decode', len(locs_hist_coord))
+    else:
+        locs_hist_coord = [context.coordinates(x) for x in loc_data[sr_col]]
     loc_data['latitude'] = [x[0] for x in locs_hist_coord]
     loc_data['longitude'] = [x[1] for x in locs_hist_coord]
 
@@ -75,16 +89,16 @@ def compute_gyration(data,
     r_cm = (r_cm['latitude'], r_cm['longitude'])
 
     # compute gyration of radius
-    temp_sum = 0
-    for _, r in loc_data.iterrows():
-        p = (r.latitude, r.longitude)
-        d = vincenty(p, r_cm).m
-        temp_sum += d ** 2
+    d = geodesic.distance(loc_data['latitude'].values,
+                          loc_data['longitude'].values,
+                          r_cm[0], r_cm[1],
+                          backend=backend, default='vincenty')
+    temp_sum = float(np.sum(d ** 2))
 
     return math.sqrt(temp_sum / len(loc_data))
 
 
-def compute_rec_ratio(data, k):
+def compute_rec_ratio(data, k, context=None):
     """
     Compute recurrent ratio.
 
@@ -97,6 +111,9 @@ def compute_rec_ratio(data, k):
     k: int
         k-th radius of gyration.
 
+    context: location.context.ParticipantContext
+        See `compute_gyration`. Default is None.
+
 
     Returns:
     --------
@@ -106,8 +123,8 @@ def compute_rec_ratio(data, k):
         If k is larger than the number of different visited
         locations, return np.nan.
     """
-    total_raidus_gyration = compute_gyration(data)
-    k_th_radius_gyration = compute_gyration(data, k=k)
+    total_raidus_gyration = compute_gyration(data, context=context)
+    k_th_radius_gyration = compute_gyration(data, k=k, context=context)
 
     # if k_th radius gyration is nan, return nan
     if np.isnan(k_th_radius_gyration):
@@ -116,7 +133,7 @@ def compute_rec_ratio(data, k):
         return k_th_radius_gyration / total_raidus_gyration
 
 
-def compute_regularity(data, sr_col='stay_region'):
+def compute_regularity(data, sr_col='stay_region', context=None):
     """
     Calculate mobility regularity R(t), which is defined as the probability of
     finding the user in her/his most visited location at hourly interval in a
@@ -132,6 +149,10 @@ def compute_regularity(data, sr_col='stay_region'):
         Column name for stay region.
         Default is 'stay_region'.
 
+    context: location.context.ParticipantContext
+        If given, its (cached) hour and day of week values are used.
+        It must be created for the same data. Default is None.
+
     Returns:
     --------
     reg: DataFrame
@@ -161,8 +182,13 @@ def compute_regularity(data, sr_col='stay_region'):
 
     # group locatino data based on hour and dayofweek
     loc_data = data.copy()
-    loc_data['hour'] = [x.hour for x in loc_data.index]
-    loc_data['dayofweek'] = [x.dayofweek for x in loc_data.index]
+    if context is None:
+        local_ns = epoch.local_epoch(loc_data.index)
+        loc_data['hour'] = epoch.hour_of_day(local_ns)
+        loc_data['dayofweek'] = epoch.day_of_week(local_ns)
+    else:
+        loc_data['hour'] = context.hours
+        loc_data['dayofweek'] = context.dayofweek
     grouped = loc_data.groupby(['dayofweek', 'hour'])
 
     # compute visited locations for each interval